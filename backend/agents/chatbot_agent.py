@@ -1,6 +1,6 @@
-import re
 from typing import Tuple, Dict, Any
 from services.customer_matching_service import CustomerMatchingService
+from services.entity_extractor import extract_entities
 from services.preapproval_service import PreApprovalService
 from services.event_bus import EventBus
 
@@ -22,49 +22,11 @@ class ChatbotAgent:
     
     def extract_amount(self, text: str) -> float:
         """Extract loan amount from user message"""
-        patterns = [
-            r'(\d+)\s*(?:lakh|lac|L)',
-            r'(\d+)\s*(?:thousand|k|K)',
-            r'₹\s*(\d+)',
-            r'(\d{4,7})',  # 4-7 digit numbers
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                amount = float(match.group(1))
-                if 'lakh' in text.lower() or 'lac' in text.lower():
-                    amount *= 100000
-                elif 'thousand' in text.lower() or 'k' in text.lower():
-                    amount *= 1000
-                return amount
-        
-        # Try to find any large number
-        numbers = re.findall(r'\d+', text)
-        for num in numbers:
-            num_val = float(num)
-            if 10000 <= num_val <= 10000000:
-                return num_val
-        
-        return None
+        return extract_entities(text).amount
     
     def extract_mobile(self, text: str) -> str:
-        """Extract mobile number from text"""
-        # Look for 10-digit numbers
-        patterns = [
-            r'(\d{10})',
-            r'(\d{5}[\s-]?\d{5})',
-            r'\+91[\s-]?(\d{10})',
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text)
-            if match:
-                mobile = match.group(1).replace(" ", "").replace("-", "")
-                if len(mobile) == 10:
-                    return mobile
-        
-        return None
+        """Extract mobile number from text (10 digits, optional +91 and separators)"""
+        return extract_entities(text).mobile
     
     def handle(self, user_msg: str, ctx: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
         """Handle initial conversation to collect user details"""
@@ -151,7 +113,8 @@ class ChatbotAgent:
         
         # Log session start event
         if ctx.get("customer_name") and ctx.get("mobile") and ctx.get("requested_amount") and not ctx.get("session_started"):
-            session_id = self.customer_matching.create_session_id()
+            # The API layer may already have opened a session under an id; keep it so loans match
+            session_id = ctx.get("session_id") or self.customer_matching.create_session_id()
             ctx["session_id"] = session_id
             
             self.event_bus.publish_event("session_started", {
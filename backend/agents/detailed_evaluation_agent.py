@@ -1,5 +1,6 @@
-import re
+import copy
 from typing import Tuple, Dict, Any
+from services.entity_extractor import extract_entities
 from services.eligibility_service import EligibilityService
 from services.kyc_document_service import KYCDocumentService
 from services.loans_service import LoansService
@@ -30,11 +31,8 @@ class DetailedEvaluationAgent:
         self.sanction_agent = sanction_agent
     
     def extract_number(self, text: str) -> float:
-        """Extract number from text"""
-        numbers = re.findall(r'\d+', text.replace(",", ""))
-        if numbers:
-            return float(numbers[0])
-        return None
+        """Extract an amount from text (e.g. ₹50,000 or 50k)"""
+        return extract_entities(text).income
     
     def handle(self, user_msg: str, ctx: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
         """Handle detailed evaluation flow"""
@@ -107,7 +105,8 @@ Please type one of the above options."""
         
         # Step 5: Get preferred tenure
         elif not ctx.get("preferred_tenure"):
-            tenure = self.extract_number(user_msg)
+            entities = extract_entities(user_msg)
+            tenure = entities.tenure_months or (entities.numbers[0] if entities.numbers else None)
             if tenure and 6 <= tenure <= 60:
                 ctx["preferred_tenure"] = int(tenure)
                 reply = f"Perfect! Preferred tenure: {int(tenure)} months\n\n" \
@@ -223,25 +222,37 @@ Please type one of the above options."""
                 
                 ctx["loan_id"] = loan["loan_id"]
                 
-                # Generate sanction letter
-                pdf_path = self.sanction_agent.generate_sanction_letter_evaluated(
-                    ctx, loan, evaluation
-                )
-                
-                self.loans.update_sanction_letter_path(ctx.get("session_id"), pdf_path)
-                
+                session_id = ctx.get("session_id")
+                event_key = ctx.get("customer_id", ctx.get("session_id"))
+
                 # Log approval
                 self.event_bus.publish_event("loan_approved_after_evaluation", {
                     "loan_id": loan["loan_id"],
                     "approved_amount": ctx.get("requested_amount"),
                     "emi": evaluation.get("emi")
-                }, ctx.get("customer_id", ctx.get("session_id")))
+                }, event_key)
                 
-                self.event_bus.publish_event("sanction_letter_generated", {
-                    "loan_id": loan["loan_id"],
-                    "pdf_path": pdf_path,
-                    "approval_type": "evaluated"
-                }, ctx.get("customer_id", ctx.get("session_id")))
+                # Generate sanction letter (in the background when a job queue is configured)
+                snapshot = copy.deepcopy(ctx)
+
+                def on_letter_ready(pdf_path: str):
+                    self.loans.update_sanction_letter_path(session_id, pdf_path)
+                    self.event_bus.publish_event("sanction_letter_generated", {
+                        "loan_id": loan["loan_id"],
+                        "pdf_path": pdf_path,
+                        "approval_type": "evaluated"
+                    }, event_key)
+
+                letter = self.sanction_agent.queue_letter(
+                    "evaluated",
+                    lambda: self.sanction_agent.generate_sanction_letter_evaluated(snapshot, loan, evaluation),
+                    on_letter_ready
+                )
+                ctx["sanction_letter_id"] = letter["letter_id"]
+                if letter["job_id"]:
+                    letter_line = f"Your sanction letter is being generated: `/sanctions/{letter['letter_id']}`"
+                else:
+                    letter_line = f"Your sanction letter has been generated: `/sanctions/{letter['letter_id']}`"
                 
                 ctx["stage"] = "END"
                 reply = f"""✅ **Good news!** Based on your details and documents, your loan is **approved**! 🎉
@@ -255,7 +266,7 @@ Please type one of the above options."""
 - Approval Type: After Evaluation
 
 **Sanction Letter:**
-Your sanction letter has been generated: `{pdf_path}`
+{letter_line}
 
 Thank you for choosing us! 🚀"""
             
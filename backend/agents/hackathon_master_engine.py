@@ -1,7 +1,8 @@
-from typing import Tuple, Dict, Any
+from typing import Tuple, Dict, Any, Optional
 from agents.chatbot_agent import ChatbotAgent
 from agents.preapproved_instant_agent import PreApprovedInstantAgent
 from agents.detailed_evaluation_agent import DetailedEvaluationAgent
+from agents.stage_machine import Emit, Stage, StageMachine
 
 class HackathonMasterEngine:
     """
@@ -18,41 +19,28 @@ class HackathonMasterEngine:
         self.chatbot_agent = chatbot_agent
         self.preapproved_agent = preapproved_agent
         self.detailed_eval_agent = detailed_eval_agent
+        # Each turn runs a single stage; the agents set the next one
+        evaluation = Stage(self.detailed_eval_agent.handle, frozenset({"DETAILED_EVALUATION", "SUGGEST_AMOUNT", "END"}))
+        self.machine = StageMachine("hackathon", {
+            # Collect basic information (name, mobile, city, loan amount), then pick a path
+            "INITIAL": Stage(self.chatbot_agent.handle, frozenset({"PREAPPROVED_CHECK", "DETAILED_EVALUATION"})),
+            # Pre-approved path - instant approval
+            "PREAPPROVED_CHECK": Stage(self.preapproved_agent.handle, frozenset({"END"})),
+            # Detailed evaluation path - collect more info, upload docs, evaluate
+            "DETAILED_EVALUATION": evaluation,
+            "SUGGEST_AMOUNT": evaluation,
+            "END": Stage(self._end),
+        }, initial="INITIAL")
     
-    def handle(self, user_msg: str, ctx: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
-        """Orchestrate the hackathon loan journey workflow"""
+    def handle(self, user_msg: str, ctx: Dict[str, Any],
+               on_reply: Optional[Emit] = None) -> Tuple[str, Dict[str, Any]]:
+        """Orchestrate the hackathon loan journey workflow; on_reply gets the reply segments as they are ready"""
         # Initialize context if needed
         if not ctx:
             ctx = {}
-        
-        # Set default stage if not present
-        stage = ctx.get("stage", "INITIAL")
-        
-        reply = ""
-        
-        # Route to appropriate agent based on stage
-        if stage == "INITIAL":
-            # Collect basic information (name, mobile, city, loan amount)
-            reply, ctx = self.chatbot_agent.handle(user_msg, ctx)
-            
-            # After collecting all info, chatbot agent sets stage to PREAPPROVED_CHECK or DETAILED_EVALUATION
-        
-        elif stage == "PREAPPROVED_CHECK":
-            # Pre-approved path - instant approval
-            reply, ctx = self.preapproved_agent.handle(user_msg, ctx)
-        
-        elif stage == "DETAILED_EVALUATION" or stage == "SUGGEST_AMOUNT":
-            # Detailed evaluation path - collect more info, upload docs, evaluate
-            reply, ctx = self.detailed_eval_agent.handle(user_msg, ctx)
-        
-        elif stage == "END":
-            if not reply:
-                reply = "Thank you for using our loan application service! If you need any assistance, feel free to reach out. 😊"
-        
-        else:
-            # Unknown stage - default to initial
-            ctx["stage"] = "INITIAL"
-            reply, ctx = self.chatbot_agent.handle(user_msg, ctx)
-        
-        return reply, ctx
+        # Unknown stages restart at INITIAL
+        return self.machine.run(user_msg, ctx, on_reply)
 
+    @staticmethod
+    def _end(user_msg: str, ctx: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        return "Thank you for using our loan application service! If you need any assistance, feel free to reach out. 😊", ctx
@@ -1,3 +1,4 @@
+import copy
 from typing import Tuple, Dict, Any
 from services.preapproval_service import PreApprovalService
 from services.loans_service import LoansService
@@ -76,20 +77,38 @@ This is an **instant approval** – no documents or waiting required! ⚡
                     "interest_rate": ctx.get("preapproved_interest")
                 }, ctx.get("customer_id", ctx.get("session_id")))
                 
-                # Generate sanction letter
-                pdf_path = self.sanction_agent.generate_sanction_letter_instant(
-                    ctx, loan
+                # Generate sanction letter (in the background when a job queue is configured)
+                snapshot = copy.deepcopy(ctx)
+                session_id = ctx.get("session_id")
+                event_key = ctx.get("customer_id", ctx.get("session_id"))
+
+                def on_letter_ready(pdf_path: str):
+                    # Update loan with PDF path
+                    self.loans.update_sanction_letter_path(session_id, pdf_path)
+                    
+                    # Log sanction letter generation
+                    self.event_bus.publish_event("sanction_letter_generated", {
+                        "loan_id": loan["loan_id"],
+                        "pdf_path": pdf_path,
+                        "approval_type": "preapproved_instant"
+                    }, event_key)
+
+                letter = self.sanction_agent.queue_letter(
+                    "instant",
+                    lambda: self.sanction_agent.generate_sanction_letter_instant(snapshot, loan),
+                    on_letter_ready
                 )
-                
-                # Update loan with PDF path
-                self.loans.update_sanction_letter_path(ctx.get("session_id"), pdf_path)
-                
-                # Log sanction letter generation
-                self.event_bus.publish_event("sanction_letter_generated", {
-                    "loan_id": loan["loan_id"],
-                    "pdf_path": pdf_path,
-                    "approval_type": "preapproved_instant"
-                }, ctx.get("customer_id", ctx.get("session_id")))
+                ctx["sanction_letter_id"] = letter["letter_id"]
+                if letter["job_id"]:
+                    letter_line = (
+                        "Your sanction letter is being generated and will be available shortly at:\n"
+                        f"`/sanctions/{letter['letter_id']}`"
+                    )
+                else:
+                    letter_line = (
+                        "Your sanction letter has been generated and is available at:\n"
+                        f"`/sanctions/{letter['letter_id']}`"
+                    )
                 
                 ctx["stage"] = "END"
                 reply = f"""✅ **Your loan has been approved instantly!** 🎊
@@ -101,8 +120,7 @@ This is an **instant approval** – no documents or waiting required! ⚡
 - Approval Type: Instant Pre-Approved
 
 **Sanction Letter:**
-Your sanction letter has been generated and saved at:
-`{pdf_path}`
+{letter_line}
 
 Thank you for choosing us! Your loan is ready. 🚀"""
             
@@ -1,115 +1,41 @@
-import re
-import os
-import json
-from typing import Tuple, Dict, Any
+from typing import Tuple, Dict, Any, Optional
 from services.offer_mart_service import OfferMartService
 from services.event_bus import EventBus
+from services.faq_service import FAQService
+from services.entity_extractor import extract_entities
 
 class SalesAgent:
-    def __init__(self, offer_service: OfferMartService, event_bus: EventBus):
+    def __init__(self, offer_service: OfferMartService, event_bus: EventBus,
+                 faq_service: Optional[FAQService] = None):
         self.offer_service = offer_service
         self.event_bus = event_bus
-        # Load FAQs once
-        try:
-            data_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
-            faq_path = os.path.join(data_dir, 'faqs.json')
-            if os.path.exists(faq_path):
-                with open(faq_path, 'r', encoding='utf-8') as f:
-                    self.faqs = json.load(f)
-            else:
-                self.faqs = []
-        except Exception:
-            self.faqs = []
+        # FAQ index shared with the verification agent
+        self.faq_service = faq_service or FAQService()
     
     def extract_amount(self, text: str) -> float:
-        """Extract loan amount from user message"""
-        # Look for numbers followed by common loan amount keywords
-        patterns = [
-            r'(\d+)\s*(?:lakh|lac|L)',
-            r'(\d+)\s*(?:thousand|k|K)',
-            r'₹\s*(\d+)',
-            r'(\d{4,7})',  # 4-7 digit numbers (likely amounts)
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                amount = float(match.group(1))
-                # Convert lakh to actual amount
-                if 'lakh' in text.lower() or 'lac' in text.lower():
-                    amount *= 100000
-                elif 'thousand' in text.lower() or 'k' in text.lower():
-                    amount *= 1000
-                return amount
-        
-        # Try to find any large number
-        numbers = re.findall(r'\d+', text)
-        for num in numbers:
-            num_val = float(num)
-            if 10000 <= num_val <= 10000000:  # Reasonable loan amount range
-                return num_val
-        
-        return None
+        """Extract loan amount from user message (lakh/crore/thousand multipliers, ₹ amounts, plain figures)"""
+        return extract_entities(text).amount
     
     def extract_tenure(self, text: str) -> int:
-        """Extract loan tenure in months from user message"""
-        # Look for tenure mentions
-        patterns = [
-            r'(\d+)\s*(?:year|years|yr|yrs)',
-            r'(\d+)\s*(?:month|months|mon)',
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                value = int(match.group(1))
-                if 'year' in text.lower() or 'yr' in text.lower():
-                    return value * 12
-                elif 'month' in text.lower() or 'mon' in text.lower():
-                    return value
-        
-        # Look for standalone numbers that might be months
-        numbers = re.findall(r'\b(\d+)\b', text)
-        for num in numbers:
-            num_val = int(num)
-            if num_val in [12, 24, 36, 48, 60]:  # Common tenure options
-                return num_val
-        
-        return None
+        """Extract loan tenure in months from user message ("3 years", "36 months" or a standard tenure)"""
+        return extract_entities(text).tenure_months
     
+    def answer_faq(self, text: str) -> Optional[str]:
+        """Best FAQ answer for the message, if it looks like a Help question"""
+        text = text.strip('?!. ')
+        answered_text = self.faq_service.answer(text)
+        # Heuristic for EMI if no direct match
+        if not answered_text and ("emi" in text or "installment" in text):
+            answered_text = self.faq_service.answer_mentioning("emi")
+        return answered_text
+
     def handle(self, user_msg: str, ctx: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
         """Handle sales agent logic"""
         reply = ""
         user_lower = (user_msg or '').strip().lower()
 
         # Early: answer FAQs (Help) without changing flow
-        answered_text = None
-        try:
-            text = user_lower.strip('?!. ')
-            if getattr(self, 'faqs', None):
-                best_score = 0
-                best_answer = None
-                for item in self.faqs:
-                    q = (item.get('q') or '').lower()
-                    a = item.get('a') or ''
-                    if not q:
-                        continue
-                    import re as _re
-                    keywords = [w for w in _re.findall(r"[a-zA-Z]+", q) if len(w) > 3]
-                    score = sum(1 for kw in keywords if kw in text)
-                    if score > best_score and score >= 1:
-                        best_score = score
-                        best_answer = a
-                if best_answer:
-                    answered_text = best_answer
-            # Heuristic for EMI if no direct match
-            if not answered_text and ("emi" in text or "installment" in text):
-                for item in (self.faqs or []):
-                    if 'emi' in (item.get('q') or '').lower():
-                        answered_text = item.get('a') or None
-                        break
-        except Exception:
-            answered_text = None
+        answered_text = self.answer_faq(user_lower)
 
         if answered_text:
             # Append a next-step hint based on state
@@ -394,32 +320,7 @@ class SalesAgent:
                 )
             else:
                 # Try to answer a FAQ if the user asked a question
-                answered_text = None
-                try:
-                    text = user_msg_lower.strip('?!. ')
-                    if self.faqs:
-                        best_score = 0
-                        best_answer = None
-                        for item in self.faqs:
-                            q = (item.get('q') or '').lower()
-                            a = item.get('a') or ''
-                            if not q:
-                                continue
-                            keywords = [w for w in re.findall(r"[a-zA-Z]+", q) if len(w) > 3]
-                            score = sum(1 for kw in keywords if kw in text)
-                            if score > best_score and score >= 1:
-                                best_score = score
-                                best_answer = a
-                        if best_answer:
-                            answered_text = best_answer
-                        # Heuristic for EMI questions
-                        if not answered_text and ("emi" in text or "installment" in text):
-                            for item in self.faqs:
-                                if 'emi' in (item.get('q') or '').lower():
-                                    answered_text = item.get('a') or None
-                                    break
-                except Exception:
-                    answered_text = None
+                answered_text = self.answer_faq(user_msg_lower)
 
                 if answered_text:
                     reply = answered_text + "\n\nIf everything looks good, please type **`yes`** to proceed."
@@ -0,0 +1,79 @@
+import time
+from typing import Any, Callable, Dict, FrozenSet, List, NamedTuple, Optional, Tuple
+
+from services.metrics import MetricsRegistry, registry as default_registry
+
+Handler = Callable[[str, Dict[str, Any]], Tuple[str, Dict[str, Any]]]
+Router = Callable[[Dict[str, Any]], Optional[str]]
+# Receives each reply segment as soon as the stage that produced it returns
+Emit = Callable[[str], None]
+
+# Marks a break between chat bubbles inside one agent reply (the frontend splits on it too)
+SEGMENT_SEPARATOR = "||SPLIT||"
+
+
+def split_segments(reply: str) -> List[str]:
+    """The bubbles of one reply, in order"""
+    return [part.strip() for part in reply.split(SEGMENT_SEPARATOR) if part.strip()]
+
+
+class Stage(NamedTuple):
+    """One row of a stage table"""
+    handler: Handler
+    # Stages the handler may move ctx["stage"] to
+    transitions: FrozenSet[str] = frozenset()
+    # Stage to continue into in the same turn, decided from the handler's ctx
+    then: Optional[Router] = None
+
+
+class StageMachine:
+    """
+    Runs a turn through a declarative stage table.
+
+    The turn starts at ctx["stage"] and follows each stage's `then` router; once
+    the chain stops, the optional `guard` may name one more stage to run (e.g. a
+    step that was skipped). A stage handler runs at most once per turn, replies are
+    joined in order, and each stage's wall time is recorded as
+    stage.<name>.<STAGE>_ms. With on_reply, each stage's reply segments are also
+    handed over as soon as that stage returns, for clients that stream the turn.
+    """
+
+    def __init__(self, name: str, stages: Dict[str, Stage], initial: str,
+                 guard: Optional[Router] = None, metrics: Optional[MetricsRegistry] = None):
+        self.name = name
+        self.stages = stages
+        self.initial = initial
+        self.guard = guard
+        self.metrics = metrics or default_registry
+
+    def run(self, user_msg: str, ctx: Dict[str, Any],
+            on_reply: Optional[Emit] = None) -> Tuple[str, Dict[str, Any]]:
+        turn_started = time.perf_counter()
+        stage = ctx.get("stage", self.initial)
+        if stage not in self.stages:
+            # Unknown stage: start over
+            stage = ctx["stage"] = self.initial
+        replies = []
+        visited = set()
+        while stage is not None and stage not in visited:
+            visited.add(stage)
+            spec = self.stages[stage]
+            # Chained stages may start with ctx["stage"] still naming the previous one
+            entry_stage = ctx.get("stage", stage)
+            started = time.perf_counter()
+            reply, ctx = spec.handler(user_msg, ctx)
+            self.metrics.observe(f"stage.{self.name}.{stage}_ms", (time.perf_counter() - started) * 1000.0)
+            if reply:
+                replies.append(reply)
+                if on_reply:
+                    for segment in split_segments(reply):
+                        on_reply(segment)
+            new_stage = ctx.get("stage", stage)
+            if new_stage not in (entry_stage, stage) and new_stage not in spec.transitions:
+                self.metrics.incr(f"stage.{self.name}.unexpected_transition")
+                print(f"[StageMachine:{self.name}] Unexpected transition {stage} -> {new_stage}")
+            stage = spec.then(ctx) if spec.then else None
+            if stage is None and self.guard:
+                stage = self.guard(ctx)
+        self.metrics.observe(f"stage.{self.name}.turn_ms", (time.perf_counter() - turn_started) * 1000.0)
+        return "\n\n".join(replies), ctx
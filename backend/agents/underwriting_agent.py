@@ -1,7 +1,20 @@
+import hashlib
+import json
 import math
 from typing import Tuple, Dict, Any
 from services.credit_bureau_service import CreditBureauService
 from services.event_bus import EventBus
+from services.lru_cache import LRUCache
+
+# Policy thresholds
+UNDERWRITING_POLICY = {
+    "min_score_auto_approve": 725,
+    "min_score_refer": 650,
+    "max_foir_auto_approve": 0.5,
+    "max_foir_refer": 0.6,
+}
+# Part of every decision fingerprint, so editing a threshold invalidates cached decisions
+POLICY_VERSION = hashlib.sha1(json.dumps(UNDERWRITING_POLICY, sort_keys=True).encode()).hexdigest()[:12]
 
 def calculate_emi(principal: float, annual_rate: float, months: int) -> float:
     """Calculate EMI using standard formula"""
@@ -16,9 +29,16 @@ def calculate_emi(principal: float, annual_rate: float, months: int) -> float:
     return round(emi, 2)
 
 class UnderwritingAgent:
-    def __init__(self, credit_service: CreditBureauService, event_bus: EventBus):
+    def __init__(self, credit_service: CreditBureauService, event_bus: EventBus, cache_size: int = 1024):
         self.credit_service = credit_service
         self.event_bus = event_bus
+        # Decisions keyed by input fingerprint; repeated or retried turns reuse them
+        self.decision_cache = LRUCache(cache_size)
+
+    def _fingerprint(self, customer_id: str, loan_amount: float, tenure: int, interest_rate: float,
+                     credit_score: int, monthly_income: float, existing_emi: float) -> Tuple:
+        return (customer_id, loan_amount, tenure, interest_rate, credit_score,
+                monthly_income, existing_emi, POLICY_VERSION)
     
     def handle(self, user_msg: str, ctx: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
         """Handle underwriting agent logic"""
@@ -38,24 +58,32 @@ class UnderwritingAgent:
         monthly_income = customer_data.get("monthly_income", 0)
         existing_emi = customer_data.get("existing_emi", 0)
         
-        # Step 3: Calculate EMI and FOIR
         loan_amount = ctx.get("loan_amount_requested", 0)
         tenure = ctx.get("loan_tenure_requested", 0)
         offer = ctx.get("chosen_offer", {})
         interest_rate = offer.get("base_interest", 0)
+        credit_score = ctx.get("credit_score", 0)
+
+        # Same inputs as an earlier turn: reuse that decision
+        fingerprint = self._fingerprint(ctx["customer_id"], loan_amount, tenure, interest_rate,
+                                        credit_score, monthly_income, existing_emi)
+        cached = self.decision_cache.get(fingerprint)
+        if cached is not None:
+            ctx["decision"] = cached["decision"]
+            ctx["underwriting_result"] = dict(cached["underwriting_result"])
+            self.event_bus.publish_event("UNDERWRITING_DECISION", ctx.copy(), ctx["customer_id"])
+            return cached["reply"], ctx
         
+        # Step 3: Calculate EMI and FOIR
         emi = calculate_emi(loan_amount, interest_rate, tenure)
         total_obligation = existing_emi + emi
         foir = total_obligation / monthly_income if monthly_income > 0 else 1.0
         
         # Step 4: Apply underwriting rules
-        credit_score = ctx.get("credit_score", 0)
-        
-        # Policy thresholds
-        min_score_auto_approve = 725
-        min_score_refer = 650
-        max_foir_auto_approve = 0.5
-        max_foir_refer = 0.6
+        min_score_auto_approve = UNDERWRITING_POLICY["min_score_auto_approve"]
+        min_score_refer = UNDERWRITING_POLICY["min_score_refer"]
+        max_foir_auto_approve = UNDERWRITING_POLICY["max_foir_auto_approve"]
+        max_foir_refer = UNDERWRITING_POLICY["max_foir_refer"]
         
         decision = None
         reason = ""
@@ -131,6 +159,12 @@ Unfortunately, your loan application has been rejected based on our policy rules
 
 Please contact our support team for more information or to discuss alternative options."""
         
+        self.decision_cache.put(fingerprint, {
+            "decision": decision,
+            "underwriting_result": dict(ctx["underwriting_result"]),
+            "reply": reply,
+        })
+        
         # Publish event
         self.event_bus.publish_event("UNDERWRITING_DECISION", ctx.copy(), ctx["customer_id"])
         
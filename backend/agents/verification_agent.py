@@ -2,52 +2,27 @@ from typing import Tuple, Dict, Any
 from services.crm_service import CRMService
 from services.file_service import FileService
 from services.event_bus import EventBus
-import os, json, re
+from services.faq_service import FAQService
+from typing import Optional
+import re
 
 class VerificationAgent:
-    def __init__(self, crm_service: CRMService, file_service: FileService, event_bus: EventBus):
+    def __init__(self, crm_service: CRMService, file_service: FileService, event_bus: EventBus,
+                 faq_service: Optional[FAQService] = None):
         self.crm_service = crm_service
         self.file_service = file_service
         self.event_bus = event_bus
-        # Load FAQs once (shared knowledge for answering Help questions)
-        try:
-            data_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
-            faq_path = os.path.join(data_dir, 'faqs.json')
-            if os.path.exists(faq_path):
-                with open(faq_path, 'r', encoding='utf-8') as f:
-                    self.faqs = json.load(f)
-            else:
-                self.faqs = []
-        except Exception:
-            self.faqs = []
+        # FAQ index shared with the sales agent (knowledge for answering Help questions)
+        self.faq_service = faq_service or FAQService()
 
     def answer_help(self, user_msg: str, ctx: Dict[str, Any]) -> str | None:
         try:
             user_lower = (user_msg or '').strip().lower()
             text = user_lower.strip('?!. ')
-            answered_text = None
-            if self.faqs:
-                best_score = 0
-                best_answer = None
-                for item in self.faqs:
-                    q = (item.get('q') or '').lower()
-                    a = item.get('a') or ''
-                    if not q:
-                        continue
-                    import re as _re
-                    keywords = [w for w in _re.findall(r"[a-zA-Z]+", q) if len(w) > 3]
-                    score = sum(1 for kw in keywords if kw in text)
-                    if score > best_score and score >= 1:
-                        best_score = score
-                        best_answer = a
-                if best_answer:
-                    answered_text = best_answer
+            answered_text = self.faq_service.answer(text)
             if not answered_text and ("emi" in text or "installment" in text):
                 # Try FAQ first
-                for item in self.faqs:
-                    if 'emi' in (item.get('q') or '').lower():
-                        answered_text = item.get('a') or None
-                        break
+                answered_text = self.faq_service.answer_mentioning("emi")
                 # Fallback: compute EMI explanation from context
                 if not answered_text:
                     try:
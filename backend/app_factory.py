@@ -0,0 +1,62 @@
+"""
+One app serving both chat flows:
+
+    uvicorn app_factory:create_app --factory --port 8000
+    python serve.py app_factory:create_app --factory --workers 4
+
+The TITAN flow (main.py) is mounted under /titan and the hackathon flow
+(main_hackathon.py) under /hackathon, e.g. POST /hackathon/chat. Both take their
+services from the shared container, so the event bus, render workers, sanction
+job queue and reference data exist once per process rather than once per app.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi import FastAPI
+
+from container import container
+import main
+import main_hackathon
+
+# URL prefix -> app mounted there
+MOUNTS = {
+    "/titan": main.app,
+    "/hackathon": main_hackathon.app,
+}
+
+
+def create_app() -> FastAPI:
+    """Both flows in one app; services are built at startup, in the serving process"""
+    app = FastAPI(title="TITAN NBFC Loan Assistants API")
+    for prefix, mounted in MOUNTS.items():
+        app.mount(prefix, mounted)
+
+    @app.get("/")
+    def root():
+        return {
+            "message": "TITAN NBFC Loan Assistants API",
+            "status": "running",
+            "apps": {prefix: mounted.title for prefix, mounted in MOUNTS.items()},
+            "services": container.built(),
+        }
+
+    # Mounted apps don't get startup/shutdown events of their own, so run them here for both
+    @app.on_event("startup")
+    def build_services():
+        container.master_engine
+        container.hackathon_engine
+        container.session_store("titan")
+        container.session_store("hackathon")
+
+    @app.on_event("shutdown")
+    def stop_services():
+        container.shutdown()
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(create_app(), host="0.0.0.0", port=8000)
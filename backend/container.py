@@ -0,0 +1,215 @@
+import threading
+from typing import Any, Callable, Dict, List, TypeVar
+
+from services.offer_mart_service import OfferMartService
+from services.crm_service import CRMService
+from services.credit_bureau_service import CreditBureauService
+from services.customer_matching_service import CustomerMatchingService
+from services.preapproval_service import PreApprovalService
+from services.preapproval_refresh_service import PreApprovalRefreshService
+from services.sanction_regeneration_service import SanctionRegenerationService
+from services.eligibility_service import EligibilityService
+from services.kyc_document_service import KYCDocumentService
+from services.loans_service import LoansService
+from services.file_service import FileService
+from services.event_bus import EventBus
+from services.llm_service import LLMService
+from services.otp_service import OTPService
+from services.faq_service import FAQService
+from services.sanction_job_service import SanctionJobQueue
+from services.pdf_render_pool import PdfRenderPool
+from services.sanction_store import SanctionStore
+from services.session_store import SessionStore, create_session_store
+from services.session_locks import SessionLocks
+from services.idempotency import IdempotencyCache
+from services.executors import executors
+from agents.sales_agent import SalesAgent
+from agents.verification_agent import VerificationAgent
+from agents.underwriting_agent import UnderwritingAgent
+from agents.sanction_agent import SanctionAgent
+from agents.master_engine import MasterEngine
+from agents.chatbot_agent import ChatbotAgent
+from agents.preapproved_instant_agent import PreApprovedInstantAgent
+from agents.detailed_evaluation_agent import DetailedEvaluationAgent
+from agents.hackathon_master_engine import HackathonMasterEngine
+
+T = TypeVar("T")
+
+
+class ServiceContainer:
+    """
+    The services and agents behind both chat flows, each built on first use and
+    then shared: a process serving both engines has one event bus, render pool,
+    sanction job queue and letter store, not one per app.
+
+    Nothing is built at import, so a pre-fork parent (serve.py) can import the
+    apps without starting threads and worker processes that don't survive a fork.
+    """
+
+    def __init__(self):
+        self._services: Dict[str, Any] = {}
+        # Reentrant: building an agent builds the services it depends on
+        self._lock = threading.RLock()
+
+    def _provide(self, name: str, build: Callable[[], T]) -> T:
+        service = self._services.get(name)
+        if service is None:
+            with self._lock:
+                service = self._services.get(name)
+                if service is None:
+                    service = build()
+                    self._services[name] = service
+        return service
+
+    # Shared by both flows
+
+    @property
+    def file_service(self) -> FileService:
+        return self._provide("file_service", FileService)
+
+    @property
+    def event_bus(self) -> EventBus:
+        return self._provide("event_bus", lambda: EventBus(writer=executors.get("disk")))
+
+    @property
+    def render_pool(self) -> PdfRenderPool:
+        return self._provide("render_pool", PdfRenderPool)
+
+    @property
+    def sanction_jobs(self) -> SanctionJobQueue:
+        # Start render workers before the job queue threads so they fork from a quiet process
+        self.render_pool
+        return self._provide("sanction_jobs", SanctionJobQueue)
+
+    @property
+    def sanction_store(self) -> SanctionStore:
+        return self._provide("sanction_store", SanctionStore)
+
+    @property
+    def sanction_agent(self) -> SanctionAgent:
+        return self._provide("sanction_agent", lambda: SanctionAgent(
+            self.event_bus, self.sanction_jobs, self.render_pool, self.sanction_store))
+
+    # TITAN flow (main.py)
+
+    @property
+    def offer_service(self) -> OfferMartService:
+        return self._provide("offer_service", OfferMartService)
+
+    @property
+    def crm_service(self) -> CRMService:
+        return self._provide("crm_service", CRMService)
+
+    @property
+    def credit_service(self) -> CreditBureauService:
+        return self._provide("credit_service", lambda: CreditBureauService(self.crm_service))
+
+    @property
+    def llm_service(self) -> LLMService:
+        return self._provide("llm_service", LLMService)
+
+    @property
+    def otp_service(self) -> OTPService:
+        return self._provide("otp_service", OTPService)
+
+    @property
+    def faq_service(self) -> FAQService:
+        return self._provide("faq_service", FAQService)
+
+    @property
+    def sales_agent(self) -> SalesAgent:
+        return self._provide("sales_agent", lambda: SalesAgent(self.offer_service, self.event_bus, self.faq_service))
+
+    @property
+    def verification_agent(self) -> VerificationAgent:
+        return self._provide("verification_agent", lambda: VerificationAgent(
+            self.crm_service, self.file_service, self.event_bus, self.faq_service))
+
+    @property
+    def underwriting_agent(self) -> UnderwritingAgent:
+        return self._provide("underwriting_agent", lambda: UnderwritingAgent(self.credit_service, self.event_bus))
+
+    @property
+    def master_engine(self) -> MasterEngine:
+        return self._provide("master_engine", lambda: MasterEngine(
+            self.sales_agent, self.verification_agent, self.underwriting_agent, self.sanction_agent))
+
+    # Hackathon flow (main_hackathon.py)
+
+    @property
+    def customer_matching(self) -> CustomerMatchingService:
+        return self._provide("customer_matching", CustomerMatchingService)
+
+    @property
+    def preapproval_service(self) -> PreApprovalService:
+        return self._provide("preapproval_service", PreApprovalService)
+
+    @property
+    def eligibility_service(self) -> EligibilityService:
+        return self._provide("eligibility_service", EligibilityService)
+
+    @property
+    def kyc_service(self) -> KYCDocumentService:
+        return self._provide("kyc_service", KYCDocumentService)
+
+    @property
+    def loans_service(self) -> LoansService:
+        return self._provide("loans_service", LoansService)
+
+    @property
+    def preapproval_refresh(self) -> PreApprovalRefreshService:
+        return self._provide("preapproval_refresh", lambda: PreApprovalRefreshService(self.eligibility_service))
+
+    @property
+    def sanction_regeneration(self) -> SanctionRegenerationService:
+        return self._provide("sanction_regeneration", lambda: SanctionRegenerationService(
+            self.loans_service, self.render_pool, self.sanction_store))
+
+    @property
+    def chatbot_agent(self) -> ChatbotAgent:
+        return self._provide("chatbot_agent", lambda: ChatbotAgent(
+            self.customer_matching, self.preapproval_service, self.event_bus))
+
+    @property
+    def preapproved_agent(self) -> PreApprovedInstantAgent:
+        return self._provide("preapproved_agent", lambda: PreApprovedInstantAgent(
+            self.preapproval_service, self.loans_service, self.event_bus, self.sanction_agent))
+
+    @property
+    def detailed_eval_agent(self) -> DetailedEvaluationAgent:
+        return self._provide("detailed_eval_agent", lambda: DetailedEvaluationAgent(
+            self.eligibility_service, self.kyc_service, self.loans_service,
+            self.file_service, self.event_bus, self.sanction_agent))
+
+    @property
+    def hackathon_engine(self) -> HackathonMasterEngine:
+        return self._provide("hackathon_engine", lambda: HackathonMasterEngine(
+            self.chatbot_agent, self.preapproved_agent, self.detailed_eval_agent))
+
+    # Chat state, one set per app: each app keeps its own sessions, turn locks and idempotency keys
+
+    def session_store(self, app: str) -> SessionStore:
+        return self._provide(f"session_store.{app}", lambda: create_session_store(f"sessions_{app}"))
+
+    def session_locks(self, app: str) -> SessionLocks:
+        return self._provide(f"session_locks.{app}", SessionLocks)
+
+    def idempotency_cache(self, app: str) -> IdempotencyCache:
+        return self._provide(f"idempotency_cache.{app}", IdempotencyCache)
+
+    def built(self) -> List[str]:
+        """Names of the services created so far"""
+        return sorted(self._services)
+
+    def shutdown(self):
+        """Stop the render workers and executors; safe to call from every mounted app"""
+        with self._lock:
+            render_pool = self._services.get("render_pool")
+            if render_pool is not None:
+                render_pool.shutdown()
+        # Lets pending write-behind work (events.json) finish
+        executors.shutdown()
+
+
+# Shared by every app in the process (main.py, main_hackathon.py, app_factory.py)
+container = ServiceContainer()
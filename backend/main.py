@@ -1,25 +1,29 @@
 import sys
 import os
+import time
 # Add current directory to Python path for imports
 sys.path.insert(0, os.path.dirname(__file__))
 
-from fastapi import FastAPI, UploadFile, File
+from fastapi import FastAPI, UploadFile, File, Header, Request, WebSocket
+from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import Dict, Any, Optional
-
-from services.offer_mart_service import OfferMartService
-from services.crm_service import CRMService
-from services.credit_bureau_service import CreditBureauService
-from services.file_service import FileService
-from services.event_bus import EventBus
-from services.llm_service import LLMService
-from services.otp_service import OTPService
-from agents.sales_agent import SalesAgent
-from agents.verification_agent import VerificationAgent
-from agents.underwriting_agent import UnderwritingAgent
-from agents.sanction_agent import SanctionAgent
-from agents.master_engine import MasterEngine
+from typing import Dict, Any, List, Optional
+
+from services.pdf_download import pdf_response
+from services.sanction_terms import render_preview_html
+from services.metrics import registry as metrics_registry
+from services.idempotency import request_fingerprint
+from services.state_backend import get_state_backend
+from services.reference_data import reference_data
+from services.session_state import wire_response
+from services.executors import ExecutorBusy, executors
+from services.chat_socket import ChatSocket
+from services.chat_stream import ndjson_turn
+from services.chat_batch import run_batch
+from services.request_log import request_log
+from agents.stage_machine import Emit, split_segments
+from container import container
 
 app = FastAPI(title="TITAN NBFC Prototype API")
 
@@ -32,38 +36,31 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize services
-offer_service = OfferMartService()
-crm_service = CRMService()
-credit_service = CreditBureauService(crm_service)
-file_service = FileService()
-event_bus = EventBus()
-llm_service = LLMService()
-otp_service = OTPService()
-
-# Initialize agents
-sales_agent = SalesAgent(offer_service, event_bus)
-verification_agent = VerificationAgent(crm_service, file_service, event_bus)
-underwriting_agent = UnderwritingAgent(credit_service, event_bus)
-sanction_agent = SanctionAgent(event_bus)
-
-# Initialize master engine
-master_engine = MasterEngine(
-    sales_agent,
-    verification_agent,
-    underwriting_agent,
-    sanction_agent
-)
+# Services and agents come from the shared container; sessions, turn locks and idempotency keys are
+# this app's own, kept there under its name and, like the rest, built on first use in each worker
+APP = "titan"
 
 class Message(BaseModel):
     customer_id: str
     text: str
+    session_id: Optional[str] = None  # Continue a server-side session; context is then only a patch
     context: Optional[Dict[str, Any]] = None
 
+class BatchMessage(Message):
+    conversation: Optional[str] = None  # Messages with the same conversation run in order; defaults to session, then customer
+    idempotency_key: Optional[str] = None
+
+class BatchRequest(BaseModel):
+    messages: List[BatchMessage]
+
 class ChatResponse(BaseModel):
     reply: str
-    context: Dict[str, Any]
-    pdf_base64: Optional[str] = None  # Base64 encoded PDF if sanction letter is generated
+    session_id: str
+    context: Optional[Dict[str, Any]] = None  # Full context, for clients that didn't send a session_id
+    context_delta: Optional[Dict[str, Any]] = None  # Keys changed this turn, in session mode
+    context_removed: Optional[List[str]] = None
+    sanction_letter_id: Optional[str] = None  # Set when a letter was issued this turn; fetch GET /sanctions/{id}
+    sanction_preview: Optional[Dict[str, Any]] = None  # Sanctioned terms for that letter (schedule at /sanctions/{id}/preview)
 
 class SendEmailOTPRequest(BaseModel):
     email: str
@@ -76,61 +73,199 @@ class VerifyEmailOTPRequest(BaseModel):
 def root():
     return {"message": "TITAN NBFC Prototype API", "status": "running"}
 
+@app.exception_handler(ExecutorBusy)
+async def executor_busy(request: Request, exc: ExecutorBusy):
+    return JSONResponse({"error": str(exc)}, status_code=503, headers={"Retry-After": "1"})
+
+def _lookup_customer_name(customer_id: str) -> Optional[str]:
+    customer = reference_data.customer(customer_id)
+    return customer.get("name") if customer else None
+
 @app.post("/chat", response_model=ChatResponse)
-def chat(msg: Message):
-    """Main chat endpoint for loan application journey"""
-    # Initialize context if not provided
-    ctx = msg.context or {
-        "customer_id": msg.customer_id,
-        "stage": "SALES",
-        "kyc_status": "UNKNOWN"
-    }
-    
-    # Ensure customer_id matches
-    ctx["customer_id"] = msg.customer_id
-    
-    # Prioritize user-entered name from context, fallback to database name
-    if not ctx.get("customer_name"):
-        import json
-        import os
-        customers_file = os.path.join(os.path.dirname(__file__), "data", "customers.json")
-        if os.path.exists(customers_file):
-            with open(customers_file, 'r') as f:
-                customers = json.load(f)
-                customer = next((c for c in customers if c.get("customer_id") == msg.customer_id), None)
-                if customer:
-                    ctx["customer_name"] = customer.get("name")
-    
-    # Process message through master engine
-    reply, new_ctx = master_engine.handle(msg.text, ctx)
-    
-    # Extract PDF if sanction letter was generated
-    pdf_base64 = new_ctx.get("sanction_letter_pdf")
+async def chat(msg: Message, idempotency_key: Optional[str] = Header(None)):
+    """
+    Main chat endpoint for loan application journey.
+    Blocking work runs on its own bounded executor (engine, llm) so one slow
+    dependency can't starve the others; a saturated executor answers 503.
+    """
+    return await _chat(msg, idempotency_key)
+
+@app.websocket("/chat/ws")
+async def chat_socket(websocket: WebSocket, customer_id: str, session_id: Optional[str] = None):
+    """
+    The /chat conversation over one WebSocket (?customer_id=...[&session_id=...] to resume):
+    send {"text": ...} frames, get reply frames back, plus a "sanction_ready" frame
+    once an issued letter's PDF is rendered. Protocol in services/chat_socket.py.
+    """
+    async def run_turn(frame: Dict[str, Any], session_id: Optional[str]):
+        msg = Message(customer_id=customer_id, text=frame["text"], session_id=session_id,
+                      context=frame.get("context"))
+        return await _chat(msg, frame.get("idempotency_key"))
+
+    await ChatSocket(websocket, run_turn, container.sanction_jobs, session_id).serve()
+
+@app.post("/chat/stream")
+async def chat_stream(msg: Message):
+    """
+    /chat as NDJSON: each reply segment is sent as soon as its stage finishes (the
+    underwriting decision before the sanction step, ...), then a "done" line with
+    the /chat response fields. Not idempotent; retry through /chat.
+    """
+    return ndjson_turn(lambda on_reply: _chat_turn(msg, on_reply))
+
+@app.post("/chat/batch")
+async def chat_batch(batch: BatchRequest):
+    """
+    Many /chat turns in one request, e.g. scripted regression conversations. Different
+    conversations run concurrently, messages of one conversation in order; a message
+    without a session_id continues the session its conversation's first reply opened.
+    Results come back in request order with each turn's status.
+    """
+    def run_turn(item: BatchMessage, session_id: Optional[str]):
+        return _chat(Message(customer_id=item.customer_id, text=item.text, session_id=session_id, context=item.context), item.idempotency_key)
+
+    return await run_batch(batch.messages, lambda item: item.conversation or item.session_id or item.customer_id,
+                           lambda item: item.session_id, run_turn)
+
+async def _chat(msg: Message, idempotency_key: Optional[str]):
+    # A retry with the same Idempotency-Key gets the first response back instead of a second turn
+    if idempotency_key:
+        return await container.idempotency_cache(APP).run(idempotency_key, request_fingerprint(msg.model_dump()),
+                                                          lambda: _chat_turn(msg))
+    return await _chat_turn(msg)
+
+async def _chat_turn(msg: Message, on_reply: Optional[Emit] = None):
+    # Turns for one customer run one at a time: a double-click or client retry must not
+    # run the journey twice (two loans, two letters) from the same starting context
+    async with container.session_locks(APP).hold(msg.customer_id):
+        # Load the server-side session, or take the client's full context (legacy clients)
+        turn = container.session_store(APP).open_turn(msg.session_id, msg.context, {
+            "customer_id": msg.customer_id,
+            "stage": "SALES",
+            "kyc_status": "UNKNOWN"
+        })
+        if turn is None:
+            return JSONResponse({"error": "Session not found or expired"}, status_code=404)
+        session_id, ctx, stored = turn
+
+        # Ensure customer_id matches
+        ctx["customer_id"] = msg.customer_id
+
+        # Prioritize user-entered name from context, fallback to database name
+        if not ctx.get("customer_name"):
+            # An index lookup in the preloaded reference data; no disk read any more
+            customer_name = _lookup_customer_name(msg.customer_id)
+            if customer_name:
+                ctx["customer_name"] = customer_name
+
+        # Older clients echo the base64 letter back; it is never read, so don't carry it forward
+        ctx.pop("sanction_letter_pdf", None)
+        previous_letter_id = ctx.get("sanction_letter_id")
+
+        # Process message through master engine; a rewritten reply can only be streamed once complete
+        rewrite = container.llm_service.is_enabled()
+        started = time.perf_counter()
+        reply, new_ctx = await executors.get("engine").run(container.master_engine.handle, msg.text, ctx,
+                                                           None if rewrite else on_reply)
+        engine_ms = (time.perf_counter() - started) * 1000.0
+        session_fields = container.session_store(APP).close_turn(session_id, new_ctx, stored)
+        # Captured for replay when CHAT_REQUEST_LOG is set
+        request_log.record(APP, session_id, msg.session_id is not None, msg.customer_id, msg.text,
+                           msg.context, new_ctx, engine_ms)
+
+    # Only report a letter issued on this turn
+    letter_id = new_ctx.get("sanction_letter_id")
+    sanction_letter_id = letter_id if letter_id != previous_letter_id else None
+    sanction_preview = None
+    if sanction_letter_id:
+        preview = container.sanction_agent.get_preview(sanction_letter_id)
+        if preview:
+            sanction_preview = {k: v for k, v in preview.items() if k != "schedule"}
 
     # Optionally pass through LLM for more natural phrasing (without changing logic)
-    if llm_service.is_enabled():
-        reply = llm_service.rewrite_reply(msg.text, reply, new_ctx)
+    if rewrite:
+        reply = await executors.get("llm").run(container.llm_service.rewrite_reply, msg.text, reply, new_ctx)
+        if on_reply:
+            for segment in split_segments(reply):
+                on_reply(segment)
     
-    return ChatResponse(reply=reply, context=new_ctx, pdf_base64=pdf_base64)
+    # Shaped like ChatResponse, but encoded directly instead of re-validating the context
+    return wire_response({"reply": reply, **session_fields,
+                          "sanction_letter_id": sanction_letter_id, "sanction_preview": sanction_preview})
+
+@app.get("/sessions/{session_id}")
+def get_session(session_id: str):
+    """Full server-side context of a session, e.g. to restore a chat after a page reload"""
+    ctx = container.session_store(APP).get(session_id)
+    if ctx is None:
+        return JSONResponse({"error": "Session not found or expired"}, status_code=404)
+    return wire_response({"session_id": session_id, "context": ctx})
+
+@app.delete("/sessions/{session_id}")
+def delete_session(session_id: str):
+    """End a session and drop its server-side context"""
+    container.session_store(APP).delete(session_id)
+    return {"session_id": session_id, "deleted": True}
+
+@app.get("/sanctions/{letter_id}")
+def get_sanction_letter(letter_id: str, request: Request):
+    """
+    Download a sanction letter by content hash, or by job id once its render is done
+    (202 with the job status until then). Supports ETag, Range and gzip.
+    """
+    path = container.sanction_store.path_for(letter_id)
+    if path is None:
+        job = container.sanction_jobs.get(letter_id)
+        if not job:
+            return JSONResponse({"error": "Sanction letter not found"}, status_code=404)
+        if job["status"] != "DONE":
+            status_code = 500 if job["status"] == "FAILED" else 202
+            return JSONResponse({"job_id": letter_id, "status": job["status"], "error": job["error"]},
+                                status_code=status_code)
+        path = job["pdf_path"]
+    if not path or not os.path.exists(path):
+        return JSONResponse({"error": "Sanction letter not found"}, status_code=404)
+    content_id = container.sanction_store.letter_id(path)
+    return pdf_response(request, path, content_id, f"sanction_letter_{content_id[:12]}.pdf")
+
+@app.get("/sanctions/{letter_id}/preview")
+def get_sanction_preview(letter_id: str, format: str = "json"):
+    """Sanctioned terms and repayment schedule without the PDF; format=html for a printable page"""
+    preview = container.sanction_agent.get_preview(letter_id)
+    if not preview:
+        return JSONResponse({"error": "Sanction preview not found"}, status_code=404)
+    if format == "html":
+        return HTMLResponse(render_preview_html(preview))
+    return preview
+
+@app.on_event("startup")
+def build_services():
+    # Build the engine (and start the render workers) and the session store now, so the first chat turn doesn't pay for it
+    container.master_engine
+    container.session_store(APP)
+
+@app.on_event("shutdown")
+def stop_services():
+    container.shutdown()
 
 # Mock API endpoints for services (as per requirements)
 
 @app.get("/offer-mart/offers/{customer_id}")
 def get_offers(customer_id: str):
     """Mock Offer Mart server endpoint"""
-    offers = offer_service.get_offers(customer_id)
+    offers = container.offer_service.get_offers(customer_id)
     return {"customer_id": customer_id, "offers": offers}
 
 @app.get("/crm/kyc/{customer_id}")
 def get_kyc(customer_id: str):
     """Mock CRM server endpoint"""
-    kyc = crm_service.get_kyc(customer_id)
+    kyc = container.crm_service.get_kyc(customer_id)
     return kyc if kyc else {"error": "KYC not found"}
 
 @app.get("/credit-bureau/score/{pan}")
 def get_credit_score(pan: str):
     """Mock Credit Bureau API endpoint"""
-    score = credit_service.get_score_by_pan(pan)
+    score = container.credit_service.get_score_by_pan(pan)
     return {"pan": pan, "credit_score": score} if score else {"error": "Score not found"}
 
 @app.post("/files/upload-salary-slip")
@@ -138,32 +273,46 @@ def upload_salary_slip(customer_id: str = None, file: UploadFile | None = File(d
     """Upload salary slip for a customer (supports real file or placeholder)."""
     if not customer_id:
         return {"error": "customer_id is required"}
-    result = file_service.upload_salary_slip(customer_id, file)
+    result = container.file_service.upload_salary_slip(customer_id, file)
     return result
 
+@app.get("/metrics")
+def get_metrics():
+    """Timings plus job queue, render pool, executor, session, session lock, idempotency and state backend counters"""
+    return {**metrics_registry.snapshot(), "sanction_jobs": container.sanction_jobs.stats(),
+            "render_pool": container.render_pool.stats(), "executors": executors.stats(),
+            "sessions": container.session_store(APP).stats(), "session_locks": container.session_locks(APP).stats(),
+            "idempotency": container.idempotency_cache(APP).stats(), "state": get_state_backend().stats(),
+            "faq": container.faq_service.stats()}
+
+@app.get("/underwriting/cache")
+def get_underwriting_cache_stats():
+    """Hit/miss counters for the underwriting decision cache"""
+    return container.underwriting_agent.decision_cache.stats()
+
 @app.get("/events/{customer_id}")
 def get_events(customer_id: str):
     """Get events for a customer"""
-    events = event_bus.get_events_by_customer(customer_id)
+    events = container.event_bus.get_events_by_customer(customer_id)
     return {"customer_id": customer_id, "events": events}
 
 @app.get("/events")
 def get_all_events():
     """Get all events"""
-    return {"events": event_bus.events}
+    return {"events": container.event_bus.events}
 
 @app.post("/otp/send-email")
-def send_email_otp(payload: SendEmailOTPRequest):
+async def send_email_otp(payload: SendEmailOTPRequest):
     """Generate and (for demo) 'send' a 6-digit OTP to the provided email.
     In production, integrate with an email provider. Optionally exposes OTP when DEMO_EXPOSE_OTP=true.
     """
-    result = otp_service.generate_otp(payload.email)
+    result = await executors.get("email").run(container.otp_service.generate_otp, payload.email)
     return {"status": result.get("status", "sent"), "demo_otp": result.get("otp")}
 
 @app.post("/otp/verify-email")
 def verify_email_otp(payload: VerifyEmailOTPRequest):
     """Verify the email OTP code."""
-    ok = otp_service.verify_otp(payload.email, payload.code)
+    ok = container.otp_service.verify_otp(payload.email, payload.code)
     return {"verified": ok}
 
 if __name__ == "__main__":
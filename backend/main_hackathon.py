@@ -1,25 +1,27 @@
 import sys
 import os
+import time
 # Add current directory to Python path for imports
 sys.path.insert(0, os.path.dirname(__file__))
 
-from fastapi import FastAPI
+from fastapi import FastAPI, BackgroundTasks, Header, Request, WebSocket
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import Dict, Any, Optional
-
-from services.customer_matching_service import CustomerMatchingService
-from services.preapproval_service import PreApprovalService
-from services.eligibility_service import EligibilityService
-from services.kyc_document_service import KYCDocumentService
-from services.loans_service import LoansService
-from services.file_service import FileService
-from services.event_bus import EventBus
-from agents.chatbot_agent import ChatbotAgent
-from agents.preapproved_instant_agent import PreApprovedInstantAgent
-from agents.detailed_evaluation_agent import DetailedEvaluationAgent
-from agents.sanction_agent import SanctionAgent
-from agents.hackathon_master_engine import HackathonMasterEngine
+from typing import Dict, Any, List, Optional
+
+from services.pdf_download import pdf_response
+from services.metrics import registry as metrics_registry
+from services.idempotency import request_fingerprint
+from services.state_backend import get_state_backend
+from services.session_state import wire_response
+from services.executors import ExecutorBusy, executors
+from services.chat_socket import ChatSocket
+from services.chat_stream import ndjson_turn
+from services.chat_batch import run_batch
+from services.request_log import request_log
+from agents.stage_machine import Emit
+from container import container
 
 app = FastAPI(title="Hackathon Loan Approval Chatbot API")
 
@@ -32,40 +34,29 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize services
-customer_matching = CustomerMatchingService()
-preapproval_service = PreApprovalService()
-eligibility_service = EligibilityService()
-kyc_service = KYCDocumentService()
-loans_service = LoansService()
-file_service = FileService()
-event_bus = EventBus()
-
-# Initialize sanction agent
-sanction_agent = SanctionAgent(event_bus)
-
-# Initialize agents
-chatbot_agent = ChatbotAgent(customer_matching, preapproval_service, event_bus)
-preapproved_agent = PreApprovedInstantAgent(preapproval_service, loans_service, event_bus, sanction_agent)
-detailed_eval_agent = DetailedEvaluationAgent(
-    eligibility_service, kyc_service, loans_service, 
-    file_service, event_bus, sanction_agent
-)
-
-# Initialize master engine
-master_engine = HackathonMasterEngine(
-    chatbot_agent,
-    preapproved_agent,
-    detailed_eval_agent
-)
+# Services and agents come from the shared container; sessions, turn locks and idempotency keys are
+# this app's own, kept there under its name and, like the rest, built on first use in each worker
+APP = "hackathon"
 
 class Message(BaseModel):
     text: str
+    session_id: Optional[str] = None  # Continue a server-side session; context is then only a patch
     context: Optional[Dict[str, Any]] = None
 
+class BatchMessage(Message):
+    conversation: Optional[str] = None  # Messages with the same conversation run in order; defaults to the session
+    idempotency_key: Optional[str] = None
+
+class BatchRequest(BaseModel):
+    messages: List[BatchMessage]
+
 class ChatResponse(BaseModel):
     reply: str
-    context: Dict[str, Any]
+    session_id: str
+    context: Optional[Dict[str, Any]] = None  # Full context, for clients that didn't send a session_id
+    context_delta: Optional[Dict[str, Any]] = None  # Keys changed this turn, in session mode
+    context_removed: Optional[List[str]] = None
+    sanction_letter_id: Optional[str] = None  # Set when a letter was issued this turn; fetch GET /sanctions/{id}
 
 @app.get("/")
 def root():
@@ -75,10 +66,15 @@ def root():
         "description": "Chat-style loan approval system with pre-approved instant approval and detailed evaluation paths"
     }
 
+@app.exception_handler(ExecutorBusy)
+async def executor_busy(request: Request, exc: ExecutorBusy):
+    return JSONResponse({"error": str(exc)}, status_code=503, headers={"Retry-After": "1"})
+
 @app.post("/chat", response_model=ChatResponse)
-def chat(msg: Message):
+async def chat(msg: Message, idempotency_key: Optional[str] = Header(None)):
     """
-    Main chat endpoint for hackathon loan application journey
+    Main chat endpoint for hackathon loan application journey.
+    The agent turn runs on the bounded engine executor; a saturated executor answers 503.
     
     Flow:
     1. Collects: name, mobile, city, loan amount, purpose
@@ -86,46 +82,198 @@ def chat(msg: Message):
     3. If pre-approved → instant approval path
     4. If not pre-approved → detailed evaluation path (employment, income, KYC docs, eligibility)
     """
-    # Initialize context if not provided
-    ctx = msg.context or {
-        "stage": "INITIAL"
-    }
-    
-    # Process message through master engine
-    reply, new_ctx = master_engine.handle(msg.text, ctx)
-    
-    return ChatResponse(reply=reply, context=new_ctx)
+    return await _chat(msg, idempotency_key)
+
+@app.websocket("/chat/ws")
+async def chat_socket(websocket: WebSocket, session_id: Optional[str] = None):
+    """
+    The /chat conversation over one WebSocket ([?session_id=...] to resume):
+    send {"text": ...} frames, get reply frames back, plus a "sanction_ready" frame
+    once an issued letter's PDF is rendered. Protocol in services/chat_socket.py.
+    """
+    async def run_turn(frame: Dict[str, Any], session_id: Optional[str]):
+        msg = Message(text=frame["text"], session_id=session_id, context=frame.get("context"))
+        return await _chat(msg, frame.get("idempotency_key"))
+
+    await ChatSocket(websocket, run_turn, container.sanction_jobs, session_id).serve()
+
+@app.post("/chat/stream")
+async def chat_stream(msg: Message):
+    """
+    /chat as NDJSON: each reply segment is sent as soon as it is ready, then a
+    "done" line with the /chat response fields. Not idempotent; retry through /chat.
+    """
+    return ndjson_turn(lambda on_reply: _chat_turn(msg, on_reply))
+
+@app.post("/chat/batch")
+async def chat_batch(batch: BatchRequest):
+    """
+    Many /chat turns in one request, e.g. scripted regression conversations. Different
+    conversations run concurrently, messages of one conversation in order; a message
+    without a session_id continues the session its conversation's first reply opened.
+    Results come back in request order with each turn's status.
+    """
+    def run_turn(item: BatchMessage, session_id: Optional[str]):
+        return _chat(Message(text=item.text, session_id=session_id, context=item.context), item.idempotency_key)
+
+    return await run_batch(batch.messages, lambda item: item.conversation or item.session_id,
+                           lambda item: item.session_id, run_turn)
+
+async def _chat(msg: Message, idempotency_key: Optional[str]):
+    # A retry with the same Idempotency-Key gets the first response back instead of a second turn
+    if idempotency_key:
+        return await container.idempotency_cache(APP).run(idempotency_key, request_fingerprint(msg.model_dump()),
+                                                          lambda: _chat_turn(msg))
+    return await _chat_turn(msg)
+
+async def _chat_turn(msg: Message, on_reply: Optional[Emit] = None):
+    # Turns for one session run one at a time (double-clicks, client retries); a new
+    # conversation has no session id yet and nothing to race with
+    async with container.session_locks(APP).hold(msg.session_id or (msg.context or {}).get("session_id")):
+        # Load the server-side session, or take the client's full context (legacy clients)
+        turn = container.session_store(APP).open_turn(msg.session_id, msg.context, {"stage": "INITIAL"})
+        if turn is None:
+            return JSONResponse({"error": "Session not found or expired"}, status_code=404)
+        session_id, ctx, stored = turn
+
+        # Older clients echo the base64 letter back; it is never read, so don't carry it forward
+        ctx.pop("sanction_letter_pdf", None)
+        previous_letter_id = ctx.get("sanction_letter_id")
+
+        # Process message through master engine
+        started = time.perf_counter()
+        reply, new_ctx = await executors.get("engine").run(container.hackathon_engine.handle, msg.text, ctx, on_reply)
+        engine_ms = (time.perf_counter() - started) * 1000.0
+        session_fields = container.session_store(APP).close_turn(session_id, new_ctx, stored)
+        # Captured for replay when CHAT_REQUEST_LOG is set
+        request_log.record(APP, session_id, msg.session_id is not None, None, msg.text,
+                           msg.context, new_ctx, engine_ms)
+
+    letter_id = new_ctx.get("sanction_letter_id")
+    sanction_letter_id = letter_id if letter_id != previous_letter_id else None
+    # Shaped like ChatResponse, but encoded directly instead of re-validating the context
+    return wire_response({"reply": reply, **session_fields, "sanction_letter_id": sanction_letter_id})
+
+@app.get("/sessions/{session_id}")
+def get_session(session_id: str):
+    """Full server-side context of a session, e.g. to restore a chat after a page reload"""
+    ctx = container.session_store(APP).get(session_id)
+    if ctx is None:
+        return JSONResponse({"error": "Session not found or expired"}, status_code=404)
+    return wire_response({"session_id": session_id, "context": ctx})
+
+@app.delete("/sessions/{session_id}")
+def delete_session(session_id: str):
+    """End a session and drop its server-side context"""
+    container.session_store(APP).delete(session_id)
+    return {"session_id": session_id, "deleted": True}
+
+@app.get("/sanctions/{letter_id}")
+def get_sanction_letter(letter_id: str, request: Request):
+    """
+    Download a sanction letter by content hash, or by job id once its render is done
+    (202 with the job status until then). Supports ETag, Range and gzip.
+    """
+    path = container.sanction_store.path_for(letter_id)
+    if path is None:
+        job = container.sanction_jobs.get(letter_id)
+        if not job:
+            return JSONResponse({"error": "Sanction letter not found"}, status_code=404)
+        if job["status"] != "DONE":
+            status_code = 500 if job["status"] == "FAILED" else 202
+            return JSONResponse({"job_id": letter_id, "status": job["status"], "error": job["error"]},
+                                status_code=status_code)
+        path = job["pdf_path"]
+    if not path or not os.path.exists(path):
+        return JSONResponse({"error": "Sanction letter not found"}, status_code=404)
+    content_id = container.sanction_store.letter_id(path)
+    return pdf_response(request, path, content_id, f"sanction_letter_{content_id[:12]}.pdf")
+
+@app.on_event("startup")
+def build_services():
+    # Build the engine (and start the render workers) and the session store now, so the first chat turn doesn't pay for it
+    container.hackathon_engine
+    container.session_store(APP)
+
+@app.on_event("shutdown")
+def stop_services():
+    container.shutdown()
 
 # API endpoints for debugging/testing
 
+@app.get("/metrics")
+def get_metrics():
+    """Timings plus job queue, render pool, executor, session, session lock, idempotency and state backend counters"""
+    return {**metrics_registry.snapshot(), "sanction_jobs": container.sanction_jobs.stats(),
+            "render_pool": container.render_pool.stats(), "executors": executors.stats(),
+            "sessions": container.session_store(APP).stats(), "session_locks": container.session_locks(APP).stats(),
+            "idempotency": container.idempotency_cache(APP).stats(), "state": get_state_backend().stats()}
+
 @app.get("/customers/{customer_id}")
 def get_customer(customer_id: str):
     """Get customer by ID"""
-    customer = customer_matching.get_customer_by_id(customer_id)
+    customer = container.customer_matching.get_customer_by_id(customer_id)
     return customer if customer else {"error": "Customer not found"}
 
 @app.get("/offers/{customer_id}")
 def get_offer(customer_id: str):
     """Get pre-approved offer for customer"""
-    offer = preapproval_service.find_preapproved_offer(customer_id)
+    offer = container.preapproval_service.find_preapproved_offer(customer_id)
     return offer if offer else {"error": "No pre-approved offer found"}
 
 @app.get("/loans/{session_id}")
 def get_loan(session_id: str):
     """Get loan by session ID"""
-    loan = loans_service.get_loan_by_session(session_id)
+    loan = container.loans_service.get_loan_by_session(session_id)
     return loan if loan else {"error": "Loan not found"}
 
 @app.get("/events/{session_id}")
 def get_events(session_id: str):
     """Get events for a session"""
-    events = event_bus.get_events_by_customer(session_id)
+    events = container.event_bus.get_events_by_customer(session_id)
     return {"session_id": session_id, "events": events}
 
 @app.get("/events")
 def get_all_events():
     """Get all events"""
-    return {"events": event_bus.events}
+    return {"events": container.event_bus.events}
+
+# Admin endpoints
+
+def _run_preapproval_refresh(workers: Optional[int]):
+    container.preapproval_refresh.refresh(workers=workers)
+    # Swap the instant path over to the new snapshot
+    container.preapproval_service.load_offers()
+
+@app.post("/admin/preapprovals/refresh")
+def refresh_preapprovals(background_tasks: BackgroundTasks, workers: Optional[int] = None):
+    """Recompute pre-approved limits and rates for all customers in the background"""
+    preapproval_refresh = container.preapproval_refresh
+    if preapproval_refresh.status.get("state") in ("QUEUED", "RUNNING"):
+        return {"error": "Refresh already running", "status": preapproval_refresh.status}
+    preapproval_refresh.status = {"state": "QUEUED"}
+    background_tasks.add_task(_run_preapproval_refresh, workers)
+    return {"status": preapproval_refresh.status}
+
+@app.get("/admin/preapprovals/refresh")
+def get_preapproval_refresh_status():
+    """Progress of the current or last pre-approval refresh"""
+    return {"status": container.preapproval_refresh.status}
+
+@app.post("/admin/sanctions/regenerate")
+def regenerate_sanction_letters(background_tasks: BackgroundTasks, resume: bool = False):
+    """Redraw the sanction letter of every approved loan in the background"""
+    sanction_regeneration = container.sanction_regeneration
+    if sanction_regeneration.status.get("state") in ("QUEUED", "RUNNING"):
+        return {"error": "Regeneration already running", "status": sanction_regeneration.status}
+    sanction_regeneration.status = {"state": "QUEUED"}
+    background_tasks.add_task(sanction_regeneration.regenerate, resume)
+    return {"status": sanction_regeneration.status}
+
+@app.get("/admin/sanctions/regenerate")
+def get_sanction_regeneration_status():
+    """Progress and throughput of the current or last letter regeneration"""
+    return {"status": container.sanction_regeneration.status}
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,172 @@
+"""
+Pre-fork launcher for the API.
+
+    python serve.py main_hackathon:app --workers 4 --port 8000
+    python serve.py app_factory:create_app --factory --workers 4
+
+The parent imports the libraries, every service and agent module and the app
+module, parses the reference data (customers, offers, KYC, policies, FAQs)
+once, freezes the garbage collector and binds the listening socket. It then
+forks the workers. Importing an app only defines its routes: each worker builds
+its runtime services, session store, turn locks and idempotency cache at startup
+(threads, pools and sqlite connections don't survive a fork) but inherits
+everything the parent loaded copy-on-write.
+The parent restarts workers that die and stops them all on SIGINT/SIGTERM.
+"""
+import argparse
+import gc
+import importlib
+import os
+import pkgutil
+import signal
+import socket
+import sys
+import time
+import traceback
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Heavy third-party imports shared by both apps
+PRELOAD_LIBRARIES = ["fastapi", "fastapi.responses", "starlette.routing", "pydantic", "uvicorn", "fpdf"]
+# A worker that dies sooner than this after starting is restarted with a delay, not in a hot loop
+MIN_WORKER_LIFETIME = 5.0
+
+
+def preload(app: str) -> List[str]:
+    """Import shared code and parse the reference data in the parent; returns the modules loaded"""
+    # Objects created from here on go to the frozen generation below instead of being
+    # scanned (and their pages written to) by collections in every worker
+    gc.disable()
+    loaded = []
+    for name in PRELOAD_LIBRARIES:
+        try:
+            importlib.import_module(name)
+            loaded.append(name)
+        except ImportError:
+            pass
+    import agents
+    import services
+    for package in (services, agents):
+        for module in pkgutil.iter_modules(package.__path__):
+            name = f"{package.__name__}.{module.name}"
+            try:
+                importlib.import_module(name)
+                loaded.append(name)
+            except ImportError as e:
+                # An optional integration that isn't installed; the worker will skip it too
+                print(f"[serve] Skipping {name}: {e}")
+
+    # App modules only define routes and models at import. Their services, session
+    # stores (and spill databases), turn locks and idempotency keys come from the
+    # container (container.py) and are built at startup, in each worker
+    module = app.split(":")[0]
+    importlib.import_module(module)
+    loaded.append(module)
+
+    from services.reference_data import reference_data
+    reference_data.preload()
+    gc.collect()
+    gc.freeze()
+    return loaded
+
+
+def bind(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app: str, factory: bool, sock: socket.socket, log_level: str):
+    import uvicorn
+
+    gc.enable()
+    # The app's startup event builds this worker's services
+    config = uvicorn.Config(app, factory=factory, log_level=log_level)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+class Supervisor:
+    """Forks the workers and keeps that many running until told to stop"""
+
+    def __init__(self, app: str, factory: bool, sock: socket.socket, workers: int, log_level: str):
+        self.app = app
+        self.factory = factory
+        self.sock = sock
+        self.workers = max(1, workers)
+        self.log_level = log_level
+        self.children: Dict[int, float] = {}
+        self.stopping = False
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                signal.signal(signal.SIGINT, signal.SIG_DFL)
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                run_worker(self.app, self.factory, self.sock, self.log_level)
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        self.children[pid] = time.monotonic()
+        print(f"[serve] Started worker {pid}")
+
+    def stop(self, signum, frame):
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+        for _ in range(self.workers):
+            self.spawn()
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            started = self.children.pop(pid, None)
+            if started is None or self.stopping:
+                continue
+            print(f"[serve] Worker {pid} exited with status {status}; restarting")
+            if time.monotonic() - started < MIN_WORKER_LIFETIME:
+                time.sleep(1.0)
+            self.spawn()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve an app from pre-forked workers that share preloaded data")
+    parser.add_argument("app", nargs="?", default="main_hackathon:app", help="module:attribute, e.g. main:app")
+    parser.add_argument("--factory", action="store_true", help="The attribute is a factory returning the app")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    if not hasattr(os, "fork"):
+        # No fork (Windows): a single process, as `python main.py` would run
+        import uvicorn
+        uvicorn.run(args.app, factory=args.factory, host=args.host, port=args.port, log_level=args.log_level)
+        return
+
+    started = time.perf_counter()
+    loaded = preload(args.app)
+    print(f"[serve] Preloaded {len(loaded)} modules and reference data in "
+          f"{(time.perf_counter() - started) * 1000:.0f} ms ({gc.get_freeze_count():,} objects frozen)")
+    sock = bind(args.host, args.port)
+    Supervisor(args.app, args.factory, sock, args.workers, args.log_level).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import asyncio
+import json
+import os
+import time
+import traceback
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, TypeVar
+
+from fastapi.responses import JSONResponse, Response
+
+from services.executors import ExecutorBusy
+from services.metrics import registry as metrics_registry
+from services.session_state import wire_response
+
+# Most messages accepted in one POST /chat/batch
+MAX_ITEMS = int(os.getenv("CHAT_BATCH_MAX_ITEMS", "1000"))
+# Conversations of one batch run at the same time (the engine executor has 8 threads by default)
+CONCURRENCY = int(os.getenv("CHAT_BATCH_CONCURRENCY", "8"))
+
+T = TypeVar("T")
+
+
+async def run_batch(items: Sequence[T],
+                    conversation_of: Callable[[T], Optional[str]],
+                    session_of: Callable[[T], Optional[str]],
+                    run_turn: Callable[[T, Optional[str]], Awaitable[Response]],
+                    concurrency: int = CONCURRENCY,
+                    max_items: int = MAX_ITEMS) -> Response:
+    """
+    Run many chat turns and answer with all their results, in request order.
+
+    Items with the same conversation key run one after another in the order
+    given; different conversations run concurrently, at most `concurrency` at a
+    time. The session id returned by a conversation's first turn is used for its
+    later items that don't name one, so a scripted conversation can start
+    without a session. Once a turn fails, the rest of its conversation is
+    skipped (status 424) rather than run against the wrong state.
+    """
+    if len(items) > max_items:
+        return JSONResponse({"error": f"At most {max_items} messages per batch"}, status_code=413)
+    started = time.perf_counter()
+    conversations: "OrderedDict[Any, List[int]]" = OrderedDict()
+    for index, item in enumerate(items):
+        key = conversation_of(item)
+        # Items without a key are conversations of their own
+        conversations.setdefault(key if key is not None else ("#", index), []).append(index)
+
+    results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+    slots = asyncio.Semaphore(max(1, concurrency))
+
+    async def run_conversation(indexes: List[int]):
+        async with slots:
+            session_id = None
+            for position, index in enumerate(indexes):
+                item = items[index]
+                try:
+                    response = await run_turn(item, session_of(item) or session_id)
+                    body = json.loads(response.body)
+                    status = response.status_code
+                except ExecutorBusy as e:
+                    status, body = 503, {"error": str(e)}
+                except Exception as e:
+                    traceback.print_exc()
+                    status, body = 500, {"error": str(e)}
+                results[index] = {"index": index, "status": status, **body}
+                if status != 200:
+                    for skipped in indexes[position + 1:]:
+                        results[skipped] = {"index": skipped, "status": 424,
+                                            "error": f"Not run: message {index} of this conversation failed"}
+                    return
+                session_id = body.get("session_id") or session_id
+
+    await asyncio.gather(*(run_conversation(indexes) for indexes in conversations.values()))
+    elapsed_ms = (time.perf_counter() - started) * 1000.0
+    metrics_registry.observe("chat_batch.ms", elapsed_ms)
+    metrics_registry.incr("chat_batch.messages", len(items))
+    return wire_response({
+        "results": results,
+        "conversations": len(conversations),
+        "failed": sum(1 for result in results if result["status"] != 200),
+        "elapsed_ms": round(elapsed_ms, 2),
+    })
@@ -0,0 +1,185 @@
+import asyncio
+import json
+import os
+import time
+import traceback
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from fastapi import WebSocket
+from fastapi.responses import Response
+from starlette.websockets import WebSocketState
+
+from services.executors import ExecutorBusy
+from services.metrics import registry as metrics_registry
+from services.sanction_job_service import SanctionJobQueue
+from services.session_state import dumps
+
+# Seconds between pings to the client
+HEARTBEAT_SECONDS = float(os.getenv("WS_HEARTBEAT_SECONDS", "20"))
+# ...and the connection is closed once the client has been silent this long
+IDLE_TIMEOUT_SECONDS = float(os.getenv("WS_IDLE_TIMEOUT_SECONDS", "60"))
+# Frames waiting to be written to a client that isn't reading; one more closes the connection
+SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE", "32"))
+# Messages accepted ahead of the turn being run; more are refused with a 429 error frame
+MAX_PENDING_TURNS = int(os.getenv("WS_MAX_PENDING_TURNS", "4"))
+
+# Close codes in the private 4000-4999 range, after the matching HTTP statuses
+CLOSE_IDLE = 4408
+CLOSE_SLOW_CONSUMER = 4429
+
+# (frame, session_id bound to the connection) -> the /chat response for that turn
+TurnHandler = Callable[[Dict[str, Any], Optional[str]], Awaitable[Response]]
+
+
+class ChatSocket:
+    """
+    One chat conversation over a WebSocket.
+
+    The client sends {"text": ..., "id": ...} frames (optionally "context" and
+    "idempotency_key", as on POST /chat) and gets {"type": "reply", "id": ...,
+    ...} back with the same fields as the /chat response. The session is bound
+    to the connection, so frames don't carry a session_id. When a turn issues a
+    sanction letter, a {"type": "sanction_ready"} frame follows once its PDF is
+    rendered, so the client doesn't poll GET /sanctions/{id}.
+
+    Turns run one at a time in arrival order. Heartbeats are {"type": "ping"}
+    frames; the client answers {"type": "pong"} (any frame counts as alive).
+    Backpressure: a client that sends faster than turns complete gets 429
+    error frames, and one that stops reading is disconnected rather than
+    buffered for without limit.
+    """
+
+    def __init__(self, websocket: WebSocket, run_turn: TurnHandler, sanction_jobs: SanctionJobQueue,
+                 session_id: Optional[str] = None,
+                 heartbeat_seconds: float = HEARTBEAT_SECONDS,
+                 idle_timeout_seconds: float = IDLE_TIMEOUT_SECONDS,
+                 send_queue_size: int = SEND_QUEUE_SIZE,
+                 max_pending_turns: int = MAX_PENDING_TURNS):
+        self.websocket = websocket
+        self.run_turn = run_turn
+        self.sanction_jobs = sanction_jobs
+        self.session_id = session_id
+        self.heartbeat_seconds = heartbeat_seconds
+        self.idle_timeout_seconds = idle_timeout_seconds
+        self._outbox: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue(maxsize=max(1, send_queue_size))
+        self._inbox: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue(maxsize=max(1, max_pending_turns))
+        self._closed = asyncio.Event()
+        self._close_code = 1000
+        self._last_seen = time.monotonic()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def serve(self):
+        """Accept the connection and run it until either side closes"""
+        await self.websocket.accept()
+        self._loop = asyncio.get_running_loop()
+        metrics_registry.incr("chat_socket.opened")
+        tasks = [asyncio.create_task(coro) for coro in
+                 (self._receive(), self._send(), self._run_turns(), self._heartbeat(), self._closed.wait())]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if self.websocket.client_state != WebSocketState.DISCONNECTED:
+                try:
+                    await self.websocket.close(self._close_code)
+                except RuntimeError:
+                    pass  # closed by the client meanwhile
+            metrics_registry.incr("chat_socket.closed")
+
+    def close(self, code: int):
+        self._close_code = code
+        self._closed.set()
+
+    def push(self, frame: Dict[str, Any]):
+        """Queue a frame for the client; a client too far behind is disconnected"""
+        if self._closed.is_set():
+            return
+        try:
+            self._outbox.put_nowait(frame)
+        except asyncio.QueueFull:
+            metrics_registry.incr("chat_socket.slow_consumer")
+            self.close(CLOSE_SLOW_CONSUMER)
+
+    async def _receive(self):
+        while True:
+            message = await self.websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            self._last_seen = time.monotonic()
+            try:
+                frame = json.loads(message.get("text") or message.get("bytes") or b"")
+            except ValueError:
+                frame = None
+            if not isinstance(frame, dict):
+                self.push({"type": "error", "status": 400, "error": "Frames must be JSON objects"})
+                continue
+            kind = frame.get("type", "message")
+            if kind == "pong":
+                continue
+            if kind == "ping":
+                self.push({"type": "pong"})
+            elif kind != "message" or not isinstance(frame.get("text"), str):
+                self.push({"type": "error", "id": frame.get("id"), "status": 400,
+                           "error": "Expected {\"text\": ...} or a pong"})
+            else:
+                try:
+                    self._inbox.put_nowait(frame)
+                except asyncio.QueueFull:
+                    metrics_registry.incr("chat_socket.rejected")
+                    self.push({"type": "error", "id": frame.get("id"), "status": 429,
+                               "error": "Too many messages waiting; resend after the next reply"})
+
+    async def _send(self):
+        while True:
+            frame = await self._outbox.get()
+            await self.websocket.send_text(dumps(frame).decode("utf-8"))
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_seconds)
+            if time.monotonic() - self._last_seen > self.idle_timeout_seconds:
+                metrics_registry.incr("chat_socket.idle_timeout")
+                self.close(CLOSE_IDLE)
+                return
+            self.push({"type": "ping", "ts": time.time()})
+
+    async def _run_turns(self):
+        while True:
+            frame = await self._inbox.get()
+            try:
+                response = await self.run_turn(frame, self.session_id)
+            except ExecutorBusy as e:
+                self.push({"type": "error", "id": frame.get("id"), "status": 503, "error": str(e), "retry_after": 1})
+                continue
+            except ValueError as e:
+                # A frame that doesn't make a valid chat message
+                self.push({"type": "error", "id": frame.get("id"), "status": 422, "error": str(e)})
+                continue
+            except Exception as e:
+                traceback.print_exc()
+                self.push({"type": "error", "id": frame.get("id"), "status": 500, "error": str(e)})
+                continue
+            body = json.loads(response.body)
+            if response.status_code != 200:
+                self.push({"type": "error", "id": frame.get("id"), "status": response.status_code, **body})
+                continue
+            # Later turns continue this session
+            self.session_id = body.get("session_id") or self.session_id
+            self.push({"type": "reply", "id": frame.get("id"), **body})
+            if body.get("sanction_letter_id"):
+                self._watch_letter(body["sanction_letter_id"])
+
+    def _watch_letter(self, letter_id: str):
+        def finished(job: Dict[str, Any]):
+            frame = {"type": "sanction_ready", "sanction_letter_id": letter_id,
+                     "status": job["status"], "error": job.get("error")}
+            try:
+                self._loop.call_soon_threadsafe(self.push, frame)
+            except RuntimeError:
+                pass  # the server is shutting down
+
+        if not self.sanction_jobs.watch(letter_id, finished):
+            # Not a job: the letter was already in the store and can be downloaded now
+            self.push({"type": "sanction_ready", "sanction_letter_id": letter_id, "status": "DONE", "error": None})
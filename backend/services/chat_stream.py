@@ -0,0 +1,76 @@
+import asyncio
+import json
+import time
+import traceback
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict
+
+from fastapi.responses import Response, StreamingResponse
+
+from services.executors import ExecutorBusy
+from services.metrics import registry as metrics_registry
+from services.session_state import dumps
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# Runs one chat turn, handing each reply segment to the callback as it is ready
+# (from the engine thread); returns the /chat response
+StreamedTurn = Callable[[Callable[[str], None]], Awaitable[Response]]
+
+
+def _line(payload: Dict[str, Any]) -> bytes:
+    return dumps(payload) + b"\n"
+
+
+def ndjson_turn(run_turn: StreamedTurn) -> StreamingResponse:
+    """
+    A chat turn as newline-delimited JSON: a {"type": "segment", "text": ...} line
+    for each reply segment as soon as its stage finishes, then one
+    {"type": "done", ...} line with the /chat response fields (the full reply,
+    session id, context delta, letter id), or {"type": "error", "status": ...}.
+    """
+    return StreamingResponse(_lines(run_turn), media_type=NDJSON_MEDIA_TYPE,
+                             headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"})
+
+
+async def _lines(run_turn: StreamedTurn) -> AsyncIterator[bytes]:
+    loop = asyncio.get_running_loop()
+    segments: "asyncio.Queue[str]" = asyncio.Queue()
+
+    def on_reply(segment: str):
+        loop.call_soon_threadsafe(segments.put_nowait, segment)
+
+    started = time.perf_counter()
+    turn = asyncio.ensure_future(run_turn(on_reply))
+    # A client that hangs up doesn't cancel the turn: it finishes and its session is saved
+    turn.add_done_callback(lambda task: task.cancelled() or task.exception())
+    first = True
+    while True:
+        next_segment = asyncio.ensure_future(segments.get())
+        await asyncio.wait({next_segment, turn}, return_when=asyncio.FIRST_COMPLETED)
+        if not next_segment.done():
+            next_segment.cancel()
+            break
+        if first:
+            metrics_registry.observe("chat_stream.first_segment_ms", (time.perf_counter() - started) * 1000.0)
+            first = False
+        yield _line({"type": "segment", "text": next_segment.result()})
+    # Segments queued just before the turn returned
+    while not segments.empty():
+        yield _line({"type": "segment", "text": segments.get_nowait()})
+
+    try:
+        response = turn.result()
+    except ExecutorBusy as e:
+        yield _line({"type": "error", "status": 503, "error": str(e), "retry_after": 1})
+        return
+    except Exception as e:
+        # The 200 status line has gone out already, so the failure is reported in the stream
+        traceback.print_exc()
+        yield _line({"type": "error", "status": 500, "error": str(e)})
+        return
+    metrics_registry.observe("chat_stream.turn_ms", (time.perf_counter() - started) * 1000.0)
+    body = json.loads(response.body)
+    if response.status_code != 200:
+        yield _line({"type": "error", "status": response.status_code, **body})
+        return
+    yield _line({"type": "done", **body})
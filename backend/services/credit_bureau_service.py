@@ -1,23 +1,19 @@
-import json
-import os
-from typing import Optional
+from typing import Any, Dict, List, Optional
 from services.crm_service import CRMService
-
-CUSTOMERS_FILE = os.path.join(os.path.dirname(__file__), "..", "data", "customers.json")
+from services.reference_data import reference_data
 
 class CreditBureauService:
     def __init__(self, crm_service: CRMService):
         self.crm_service = crm_service
-        self.customers: list = []
-        self.load_customers()
-    
+
+    @property
+    def customers(self) -> List[Dict[str, Any]]:
+        """All customers, parsed once per process (see ReferenceData)"""
+        return reference_data.get("customers", [])
+
     def load_customers(self):
-        """Load customer data from JSON file"""
-        if os.path.exists(CUSTOMERS_FILE):
-            with open(CUSTOMERS_FILE, 'r') as f:
-                self.customers = json.load(f)
-        else:
-            self.customers = []
+        """Re-read customers.json after it was rewritten"""
+        reference_data.reload("customers", [])
     
     def get_score_by_pan(self, pan: str) -> Optional[int]:
         """Get credit score by PAN number"""
@@ -33,15 +29,15 @@ class CreditBureauService:
             return None
         
         # Get credit score from customers.json
-        customer = next((c for c in self.customers if c.get("customer_id") == customer_id), None)
+        customer = reference_data.customer(customer_id)
         return customer.get("credit_score") if customer else None
     
     def get_score_by_customer(self, customer_id: str) -> Optional[int]:
         """Get credit score by customer ID"""
-        customer = next((c for c in self.customers if c.get("customer_id") == customer_id), None)
+        customer = reference_data.customer(customer_id)
         return customer.get("credit_score") if customer else None
     
     def get_customer_data(self, customer_id: str) -> Optional[dict]:
         """Get full customer data"""
-        return next((c for c in self.customers if c.get("customer_id") == customer_id), None)
+        return reference_data.customer(customer_id)
 
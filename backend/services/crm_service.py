@@ -1,21 +1,16 @@
-import json
-import os
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List
 
-KYC_FILE = os.path.join(os.path.dirname(__file__), "..", "data", "kyc.json")
+from services.reference_data import reference_data
 
 class CRMService:
-    def __init__(self):
-        self.kyc_records: list = []
-        self.load_kyc()
-    
+    @property
+    def kyc_records(self) -> List[Dict[str, Any]]:
+        """KYC master records, parsed once per process (see ReferenceData)"""
+        return reference_data.get("kyc", [])
+
     def load_kyc(self):
-        """Load KYC records from JSON file"""
-        if os.path.exists(KYC_FILE):
-            with open(KYC_FILE, 'r') as f:
-                self.kyc_records = json.load(f)
-        else:
-            self.kyc_records = []
+        """Re-read kyc.json after it was rewritten"""
+        reference_data.reload("kyc", [])
     
     def get_kyc(self, customer_id: str) -> Optional[Dict[str, Any]]:
         """Get KYC status for a specific customer"""
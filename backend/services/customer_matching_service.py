@@ -1,24 +1,19 @@
-import json
-import os
-from typing import Optional, Dict, Any
 import uuid
+from typing import Optional, Dict, Any, List
 
-CUSTOMERS_FILE = os.path.join(os.path.dirname(__file__), "..", "data", "customers.json")
+from services.reference_data import reference_data
 
 class CustomerMatchingService:
     """Service to find customers by name and mobile number"""
     
-    def __init__(self):
-        self.customers: list = []
-        self.load_customers()
-    
+    @property
+    def customers(self) -> List[Dict[str, Any]]:
+        """All customers, parsed once per process (see ReferenceData)"""
+        return reference_data.get("customers", [])
+
     def load_customers(self):
-        """Load customers from JSON file"""
-        if os.path.exists(CUSTOMERS_FILE):
-            with open(CUSTOMERS_FILE, 'r') as f:
-                self.customers = json.load(f)
-        else:
-            self.customers = []
+        """Re-read customers.json after it was rewritten"""
+        reference_data.reload("customers", [])
     
     def find_customer(self, name: str, mobile: str) -> Optional[Dict[str, Any]]:
         """
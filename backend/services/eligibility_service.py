@@ -1,9 +1,8 @@
-import json
-import os
 import math
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List
+
+from services.reference_data import reference_data
 
-POLICIES_FILE = os.path.join(os.path.dirname(__file__), "..", "data", "policies.json")
 
 def calculate_emi(principal: float, annual_rate: float, months: int) -> float:
     """Calculate EMI using standard formula"""
@@ -20,17 +19,14 @@ def calculate_emi(principal: float, annual_rate: float, months: int) -> float:
 class EligibilityService:
     """Service to evaluate loan eligibility based on policies"""
     
-    def __init__(self):
-        self.policies: list = []
-        self.load_policies()
-    
+    @property
+    def policies(self) -> List[Dict[str, Any]]:
+        """Eligibility policies, parsed once per process (see ReferenceData)"""
+        return reference_data.get("policies", [])
+
     def load_policies(self):
-        """Load policies from JSON file"""
-        if os.path.exists(POLICIES_FILE):
-            with open(POLICIES_FILE, 'r') as f:
-                self.policies = json.load(f)
-        else:
-            self.policies = []
+        """Re-read policies.json after it was rewritten"""
+        reference_data.reload("policies", [])
     
     def get_policy_value(self, policy_name: str, config_key: str, default=None):
         """Get a specific policy configuration value"""
@@ -0,0 +1,151 @@
+import re
+import time
+from functools import lru_cache
+from typing import NamedTuple, Optional, Tuple
+
+# One pass over the message: a mobile number, or a number with an optional
+# currency prefix and unit suffix. Digits glued to letters (IFSC codes, PAN) are skipped.
+TOKEN_RE = re.compile(
+    r"(?P<mobile>(?:\+91[\s-]?)?(?<!\d)\d{5}[\s-]?\d{5}(?!\d))"
+    r"|(?:(?P<currency>₹|\brs\.?|\binr)\s*|(?<![A-Za-z0-9.]))"
+    r"(?P<number>\d[\d,]*(?:\.\d+)?)\s*"
+    r"(?P<unit>lakhs?|lacs?|l|crores?|cr|thousand|k|years?|yrs?|months?|mon|mos?)?(?![A-Za-z])",
+    re.IGNORECASE,
+)
+
+MONEY_UNITS = {
+    "lakh": 100000, "lakhs": 100000, "lac": 100000, "lacs": 100000, "l": 100000,
+    "crore": 10000000, "crores": 10000000, "cr": 10000000,
+    "thousand": 1000, "k": 1000,
+}
+YEAR_UNITS = {"year", "years", "yr", "yrs"}
+MONTH_UNITS = {"month", "months", "mon", "mo", "mos"}
+STANDARD_TENURES = {12, 24, 36, 48, 60}
+
+
+class Entities(NamedTuple):
+    amount: Optional[float]         # loan amount, with lakh/crore/thousand multipliers
+    tenure_months: Optional[int]    # "3 years", "36 months", or a bare standard tenure
+    mobile: Optional[str]           # 10 digits, +91 prefix and separators removed
+    income: Optional[float]         # first money figure (incomes, EMIs)
+    numbers: Tuple[float, ...]      # every number as written, in order
+
+
+@lru_cache(maxsize=4096)
+def extract_entities(text: str) -> Entities:
+    """All entities in a message from a single scan (cached: agents often re-read the same turn)"""
+    unit_amount = currency_amount = bare_amount = range_amount = None
+    year_tenure = month_tenure = bare_tenure = None
+    mobile = income = None
+    numbers = []
+    for match in TOKEN_RE.finditer(text or ""):
+        if match.group("mobile"):
+            if mobile is None:
+                digits = re.sub(r"\D", "", match.group("mobile"))
+                mobile = digits[-10:]
+            continue
+        raw = match.group("number").replace(",", "")
+        try:
+            value = float(raw)
+        except ValueError:
+            continue
+        numbers.append(value)
+        unit = (match.group("unit") or "").lower()
+        if unit in MONEY_UNITS:
+            value *= MONEY_UNITS[unit]
+            if unit_amount is None:
+                unit_amount = value
+        elif unit in YEAR_UNITS:
+            if year_tenure is None:
+                year_tenure = int(value * 12)
+            continue
+        elif unit in MONTH_UNITS:
+            if month_tenure is None:
+                month_tenure = int(value)
+            continue
+        elif match.group("currency"):
+            if currency_amount is None:
+                currency_amount = value
+        else:
+            if bare_amount is None and "." not in raw and 4 <= len(raw) <= 7:
+                bare_amount = value
+            if range_amount is None and 10000 <= value <= 10000000:
+                range_amount = value
+            if bare_tenure is None and value in STANDARD_TENURES:
+                bare_tenure = int(value)
+        if income is None:
+            income = value
+    amount = next((a for a in (unit_amount, currency_amount, bare_amount, range_amount) if a is not None), None)
+    tenure = next((t for t in (year_tenure, month_tenure, bare_tenure) if t is not None), None)
+    return Entities(amount, tenure, mobile, income, tuple(numbers))
+
+
+SAMPLE_MESSAGES = [
+    "3 lakh", "I need a loan of ₹3,00,000 please", "1.5 lakh", "2 crore", "50k", "300000",
+    "36", "3 years", "24 months", "9876543210", "+91 98765-43210", "my income is 65,000 per month",
+    "₹50,000", "none", "confirm", "12 MG Road Mumbai 400001", "HDFC0001234", "123456789012",
+]
+
+
+def _legacy_extract(text: str):
+    """Pre-extractor per-agent patterns, kept only as the benchmark baseline"""
+    amount = None
+    for pattern in [r'(\d+)\s*(?:lakh|lac|L)', r'(\d+)\s*(?:thousand|k|K)', r'₹\s*(\d+)', r'(\d{4,7})']:
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            amount = float(match.group(1))
+            if 'lakh' in text.lower() or 'lac' in text.lower():
+                amount *= 100000
+            elif 'thousand' in text.lower() or 'k' in text.lower():
+                amount *= 1000
+            break
+    tenure = None
+    for pattern in [r'(\d+)\s*(?:year|years|yr|yrs)', r'(\d+)\s*(?:month|months|mon)']:
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            tenure = int(match.group(1)) * (12 if 'year' in text.lower() or 'yr' in text.lower() else 1)
+            break
+    mobile = None
+    for pattern in [r'(\d{10})', r'(\d{5}[\s-]?\d{5})', r'\+91[\s-]?(\d{10})']:
+        match = re.search(pattern, text)
+        if match:
+            mobile = match.group(1)
+            break
+    numbers = re.findall(r'\d+', text.replace(",", ""))
+    return amount, tenure, mobile, numbers
+
+
+def main():
+    """Micro-benchmark, run from backend/: python -m services.entity_extractor [--rounds N]"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Per-message cost of entity extraction")
+    parser.add_argument("--rounds", type=int, default=2000)
+    args = parser.parse_args()
+    messages = SAMPLE_MESSAGES * args.rounds
+
+    started = time.perf_counter()
+    for message in messages:
+        _legacy_extract(message)
+    legacy_us = (time.perf_counter() - started) / len(messages) * 1e6
+
+    started = time.perf_counter()
+    for message in messages:
+        extract_entities.__wrapped__(message)
+    single_pass_us = (time.perf_counter() - started) / len(messages) * 1e6
+
+    started = time.perf_counter()
+    for message in messages:
+        extract_entities(message)
+    cached_us = (time.perf_counter() - started) / len(messages) * 1e6
+
+    print(f"[EntityExtractor] {len(messages):,} messages")
+    print(f"  per-agent patterns (before): {legacy_us:.2f} us/message")
+    print(f"  single pass (after):         {single_pass_us:.2f} us/message")
+    print(f"  single pass, cached:         {cached_us:.2f} us/message")
+    for message in SAMPLE_MESSAGES:
+        print(f"  {message!r:42} -> {extract_entities(message)}")
+
+
+if __name__ == "__main__":
+    main()
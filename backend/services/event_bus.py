@@ -1,29 +1,30 @@
-import json
-import os
+import threading
 from datetime import datetime
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
+
+from services.state_backend import StateBackend, get_state_backend
 
-EVENTS_FILE = os.path.join(os.path.dirname(__file__), "..", "data", "events.json")
 
 class EventBus:
-    def __init__(self):
-        self.events: List[Dict[str, Any]] = []
-        self.load_events()
-    
-    def load_events(self):
-        """Load events from file if it exists"""
-        if os.path.exists(EVENTS_FILE):
-            try:
-                with open(EVENTS_FILE, 'r') as f:
-                    self.events = json.load(f)
-            except:
-                self.events = []
-    
-    def save_events(self):
-        """Save events to file"""
-        os.makedirs(os.path.dirname(EVENTS_FILE), exist_ok=True)
-        with open(EVENTS_FILE, 'w') as f:
-            json.dump(self.events, f, indent=2)
+    def __init__(self, writer: Optional[Any] = None, backend: Optional[StateBackend] = None):
+        # Events are stored as the "events" document (data/events.json with the file backend),
+        # shared with every other worker process
+        self.backend = backend or get_state_backend()
+        self._pending: List[Dict[str, Any]] = []
+        # Background sanction workers publish too; keep batches from interleaving
+        self._lock = threading.Lock()
+        # With a writer (a BoundedExecutor) events are stored behind the request,
+        # coalescing events published while a write is pending
+        self._writer = writer
+        self._flush_pending = False
+        self._write_lock = threading.Lock()
+
+    @property
+    def events(self) -> List[Dict[str, Any]]:
+        """Stored events from every worker, plus this process's not yet flushed ones"""
+        with self._lock:
+            pending = list(self._pending)
+        return self.backend.read("events", []) + pending
     
     def publish_event(self, event_type: str, payload: Dict[str, Any], customer_id: str):
         """Publish an event to the event bus"""
@@ -33,11 +34,41 @@ class EventBus:
             "event_type": event_type,
             "payload": payload
         }
-        self.events.append(event)
-        self.save_events()
+        with self._lock:
+            self._pending.append(event)
+            schedule = self._writer is not None and not self._flush_pending
+            if schedule:
+                self._flush_pending = True
+        if self._writer is None:
+            self.flush()
+        elif schedule:
+            self._schedule_flush()
         print(f"[EventBus] Published {event_type} for customer {customer_id}")
         return event
     
+    def _schedule_flush(self):
+        try:
+            self._writer.submit(self.flush)
+        except Exception:
+            # Writer saturated or shut down: persist inline rather than lose events
+            self.flush()
+
+    def flush(self):
+        """Append events published since the last flush to the shared store"""
+        # The write lock keeps batches landing in publish order
+        with self._write_lock:
+            with self._lock:
+                self._flush_pending = False
+                batch, self._pending = self._pending, []
+            if not batch:
+                return
+            try:
+                self.backend.mutate("events", lambda events: events.extend(batch), [])
+            except Exception:
+                with self._lock:
+                    self._pending[:0] = batch
+                raise
+    
     def get_events_by_customer(self, customer_id: str) -> List[Dict[str, Any]]:
         """Get all events for a specific customer"""
         return [e for e in self.events if e.get("customer_id") == customer_id]
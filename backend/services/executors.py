@@ -0,0 +1,127 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+from services.metrics import registry as metrics_registry
+
+# Default (workers, queue limit) per kind of blocking work; override with
+# EXECUTOR_<NAME>_WORKERS / EXECUTOR_<NAME>_QUEUE
+DEFAULT_SIZES = {
+    "engine": (8, 64),   # agent turns (JSON lookups, loans.json writes)
+    "disk": (2, 256),    # write-behind persistence such as events.json
+    "llm": (8, 32),      # OpenAI reply rewriting
+    "email": (2, 32),    # OTP emails
+}
+
+
+class ExecutorBusy(RuntimeError):
+    """Raised when an executor's queue is full; the API answers 503"""
+
+
+class BoundedExecutor:
+    """
+    Thread pool for one kind of blocking work, with a cap on queued tasks so a
+    slow dependency backs up its own pool instead of the whole server.
+    Records how long tasks waited for a thread and how long they ran.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int):
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"{name}-exec")
+        self._lock = threading.Lock()
+        self.running = 0
+        self.queued = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def submit(self, fn: Callable[..., Any], *args, **kwargs) -> Future:
+        """Queue fn on this pool; raises ExecutorBusy if too many tasks are already waiting"""
+        with self._lock:
+            if self.queued + self.running >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                metrics_registry.incr(f"executor.{self.name}.rejected")
+                raise ExecutorBusy(f"{self.name} executor is saturated")
+            self.queued += 1
+        submitted = time.perf_counter()
+
+        def task():
+            started = time.perf_counter()
+            with self._lock:
+                self.queued -= 1
+                self.running += 1
+            metrics_registry.observe(f"executor.{self.name}.queue_wait_ms", (started - submitted) * 1000.0)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                metrics_registry.observe(f"executor.{self.name}.run_ms", (time.perf_counter() - started) * 1000.0)
+                with self._lock:
+                    self.running -= 1
+                    self.completed += 1
+
+        try:
+            return self._pool.submit(task)
+        except RuntimeError:
+            with self._lock:
+                self.queued -= 1
+            raise
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Await fn on this pool from async code"""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "running": self.running,
+                "queued": self.queued,
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
+
+    def shutdown(self, wait: bool = True):
+        self._pool.shutdown(wait=wait)
+
+
+class ExecutorRegistry:
+    """Named executors, created on first use and sized from the environment"""
+
+    def __init__(self):
+        self._executors: Dict[str, BoundedExecutor] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> BoundedExecutor:
+        with self._lock:
+            executor = self._executors.get(name)
+            if executor is None:
+                workers, queue = DEFAULT_SIZES.get(name, (4, 64))
+                executor = BoundedExecutor(
+                    name,
+                    int(os.getenv(f"EXECUTOR_{name.upper()}_WORKERS", workers)),
+                    int(os.getenv(f"EXECUTOR_{name.upper()}_QUEUE", queue)),
+                )
+                self._executors[name] = executor
+            return executor
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            executors = dict(self._executors)
+        return {name: executor.stats() for name, executor in executors.items()}
+
+    def shutdown(self, wait: bool = True):
+        """Stop every pool, by default letting queued work (e.g. pending writes) finish"""
+        with self._lock:
+            executors = list(self._executors.values())
+            self._executors.clear()
+        for executor in executors:
+            executor.shutdown(wait=wait)
+
+
+# Shared by every service in the process
+executors = ExecutorRegistry()
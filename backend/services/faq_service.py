@@ -0,0 +1,111 @@
+import json
+import math
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.lru_cache import LRUCache
+from services.reference_data import reference_data
+
+FAQS_FILE = os.path.join(os.path.dirname(__file__), "..", "data", "faqs.json")
+
+TOKEN_RE = re.compile(r"[a-z]+")
+# Words of three letters or fewer ("can", "the", "how") carry no signal in these questions
+MIN_TOKEN_LEN = 4
+
+_MISS = object()
+
+
+def _stem(word: str) -> str:
+    """Fold simple plurals so "documents" and "document" index together"""
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith("s") and not word.endswith("ss") and len(word) > MIN_TOKEN_LEN:
+        return word[:-1]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    return [_stem(w) for w in TOKEN_RE.findall((text or "").lower()) if len(w) >= MIN_TOKEN_LEN]
+
+
+class FAQService:
+    """
+    FAQ retrieval shared by the agents that answer Help questions.
+
+    Questions are tokenized once into an inverted index with precomputed BM25
+    term weights, so a lookup only touches the postings of the query's terms.
+    Answers (including "no answer") are cached per normalized query.
+    """
+
+    def __init__(self, faqs_file: str = FAQS_FILE, faqs: Optional[List[Dict[str, Any]]] = None,
+                 k1: float = 1.5, b: float = 0.75, cache_size: int = 4096):
+        self.k1 = k1
+        self.b = b
+        self.cache = LRUCache(cache_size)
+        self.faqs: List[Dict[str, Any]] = faqs if faqs is not None else self._load(faqs_file)
+        self._build_index()
+
+    @staticmethod
+    def _load(faqs_file: str) -> List[Dict[str, Any]]:
+        if os.path.abspath(faqs_file) == os.path.abspath(FAQS_FILE):
+            return reference_data.get("faqs", [])
+        try:
+            if os.path.exists(faqs_file):
+                with open(faqs_file, "r", encoding="utf-8") as f:
+                    return json.load(f)
+        except Exception:
+            pass
+        return []
+
+    def _build_index(self):
+        docs = [tokenize(item.get("q") or "") if item.get("a") else [] for item in self.faqs]
+        n = len(docs)
+        avgdl = (sum(len(d) for d in docs) / n) if n else 0.0
+        term_docs: Dict[str, Dict[int, int]] = {}
+        for doc_id, tokens in enumerate(docs):
+            for token in tokens:
+                tfs = term_docs.setdefault(token, {})
+                tfs[doc_id] = tfs.get(doc_id, 0) + 1
+        # term -> [(doc_id, bm25 weight)]
+        self.postings: Dict[str, List[Tuple[int, float]]] = {}
+        for token, tfs in term_docs.items():
+            idf = math.log(1 + (n - len(tfs) + 0.5) / (len(tfs) + 0.5))
+            self.postings[token] = [
+                (doc_id, idf * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * len(docs[doc_id]) / avgdl)))
+                for doc_id, tf in tfs.items()
+            ]
+        self.cache.clear()
+
+    def search(self, query: str, limit: int = 3) -> List[Tuple[float, Dict[str, Any]]]:
+        """Best matching FAQs for a query, highest BM25 score first (ties keep file order)"""
+        scores: Dict[int, float] = {}
+        for token in set(tokenize(query)):
+            for doc_id, weight in self.postings.get(token, ()):
+                scores[doc_id] = scores.get(doc_id, 0.0) + weight
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+        return [(round(score, 4), self.faqs[doc_id]) for doc_id, score in ranked]
+
+    def answer(self, query: str) -> Optional[str]:
+        """Answer of the best matching FAQ, or None if no question shares a term with the query"""
+        key = tuple(sorted(set(tokenize(query))))
+        if not key:
+            return None
+        cached = self.cache.get(key, _MISS)
+        if cached is not _MISS:
+            return cached
+        hits = self.search(query, limit=1)
+        answer = (hits[0][1].get("a") or None) if hits else None
+        self.cache.put(key, answer)
+        return answer
+
+    def answer_mentioning(self, word: str) -> Optional[str]:
+        """Answer of the first FAQ whose question contains word (e.g. "emi")"""
+        word = word.lower()
+        for item in self.faqs:
+            if word in (item.get("q") or "").lower():
+                return item.get("a") or None
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"faqs": len(self.faqs), "terms": len(self.postings), "cache": self.cache.stats()}
@@ -0,0 +1,129 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, NamedTuple, Optional, Tuple
+
+from fastapi.responses import JSONResponse, Response
+
+from services.metrics import registry as metrics_registry
+
+DEFAULT_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "600"))
+DEFAULT_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+REPLAY_HEADER = "Idempotent-Replayed"
+
+
+class StoredResponse(NamedTuple):
+    fingerprint: str
+    status_code: int
+    body: bytes
+    media_type: Optional[str]
+
+
+def request_fingerprint(payload: Any) -> str:
+    """Hash of a request body, so a reused key with a different request is caught"""
+    encoded = json.dumps(payload, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class IdempotencyCache:
+    """
+    Responses of completed requests keyed by the client's Idempotency-Key.
+
+    A retried request (same key, same body) gets the stored response back instead
+    of running the turn again; a retry that arrives while the original is still
+    running waits for it. Only successful responses are kept, so a 404 or 503 can
+    be retried for real. Entries expire after ttl_seconds and the oldest are
+    dropped beyond max_entries.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._responses: "OrderedDict[str, Tuple[float, StoredResponse]]" = OrderedDict()
+        # Only touched from the event loop, so no lock is needed
+        self._in_flight: Dict[str, "asyncio.Future[Optional[StoredResponse]]"] = {}
+        self.replayed = 0
+        self.executed = 0
+        self.mismatched = 0
+
+    def _lookup(self, key: str) -> Optional[StoredResponse]:
+        entry = self._responses.get(key)
+        if entry is None:
+            return None
+        expires_at, stored = entry
+        if expires_at <= time.time():
+            del self._responses[key]
+            return None
+        return stored
+
+    def _store(self, key: str, stored: StoredResponse):
+        self._responses[key] = (time.time() + self.ttl_seconds, stored)
+        self._responses.move_to_end(key)
+        while len(self._responses) > self.max_entries:
+            self._responses.popitem(last=False)
+
+    def _replay(self, stored: StoredResponse, fingerprint: str) -> Response:
+        if stored.fingerprint != fingerprint:
+            self.mismatched += 1
+            return JSONResponse({"error": "Idempotency-Key was already used for a different request"},
+                                status_code=422)
+        self.replayed += 1
+        metrics_registry.incr("idempotency.replayed")
+        return Response(stored.body, status_code=stored.status_code, media_type=stored.media_type,
+                        headers={REPLAY_HEADER: "true"})
+
+    async def run(self, key: str, fingerprint: str, handler: Callable[[], Awaitable[Response]]) -> Response:
+        """Return the stored response for key, or run handler once and store its response"""
+        stored = self._lookup(key)
+        if stored is not None:
+            return self._replay(stored, fingerprint)
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            try:
+                stored = await asyncio.shield(in_flight)
+            except asyncio.CancelledError:
+                if not in_flight.cancelled():
+                    raise  # this request itself was cancelled
+                stored = None
+            except Exception:
+                stored = None
+            if stored is not None:
+                return self._replay(stored, fingerprint)
+            # The original failed; this retry runs the request itself
+            return await self.run(key, fingerprint, handler)
+
+        future: "asyncio.Future[Optional[StoredResponse]]" = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            response = await handler()
+            self.executed += 1
+            stored = None
+            if 200 <= response.status_code < 300:
+                stored = StoredResponse(fingerprint, response.status_code, bytes(response.body), response.media_type)
+                self._store(key, stored)
+            future.set_result(stored)
+            return response
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as exc:
+            future.set_exception(exc)
+            # Nobody may be waiting; don't let the loop log an unretrieved exception
+            future.exception()
+            raise
+        finally:
+            self._in_flight.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._responses),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "in_flight": len(self._in_flight),
+            "executed": self.executed,
+            "replayed": self.replayed,
+            "mismatched": self.mismatched,
+        }
@@ -1,33 +1,19 @@
-import json
-import os
 from typing import Dict, Any, List, Optional
 from datetime import datetime
 
-KYC_FILE = os.path.join(os.path.dirname(__file__), "..", "data", "kyc.json")
+from services.state_backend import StateBackend, get_state_backend
 
 class KYCDocumentService:
     """Service to manage KYC document uploads"""
     
-    def __init__(self):
-        self.kyc_records: list = []
-        self.load_kyc()
-    
-    def load_kyc(self):
-        """Load KYC records from JSON file"""
-        if os.path.exists(KYC_FILE):
-            try:
-                with open(KYC_FILE, 'r') as f:
-                    self.kyc_records = json.load(f)
-            except:
-                self.kyc_records = []
-        else:
-            self.kyc_records = []
-    
-    def save_kyc(self):
-        """Save KYC records to JSON file"""
-        os.makedirs(os.path.dirname(KYC_FILE), exist_ok=True)
-        with open(KYC_FILE, 'w') as f:
-            json.dump(self.kyc_records, f, indent=2)
+    def __init__(self, backend: Optional[StateBackend] = None):
+        # Records are the "kyc" document (data/kyc.json with the file backend), shared between workers
+        self.backend = backend or get_state_backend()
+
+    @property
+    def kyc_records(self) -> List[Dict[str, Any]]:
+        """All KYC records, as currently stored"""
+        return self.backend.read("kyc", [])
     
     def upload_document(self,
                        customer_id: str,
@@ -46,8 +32,7 @@ class KYCDocumentService:
             "uploaded_at": datetime.now().isoformat()
         }
         
-        self.kyc_records.append(kyc_record)
-        self.save_kyc()
+        self.backend.mutate("kyc", lambda records: records.append(kyc_record), [])
         return kyc_record
     
     def get_uploaded_documents(self, session_id: str) -> List[Dict[str, Any]]:
@@ -0,0 +1,51 @@
+import os
+import threading
+from typing import Union
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+
+def write_atomic(path: str, data: Buffer):
+    """Write bytes to a temp file and swap it in, so readers never see a partial file"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    # Per thread too: with inline rendering, two job threads can store the same letter at once
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class LetterSink:
+    """
+    Destination for a rendered letter.
+
+    Renderers serialize the PDF exactly once and pass the buffer here; write()
+    persists it and returns the location the letter can be served from.
+    Sinks cross process boundaries, so keep their state picklable.
+    """
+
+    def write(self, data: Buffer) -> str:
+        raise NotImplementedError
+
+
+class FileSink(LetterSink):
+    """Write the letter to a fixed path"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def write(self, data: Buffer) -> str:
+        write_atomic(self.path, data)
+        return self.path
+
+
+def as_sink(target: Union[str, LetterSink]) -> LetterSink:
+    """Accept either a plain file path or a sink"""
+    return target if isinstance(target, LetterSink) else FileSink(target)
@@ -1,35 +1,44 @@
-import json
 import os
 from datetime import datetime
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
+
+from services.metrics import registry as metrics_registry
+from services.state_backend import FileStateBackend, StateBackend, get_state_backend
 
 LOANS_FILE = os.path.join(os.path.dirname(__file__), "..", "data", "loans.json")
 
 class LoansService:
     """Service to manage approved loans"""
-    
-    def __init__(self):
-        self.loans: list = []
-        self.load_loans()
-    
-    def load_loans(self):
-        """Load loans from JSON file"""
-        if os.path.exists(LOANS_FILE):
-            try:
-                with open(LOANS_FILE, 'r') as f:
-                    self.loans = json.load(f)
-            except:
-                self.loans = []
-        else:
-            self.loans = []
-    
-    def save_loans(self):
-        """Save loans to JSON file"""
-        os.makedirs(os.path.dirname(LOANS_FILE), exist_ok=True)
-        with open(LOANS_FILE, 'w') as f:
-            json.dump(self.loans, f, indent=2)
-    
-    def create_loan(self, 
+
+    def __init__(self, loans_file: str = LOANS_FILE, backend: Optional[StateBackend] = None):
+        self.loans_file = loans_file
+        if backend is None:
+            # Another loans file (e.g. the regeneration CLI's --loans) is used directly
+            same_file = os.path.abspath(loans_file) == os.path.abspath(LOANS_FILE)
+            backend = get_state_backend() if same_file else FileStateBackend(paths={"loans": loans_file})
+        # Loans are the "loans" document, shared with every other worker process
+        self.backend = backend
+        # (session_id, approval_type) -> loan, so a replayed turn can't approve the same session twice;
+        # rebuilt whenever the backend hands back a different list (another worker wrote)
+        self._by_session: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._indexed: Optional[List[Dict[str, Any]]] = None
+
+    @property
+    def loans(self) -> List[Dict[str, Any]]:
+        """All loans, as currently stored"""
+        return self.backend.read("loans", [])
+
+    def _session_index(self, loans: List[Dict[str, Any]]) -> Dict[Tuple[str, str], Dict[str, Any]]:
+        if self._indexed is not loans:
+            self._by_session = {}
+            for loan in loans:
+                if loan.get("session_id"):
+                    # First record wins, like get_loan_by_session
+                    self._by_session.setdefault((loan["session_id"], loan.get("approval_type")), loan)
+            self._indexed = loans
+        return self._by_session
+
+    def create_loan(self,
                    customer_id: str,
                    customer_name: str,
                    session_id: str,
@@ -39,10 +48,11 @@ class LoansService:
                    approval_type: str,  # "preapproved_instant" or "evaluated"
                    emi: float = None) -> Dict[str, Any]:
         """
-        Create a new loan record
+        Create a new loan record. A session gets at most one loan per approval type:
+        a repeated call (client retry, replayed turn) returns the existing loan.
         """
         loan = {
-            "loan_id": f"LOAN_{len(self.loans) + 1:04d}",
+            "loan_id": None,  # assigned below, under the backend's lock
             "customer_id": customer_id,
             "customer_name": customer_name,
             "session_id": session_id,
@@ -55,19 +65,43 @@ class LoansService:
             "approved_date": datetime.now().isoformat(),
             "sanction_letter_path": None
         }
-        
-        self.loans.append(loan)
-        self.save_loans()
-        return loan
-    
+
+        def append(loans: List[Dict[str, Any]]) -> Dict[str, Any]:
+            index = self._session_index(loans)
+            existing = index.get((session_id, approval_type)) if session_id else None
+            if existing is not None:
+                metrics_registry.incr("loans.deduplicated")
+                return existing
+            loan["loan_id"] = f"LOAN_{len(loans) + 1:04d}"
+            loans.append(loan)
+            if session_id:
+                index[(session_id, approval_type)] = loan
+            return loan
+
+        return self.backend.mutate("loans", append, [])
+
     def get_loan_by_session(self, session_id: str) -> Dict[str, Any]:
         """Get loan by session ID"""
         return next((l for l in self.loans if l.get("session_id") == session_id), None)
-    
+
     def update_sanction_letter_path(self, session_id: str, pdf_path: str):
         """Update sanction letter path for a loan"""
-        loan = self.get_loan_by_session(session_id)
-        if loan:
-            loan["sanction_letter_path"] = pdf_path
-            self.save_loans()
+        def update(loans: List[Dict[str, Any]]):
+            loan = next((l for l in loans if l.get("session_id") == session_id), None)
+            if loan:
+                loan["sanction_letter_path"] = pdf_path
+
+        self.backend.mutate("loans", update, [])
+
+    def update_sanction_letter_paths(self, paths_by_loan_id: Dict[str, str]) -> int:
+        """Record many regenerated letters with a single write; returns how many loans changed"""
+        def update(loans: List[Dict[str, Any]]) -> int:
+            updated = 0
+            for loan in loans:
+                path = paths_by_loan_id.get(loan.get("loan_id"))
+                if path and loan.get("sanction_letter_path") != path:
+                    loan["sanction_letter_path"] = path
+                    updated += 1
+            return updated
 
+        return self.backend.mutate("loans", update, [])
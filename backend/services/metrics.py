@@ -0,0 +1,61 @@
+import threading
+from collections import deque
+from typing import Any, Deque, Dict
+
+WINDOW_SIZE = 1024
+
+
+class MetricsRegistry:
+    """
+    In-process timing and counter registry.
+    Keeps a rolling window of recent observations per metric for percentiles.
+    """
+
+    def __init__(self, window: int = WINDOW_SIZE):
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples: Dict[str, Deque[float]] = {}
+        self._counts: Dict[str, int] = {}
+        self._counters: Dict[str, int] = {}
+
+    def observe(self, name: str, value: float):
+        """Record one observation (e.g. a duration in ms)"""
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = self._samples[name] = deque(maxlen=self.window)
+            samples.append(value)
+            self._counts[name] = self._counts.get(name, 0) + 1
+
+    def incr(self, name: str, amount: int = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Lifetime count, then mean and p50/p95/p99/max over the recent window, for each metric"""
+        with self._lock:
+            samples = {name: sorted(values) for name, values in self._samples.items()}
+            counts = dict(self._counts)
+            counters = dict(self._counters)
+
+        def pct(values, q):
+            return round(values[min(len(values) - 1, int(q * len(values)))], 3)
+
+        timings = {}
+        for name, values in samples.items():
+            if not values:
+                continue
+            timings[name] = {
+                "count": counts[name],
+                # Same samples as the percentiles, so the two agree after a change in load
+                "mean": round(sum(values) / len(values), 3),
+                "p50": pct(values, 0.50),
+                "p95": pct(values, 0.95),
+                "p99": pct(values, 0.99),
+                "max": round(values[-1], 3),
+            }
+        return {"timings": timings, "counters": counters}
+
+
+# Shared by every service in the process
+registry = MetricsRegistry()
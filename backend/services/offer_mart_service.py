@@ -1,21 +1,16 @@
-import json
-import os
 from typing import List, Dict, Any, Optional
 
-OFFERS_FILE = os.path.join(os.path.dirname(__file__), "..", "data", "offers.json")
+from services.reference_data import reference_data
 
 class OfferMartService:
-    def __init__(self):
-        self.offers: List[Dict[str, Any]] = []
-        self.load_offers()
-    
+    @property
+    def offers(self) -> List[Dict[str, Any]]:
+        """All offers, parsed once per process (see ReferenceData)"""
+        return reference_data.get("offers", [])
+
     def load_offers(self):
-        """Load offers from JSON file"""
-        if os.path.exists(OFFERS_FILE):
-            with open(OFFERS_FILE, 'r') as f:
-                self.offers = json.load(f)
-        else:
-            self.offers = []
+        """Re-read offers.json after it was rewritten"""
+        reference_data.reload("offers", [])
     
     def get_offers(self, customer_id: str) -> List[Dict[str, Any]]:
         """Get offers for a specific customer"""
@@ -3,6 +3,8 @@ import random
 import time
 from typing import Optional, Dict
 
+from services.state_backend import StateBackend, get_state_backend
+
 try:
     # Lazy import – optional dependency
     from sendgrid import SendGridAPIClient  # type: ignore
@@ -14,15 +16,17 @@ except Exception:  # pragma: no cover
 
 class OTPService:
     """
-    Simple in-memory OTP service for demo purposes.
+    Simple OTP service for demo purposes.
     - Generates a 6-digit OTP per email
-    - Stores with expiry (default 5 minutes)
+    - Stores with expiry (default 5 minutes) in the shared state backend, so a code
+      sent by one worker process can be verified by another
     - Optionally exposes OTP in response for local demos if DEMO_EXPOSE_OTP=true
     """
 
-    def __init__(self, ttl_seconds: int = 300):
+    def __init__(self, ttl_seconds: int = 300, backend: Optional[StateBackend] = None):
         self.ttl = ttl_seconds
-        self._store: Dict[str, Dict[str, float]] = {}
+        # email -> {"code", "expires"}, as the "otps" document
+        self.backend = backend or get_state_backend()
         self._expose_demo = os.getenv("DEMO_EXPOSE_OTP", "false").lower() in ("1", "true", "yes")
         # Email config
         self.sg_api_key = os.getenv("SENDGRID_API_KEY")
@@ -34,7 +38,15 @@ class OTPService:
 
     def generate_otp(self, email: str) -> Dict[str, str]:
         code = f"{random.randint(0, 999999):06d}"
-        self._store[email.lower()] = {"code": code, "expires": self._now() + self.ttl}
+        now = self._now()
+
+        def store(otps: Dict[str, Dict[str, float]]):
+            # Drop codes nobody verified so the document doesn't grow without bound
+            for key in [k for k, rec in otps.items() if rec["expires"] < now]:
+                del otps[key]
+            otps[email.lower()] = {"code": code, "expires": now + self.ttl}
+
+        self.backend.mutate("otps", store, {})
         # Attempt to send via SendGrid if configured
         sent = False
         if self.sg_api_key and self.from_email and SendGridAPIClient and Mail:
@@ -67,18 +79,26 @@ class OTPService:
         return resp
 
     def verify_otp(self, email: str, code: str) -> bool:
-        rec = self._store.get(email.lower())
-        if not rec:
+        key = email.lower()
+        if key not in self.backend.read("otps", {}):
             return False
-        if rec["expires"] < self._now():
-            # expired
-            del self._store[email.lower()]
+
+        def check(otps: Dict[str, Dict[str, float]]) -> bool:
+            # Checked and cleared in one step, so two workers can't both accept the same code
+            rec = otps.get(key)
+            if not rec:
+                return False
+            if rec["expires"] < self._now():
+                # expired
+                del otps[key]
+                return False
+            if str(rec["code"]) == str(code).zfill(6):
+                # success, clear
+                del otps[key]
+                return True
             return False
-        if str(rec["code"]) == str(code).zfill(6):
-            # success, clear
-            del self._store[email.lower()]
-            return True
-        return False
+
+        return self.backend.mutate("otps", check, {})
 
     def resend(self, email: str) -> Dict[str, str]:
         return self.generate_otp(email)
@@ -0,0 +1,106 @@
+import os
+import re
+from typing import Iterator, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+
+CHUNK_SIZE = 64 * 1024
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _read_chunks(path: str, start: int, length: int) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single "bytes=a-b" range into inclusive (start, end).
+    Returns None for headers we don't honour (multiple ranges, other units);
+    raises ValueError if the range can't be satisfied.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if first == "" and last == "":
+        return None
+    if first == "":
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError("empty suffix range")
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError("range not satisfiable")
+    return start, end
+
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = [t.strip().removeprefix("W/") for t in header.split(",")]
+    return etag in candidates
+
+
+def pdf_response(request: Request, path: str, letter_id: str, filename: str) -> Response:
+    """
+    Stream a stored PDF with a strong ETag (the content hash), single-range
+    requests and a precompressed gzip variant when the client accepts it.
+    """
+    headers = {
+        "Accept-Ranges": "bytes",
+        # Letters are personal, but a given id never changes
+        "Cache-Control": "private, max-age=31536000, immutable",
+        "Content-Disposition": f'attachment; filename="{filename}"',
+        "Content-Location": f"/sanctions/{letter_id}",
+        "Vary": "Accept-Encoding",
+    }
+    gz_path = f"{path}.gz"
+    range_header = request.headers.get("range")
+    use_gzip = (
+        not range_header
+        and "gzip" in request.headers.get("accept-encoding", "")
+        and os.path.exists(gz_path)
+    )
+    etag = f'"{letter_id}-gzip"' if use_gzip else f'"{letter_id}"'
+    headers["ETag"] = etag
+
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    if use_gzip:
+        size = os.path.getsize(gz_path)
+        headers["Content-Encoding"] = "gzip"
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(_read_chunks(gz_path, 0, size), media_type="application/pdf", headers=headers)
+
+    size = os.path.getsize(path)
+    if range_header and (not request.headers.get("if-range") or _etag_matches(request.headers.get("if-range"), etag)):
+        try:
+            byte_range = _parse_range(range_header, size)
+        except ValueError:
+            headers["Content-Range"] = f"bytes */{size}"
+            return Response(status_code=416, headers=headers)
+        if byte_range:
+            start, end = byte_range
+            length = end - start + 1
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            headers["Content-Length"] = str(length)
+            return StreamingResponse(_read_chunks(path, start, length), status_code=206,
+                                     media_type="application/pdf", headers=headers)
+
+    headers["Content-Length"] = str(size)
+    return StreamingResponse(_read_chunks(path, 0, size), media_type="application/pdf", headers=headers)
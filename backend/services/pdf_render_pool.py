@@ -0,0 +1,214 @@
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from services import sanction_renderer
+from services.metrics import registry
+
+DEFAULT_WORKERS = int(os.getenv("PDF_RENDER_WORKERS", str(min(4, os.cpu_count() or 1))))
+DEFAULT_START_METHOD = os.getenv("PDF_RENDER_START_METHOD", "fork")
+# Replacement workers start from a clean process: by then the API process runs many threads
+DEFAULT_RESTART_METHOD = os.getenv("PDF_RENDER_RESTART_METHOD", "forkserver")
+DEFAULT_TIMEOUT = float(os.getenv("SANCTION_RENDER_TIMEOUT", "30"))
+
+
+def _serve(conn):
+    """Worker process loop: warm up, then render (fn, args) jobs until told to stop"""
+    sanction_renderer.warm_up()
+    conn.send(os.getpid())
+    parent = os.getppid()
+    while True:
+        try:
+            # A forked worker holds copies of the pool's pipe ends, so the pipe alone doesn't
+            # tell it that the API process died; being re-parented does
+            if not conn.poll(1.0):
+                if os.getppid() != parent:
+                    return
+                continue
+            job = conn.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+        render, args = job
+        try:
+            reply = (True, sanction_renderer.timed(render, *args))
+        except Exception as e:
+            reply = (False, e)
+        try:
+            conn.send(reply)
+        except Exception as e:
+            # The result or the exception didn't pickle; report it as a plain error
+            conn.send((False, RuntimeError(f"{type(e).__name__}: {e}")))
+
+
+class _WorkerDied(Exception):
+    pass
+
+
+class _Worker:
+    """One render process and the pipe it takes jobs on; used by one caller at a time"""
+
+    def __init__(self, context):
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=_serve, args=(child,), daemon=True)
+        self.process.start()
+        child.close()
+
+    def ready(self):
+        """Wait for the warm-up to finish"""
+        try:
+            self.conn.recv()
+        except EOFError:
+            raise _WorkerDied()
+
+    def run(self, render: Callable[..., Any], args: tuple, timeout: float) -> Tuple[Any, float]:
+        try:
+            self.conn.send((render, args))
+            # The deadline starts now, when the render does, not when the caller queued up
+            finished = self.conn.poll(timeout)
+            ok, value = self.conn.recv() if finished else (None, None)
+        except (EOFError, OSError):
+            raise _WorkerDied()
+        if not finished:
+            raise TimeoutError(f"PDF render exceeded {timeout:.0f}s")
+        if not ok:
+            raise value
+        return value
+
+    def stop(self, timeout: float = 5.0):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(timeout)
+        self.kill()
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class PdfRenderPool:
+    """
+    Process pool for FPDF rendering.
+
+    Drawing a letter is pure-Python CPU work, so rendering it on a thread holds
+    the GIL and stalls the event loop and the other request threads. Render
+    calls are shipped to warm worker processes instead; workers=0 renders
+    inline (useful for debugging and single-core boxes).
+
+    Each worker serves one render at a time and callers wait for a free one, so
+    the timeout only covers the render itself. A worker that times out or dies
+    is killed and replaced on its own; the other renders carry on.
+    """
+
+    def __init__(self, workers: int = DEFAULT_WORKERS,
+                 start_method: str = DEFAULT_START_METHOD,
+                 timeout: float = DEFAULT_TIMEOUT,
+                 restart_method: str = DEFAULT_RESTART_METHOD):
+        self.workers = max(0, workers)
+        self.timeout = timeout
+        methods = multiprocessing.get_all_start_methods()
+        self.start_method = start_method if start_method in methods else "spawn"
+        self.restart_method = restart_method if restart_method in methods else "spawn"
+        self._lock = threading.Lock()
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        self._all: List[_Worker] = []
+        self._closed = False
+        self.restarts = 0
+        if self.workers:
+            # Start them all now so no chat turn pays for it
+            context = multiprocessing.get_context(self.start_method)
+            started = [_Worker(context) for _ in range(self.workers)]
+            for worker in started:
+                worker.ready()
+                self._all.append(worker)
+                self._idle.put(worker)
+
+    def _acquire(self) -> Optional[_Worker]:
+        """A free worker, or None once the pool is shut down"""
+        while not self._closed:
+            try:
+                return self._idle.get(timeout=0.5)
+            except queue.Empty:
+                continue
+        return None
+
+    def _replace(self, worker: _Worker) -> _Worker:
+        """Kill a worker that hung or died and start a fresh one in its place"""
+        worker.kill()
+        with self._lock:
+            self.restarts += 1
+            registry.incr("pdf_render.worker_restarts")
+            replacement = _Worker(multiprocessing.get_context(self.restart_method))
+            self._all = [w for w in self._all if w is not worker] + [replacement]
+        replacement.ready()
+        return replacement
+
+    def render(self, kind: str, render: Callable[..., Any], *args) -> Tuple[Any, float]:
+        """
+        Run render(*args) in a worker and return (result, render_ms).
+        render must be a module-level function taking picklable arguments.
+        """
+        result = self._submit(render, args, retry=True) if self.workers else None
+        if result is None:
+            # No pool, or it was shut down while this render waited
+            result = sanction_renderer.timed(render, *args)
+        registry.observe(f"pdf_render.{kind}_ms", result[1])
+        return result
+
+    def _submit(self, render: Callable[..., Any], args: tuple, retry: bool) -> Optional[Tuple[Any, float]]:
+        waited = time.perf_counter()
+        worker = self._acquire()
+        if worker is None:
+            return None
+        registry.observe("pdf_render.queue_wait_ms", (time.perf_counter() - waited) * 1000.0)
+        try:
+            return worker.run(render, args, self.timeout)
+        except TimeoutError:
+            registry.incr("pdf_render.timeouts")
+            worker = self._replace(worker)
+            raise
+        except _WorkerDied:
+            worker = self._replace(worker)
+            if not retry:
+                raise BrokenProcessPool("PDF render worker died twice in a row")
+        finally:
+            self._idle.put(worker)
+        return self._submit(render, args, retry=False)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "start_method": self.start_method if self.workers else "inline",
+            "restart_method": self.restart_method,
+            "idle": self._idle.qsize(),
+            "timeout_seconds": self.timeout,
+            "restarts": self.restarts,
+        }
+
+    def shutdown(self):
+        """Stop the workers once their current renders finish; later renders run inline"""
+        if self._closed or not self.workers:
+            return
+        self._closed = True
+        with self._lock:
+            workers = list(self._all)
+        deadline = time.time() + self.timeout
+        for _ in workers:
+            try:
+                self._idle.get(timeout=max(0.0, deadline - time.time())).stop()
+            except queue.Empty:
+                break
+        # Whatever is still busy past the deadline is killed
+        with self._lock:
+            for worker in self._all:
+                if worker.process.is_alive():
+                    worker.kill()
@@ -0,0 +1,228 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Callable, Tuple
+
+from services.eligibility_service import EligibilityService
+
+CUSTOMERS_FILE = os.path.join(os.path.dirname(__file__), "..", "data", "customers.json")
+OFFERS_FILE = os.path.join(os.path.dirname(__file__), "..", "data", "offers.json")
+
+DEFAULT_CHUNK_SIZE = 50000
+
+ProgressCallback = Callable[[int, int], None]
+
+
+def _present_value(emi: float, annual_rate: float, months: int) -> float:
+    """Largest principal whose EMI at the given rate and tenure does not exceed emi"""
+    if emi <= 0 or months <= 0:
+        return 0.0
+    r = annual_rate / (12 * 100)
+    if r == 0:
+        return emi * months
+    growth = (1 + r) ** months
+    return emi * (growth - 1) / (r * growth)
+
+
+def _price_shard(rows: List[Tuple[str, float, float, int]], pricing: Dict[str, Any]) -> List[Tuple[str, int, float]]:
+    """
+    Price one shard of customers.
+
+    Runs inside a worker process, so it only takes plain tuples and returns
+    (customer_id, limit, interest) for customers that qualify.
+    """
+    bands = pricing["rate_bands"]
+    min_income = pricing["min_monthly_income"]
+    max_foir = pricing["max_foir"]
+    tenure = pricing["limit_tenure_months"]
+    income_multiple = pricing["max_income_multiple"]
+    max_limit = pricing["max_preapproved_limit"]
+    rounding = pricing["limit_rounding"]
+
+    priced = []
+    for customer_id, income, existing_emi, score in rows:
+        if income < min_income:
+            continue
+        interest = next((b["interest"] for b in bands if score >= b["min_credit_score"]), None)
+        if interest is None:
+            continue
+        emi_headroom = income * max_foir - existing_emi
+        limit = min(_present_value(emi_headroom, interest, tenure), income * income_multiple, max_limit)
+        limit = (limit // rounding) * rounding
+        if limit <= 0:
+            continue
+        priced.append((customer_id, int(limit), float(interest)))
+    return priced
+
+
+class PreApprovalRefreshService:
+    """
+    Nightly batch job that recomputes pre-approved limits and rates for every customer
+    from income, existing EMI, credit score and the policy table, then writes a new
+    offers snapshot atomically.
+    """
+
+    def __init__(self, eligibility: EligibilityService,
+                 customers_file: str = CUSTOMERS_FILE,
+                 offers_file: str = OFFERS_FILE,
+                 previous_offers_file: str = OFFERS_FILE):
+        self.eligibility = eligibility
+        self.customers_file = customers_file
+        # Snapshot written by refresh()
+        self.offers_file = offers_file
+        # Live offers whose tenure options and fees carry over; not the write target, which may be elsewhere
+        self.previous_offers_file = previous_offers_file
+        self.status: Dict[str, Any] = {"state": "IDLE"}
+
+    def get_pricing(self) -> Dict[str, Any]:
+        """Collect the pricing inputs from the policy table"""
+        get = self.eligibility.get_policy_value
+        bands = get("Pre-Approved Pricing", "rate_bands", [])
+        return {
+            "rate_bands": sorted(bands, key=lambda b: b["min_credit_score"], reverse=True),
+            "min_monthly_income": get("Minimum Income", "min_monthly_income", 30000),
+            "max_foir": get("FOIR Limits", "max_foir_auto_approve", 0.5),
+            "limit_tenure_months": get("Pre-Approved Pricing", "limit_tenure_months", 36),
+            "max_income_multiple": get("Pre-Approved Pricing", "max_income_multiple", 7),
+            "max_preapproved_limit": get("Pre-Approved Pricing", "max_preapproved_limit", 1000000),
+            "limit_rounding": get("Pre-Approved Pricing", "limit_rounding", 10000),
+            "default_processing_fee_pct": get("Pre-Approved Pricing", "default_processing_fee_pct", 1.0),
+            "default_tenure_options": get("Pre-Approved Pricing", "default_tenure_options", [12, 24, 36]),
+        }
+
+    def _load_json(self, path: str) -> list:
+        if not os.path.exists(path):
+            return []
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    def _shards(self, customers: list, chunk_size: int) -> List[List[Tuple[str, float, float, int]]]:
+        """Strip customers down to the pricing inputs and split them into shards"""
+        rows = [
+            (
+                c.get("customer_id"),
+                float(c.get("monthly_income") or 0),
+                float(c.get("existing_emi") or 0),
+                int(c.get("credit_score") or 0),
+            )
+            for c in customers if c.get("customer_id")
+        ]
+        return [rows[i:i + chunk_size] for i in range(0, len(rows), chunk_size)]
+
+    def _write_snapshot(self, offers: List[Dict[str, Any]]):
+        """Write the offers snapshot to a temp file and swap it in, so readers never see a partial file"""
+        directory = os.path.dirname(os.path.abspath(self.offers_file))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.offers_file}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                # One offer per line: stays readable and, unlike indent=, uses the C encoder
+                f.write("[\n")
+                f.write(",\n".join(f"  {json.dumps(o)}" for o in offers))
+                f.write("\n]\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.offers_file)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def refresh(self, workers: Optional[int] = None,
+                chunk_size: int = DEFAULT_CHUNK_SIZE,
+                progress: Optional[ProgressCallback] = None) -> Dict[str, Any]:
+        """
+        Recompute every customer's pre-approved offer and write the snapshot.
+
+        Shards are priced across a process pool; with a single shard the work
+        runs inline since a pool would only add start-up cost.
+        """
+        started = time.time()
+        pricing = self.get_pricing()
+        if not pricing["rate_bands"]:
+            raise ValueError("Pre-Approved Pricing policy has no rate bands; refusing to write an empty snapshot")
+        customers = self._load_json(self.customers_file)
+        previous = {o.get("customer_id"): o for o in self._load_json(self.previous_offers_file)}
+        shards = self._shards(customers, max(1, chunk_size))
+        total = sum(len(s) for s in shards)
+
+        self.status = {"state": "RUNNING", "processed": 0, "total": total,
+                       "started_at": datetime.now().isoformat()}
+
+        def report(done: int):
+            self.status["processed"] = done
+            if progress:
+                progress(done, total)
+
+        results: List[Optional[List[Tuple[str, int, float]]]] = [None] * len(shards)
+        try:
+            if len(shards) <= 1 or workers == 1:
+                done = 0
+                for i, shard in enumerate(shards):
+                    results[i] = _price_shard(shard, pricing)
+                    done += len(shard)
+                    report(done)
+            else:
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    futures = {pool.submit(_price_shard, shard, pricing): i for i, shard in enumerate(shards)}
+                    done = 0
+                    for future in as_completed(futures):
+                        i = futures[future]
+                        results[i] = future.result()
+                        done += len(shards[i])
+                        report(done)
+
+            offers = []
+            for shard_result in results:
+                for customer_id, limit, interest in shard_result or []:
+                    prev = previous.get(customer_id, {})
+                    offers.append({
+                        "customer_id": customer_id,
+                        "max_amount": limit,
+                        "tenure_options": prev.get("tenure_options", pricing["default_tenure_options"]),
+                        "base_interest": interest,
+                        "processing_fee_pct": prev.get("processing_fee_pct", pricing["default_processing_fee_pct"]),
+                    })
+            self._write_snapshot(offers)
+        except Exception as e:
+            self.status.update({"state": "FAILED", "error": str(e)})
+            raise
+
+        elapsed = time.time() - started
+        self.status.update({
+            "state": "COMPLETED",
+            "customers": total,
+            "offers": len(offers),
+            "elapsed_seconds": round(elapsed, 3),
+            "customers_per_second": round(total / elapsed, 1) if elapsed > 0 else None,
+            "finished_at": datetime.now().isoformat(),
+        })
+        return self.status
+
+
+def main():
+    """CLI entry point, run from backend/: python -m services.preapproval_refresh_service"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Recompute pre-approved limits and rates for all customers")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Customers per shard")
+    parser.add_argument("--customers", default=CUSTOMERS_FILE, help="Customers JSON file")
+    parser.add_argument("--offers", default=OFFERS_FILE, help="Current offers to carry tenure options and fees over from")
+    parser.add_argument("--output", default=OFFERS_FILE, help="Offers snapshot to write")
+    args = parser.parse_args()
+
+    def print_progress(done: int, total: int):
+        pct = (done / total * 100) if total else 100.0
+        print(f"\r[PreApprovalRefresh] {done:,}/{total:,} customers ({pct:.1f}%)", end="", flush=True)
+
+    job = PreApprovalRefreshService(EligibilityService(), args.customers, args.output, args.offers)
+    status = job.refresh(workers=args.workers, chunk_size=args.chunk_size, progress=print_progress)
+    print()
+    print(f"[PreApprovalRefresh] Wrote {status['offers']:,} offers to {args.output} "
+          f"in {status['elapsed_seconds']}s ({status['customers_per_second']} customers/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,18 @@
-import json
-import os
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 
-OFFERS_FILE = os.path.join(os.path.dirname(__file__), "..", "data", "offers.json")
+from services.reference_data import reference_data
 
 class PreApprovalService:
     """Service to check and retrieve pre-approved offers"""
     
-    def __init__(self):
-        self.offers: list = []
-        self.load_offers()
-    
+    @property
+    def offers(self) -> List[Dict[str, Any]]:
+        """Pre-approved offers, parsed once per process (see ReferenceData)"""
+        return reference_data.get("offers", [])
+
     def load_offers(self):
-        """Load offers from JSON file"""
-        if os.path.exists(OFFERS_FILE):
-            with open(OFFERS_FILE, 'r') as f:
-                self.offers = json.load(f)
-        else:
-            self.offers = []
+        """Re-read offers.json after it was rewritten"""
+        reference_data.reload("offers", [])
     
     def find_preapproved_offer(self, customer_id: str) -> Optional[Dict[str, Any]]:
         """
@@ -0,0 +1,113 @@
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+_MISSING = object()
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+# How often a loaded file is stat'ed for changes made by another process (e.g. the offers refresh)
+RECHECK_SECONDS = float(os.getenv("REFERENCE_RECHECK_SECONDS", "2"))
+
+# Read-only inputs of the services; the dynamic files (loans, events, ...) live in the state backend
+REFERENCE_FILES = {
+    "customers": "customers.json",
+    "offers": "offers.json",
+    "kyc": "kyc.json",
+    "policies": "policies.json",
+    "faqs": "faqs.json",
+}
+
+
+class ReferenceData:
+    """
+    Reference data files parsed once per process and shared by every service
+    that reads them.
+
+    In a pre-forked deployment (serve.py) the parent preloads everything, so the
+    workers inherit the parsed objects copy-on-write instead of each parsing
+    its own. Values are shared: services must treat them as read-only. A file
+    rewritten by another process is picked up within recheck_seconds.
+    """
+
+    def __init__(self, data_dir: str = DATA_DIR, recheck_seconds: float = RECHECK_SECONDS):
+        self.data_dir = data_dir
+        self.recheck_seconds = recheck_seconds
+        self._values: Dict[str, Any] = {}
+        self._signatures: Dict[str, Optional[Tuple[int, int]]] = {}
+        self._checked: Dict[str, float] = {}
+        self._customers_by_id: Optional[Dict[str, Dict[str, Any]]] = None
+        self._lock = threading.Lock()
+        self.loads = 0
+
+    def path_for(self, name: str) -> str:
+        return os.path.join(self.data_dir, REFERENCE_FILES.get(name, f"{name}.json"))
+
+    def get(self, name: str, default: Any = None) -> Any:
+        """Parsed contents of a data file (default if it doesn't exist), read on first use"""
+        now = time.monotonic()
+        with self._lock:
+            if name not in self._values:
+                self._load(name, now)
+            elif now - self._checked[name] >= self.recheck_seconds:
+                self._checked[name] = now
+                if self._signature(name) != self._signatures[name]:
+                    self._load(name, now)
+            value = self._values[name]
+        return default if value is _MISSING else value
+
+    def reload(self, name: str, default: Any = None) -> Any:
+        """Re-read a file that was rewritten (e.g. offers.json after a pre-approval refresh)"""
+        with self._lock:
+            value = self._load(name, time.monotonic())
+        return default if value is _MISSING else value
+
+    def _signature(self, name: str) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.path_for(name))
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _load(self, name: str, now: float) -> Any:
+        signature = self._signature(name)
+        value = _MISSING
+        if signature is not None:
+            with open(self.path_for(name), "r", encoding="utf-8") as f:
+                value = json.load(f)
+            self.loads += 1
+        self._values[name] = value
+        self._signatures[name] = signature
+        self._checked[name] = now
+        if name == "customers":
+            self._customers_by_id = None
+        return value
+
+    def customer(self, customer_id: str) -> Optional[Dict[str, Any]]:
+        """Customer record by id"""
+        # get() first: it drops the index when customers.json changed
+        customers: List[Dict[str, Any]] = self.get("customers", [])
+        index = self._customers_by_id
+        if index is None:
+            index = {}
+            for customer in customers:
+                # First record wins, like the linear scans this replaces
+                index.setdefault(customer.get("customer_id"), customer)
+            self._customers_by_id = index
+        return index.get(customer_id)
+
+    def preload(self):
+        """Parse every reference file and build the indexes now (before forking workers)"""
+        for name in REFERENCE_FILES:
+            self.get(name)
+        self.customer("")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            loaded = sorted(name for name, value in self._values.items() if value is not _MISSING)
+        return {"loaded": loaded, "loads": self.loads}
+
+
+# Shared by every service in the process (and, via fork, by pre-forked workers)
+reference_data = ReferenceData()
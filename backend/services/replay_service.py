@@ -0,0 +1,342 @@
+import copy
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.customer_matching_service import CustomerMatchingService
+from services.reference_data import reference_data
+from services.request_log import decision_of
+from services.session_store import SessionStore
+from services.state_backend import StateBackend, get_state_backend
+
+# Context a new conversation starts from in each app (as in main.py / main_hackathon.py)
+INITIAL_CONTEXT = {
+    "titan": lambda customer_id: {"customer_id": customer_id, "stage": "SALES", "kyc_status": "UNKNOWN"},
+    "hackathon": lambda customer_id: {"stage": "INITIAL"},
+}
+
+# Hackathon events a journey is rebuilt from, after its session_started
+JOURNEY_EVENTS = {
+    "employment_details_collected", "income_details_collected", "kyc_documents_uploaded",
+    "eligibility_evaluated", "preapproved_instant_approval_confirmed", "preapproved_offer_declined",
+}
+
+# Divergences listed in the report; the counts cover all of them
+MAX_EXAMPLES = 20
+
+# handle(user_msg, ctx) -> (reply, ctx), i.e. MasterEngine / HackathonMasterEngine
+Engine = Any
+
+
+def _pct(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    values = sorted(values)
+
+    def at(q):
+        return round(values[min(len(values) - 1, int(q * len(values)))], 3)
+
+    return {"count": len(values), "mean": round(sum(values) / len(values), 3),
+            "p50": at(0.50), "p95": at(0.95), "p99": at(0.99), "max": round(values[-1], 3)}
+
+
+def load_request_log(path: str) -> List[Dict[str, Any]]:
+    """
+    Conversations captured with CHAT_REQUEST_LOG, one per (app, session id),
+    with each turn's request and the stage and decision it ended in.
+    """
+    conversations: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    first_ts = None
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            first_ts = record["ts"] if first_ts is None else first_ts
+            key = (record["app"], record["session_id"])
+            conversation = conversations.get(key)
+            if conversation is None:
+                conversation = conversations[key] = {
+                    "app": record["app"], "key": record["session_id"],
+                    "turns": [],
+                }
+            conversation["turns"].append({
+                "offset": record["ts"] - first_ts,
+                "text": record["text"],
+                "customer_id": record.get("customer_id"),
+                "context": record.get("context"),
+                "resumed": record.get("resumed", False),
+                "stage": record.get("stage"),
+                "decision": record.get("decision"),
+                "recorded_ms": record.get("engine_ms"),
+            })
+    for conversation in conversations.values():
+        conversation["decision"] = conversation["turns"][-1]["decision"]
+    return list(conversations.values())
+
+
+def _journey_messages(started: Dict[str, Any], events: Dict[str, Dict[str, Any]]) -> List[str]:
+    """The hackathon messages that produce a recorded journey's events"""
+    messages = ["hi", started["name"], started["mobile"], started.get("city") or "Mumbai",
+                str(int(started["requested_amount"])),
+                # session_started is published before the purpose is asked, so it is never recorded
+                "skip",
+                # Opens the next stage: the pre-approved offer or the first evaluation question
+                "continue"]
+    if "preapproved_instant_approval_confirmed" in events:
+        return messages + ["yes"]
+    if "preapproved_offer_declined" in events:
+        return messages + ["no"]
+    if "employment_details_collected" not in events:
+        return messages
+    messages.append(events["employment_details_collected"]["employment_type"].lower())
+    if "income_details_collected" not in events:
+        return messages
+    messages.append(str(int(events["income_details_collected"]["monthly_income"])))
+    if "kyc_documents_uploaded" not in events:
+        return messages
+    # Existing EMIs, tenure and bureau consent aren't in any event: assume none, 36 months, yes
+    messages += ["0", "36", "yes", "uploaded", "uploaded", "uploaded"]
+    if "eligibility_evaluated" in events:
+        messages.append("continue")
+    return messages
+
+
+def load_events(path: Optional[str] = None,
+                matching: Optional[CustomerMatchingService] = None,
+                backend: Optional[StateBackend] = None) -> List[Dict[str, Any]]:
+    """
+    Hackathon journeys rebuilt from the event log. Events don't carry the
+    messages, so each journey's messages are derived from its event payloads
+    (see _journey_messages) and only its final decision can be compared.
+
+    session_started is keyed by session id, but later events by the matched
+    customer id (None for new customers), so each journey is resolved to its
+    customer the way the chatbot does and takes that customer's events until
+    their next session_started. Interleaved journeys of new customers can't be
+    told apart.
+
+    Events are read from the state backend the apps write them to, or from the
+    JSON file at path when one is given.
+    """
+    matching = matching or CustomerMatchingService()
+    if path:
+        with open(path, encoding="utf-8") as f:
+            events = json.load(f)
+    else:
+        events = (backend or get_state_backend()).read("events", [])
+    journeys: List[Dict[str, Any]] = []
+    open_journeys: Dict[Optional[str], Dict[str, Any]] = {}
+    first_ts = None
+    for event in events:
+        ts = datetime.fromisoformat(event["timestamp"]).timestamp()
+        first_ts = ts if first_ts is None else first_ts
+        if event["event_type"] == "session_started":
+            started = event["payload"]
+            customer = matching.find_customer(started["name"], started["mobile"])
+            customer_id = customer["customer_id"] if customer else None
+            journey = open_journeys[customer_id] = {"customer_id": customer_id, "offset": ts - first_ts,
+                                                    "started": started, "events": {}}
+            journeys.append(journey)
+        elif event["event_type"] in JOURNEY_EVENTS and event.get("customer_id") in open_journeys:
+            open_journeys[event.get("customer_id")]["events"].setdefault(event["event_type"], event["payload"])
+
+    conversations = []
+    for index, journey in enumerate(journeys):
+        recorded = journey["events"]
+        if "preapproved_instant_approval_confirmed" in recorded:
+            decision = "APPROVED"
+        elif "preapproved_offer_declined" in recorded:
+            decision = "DECLINED"
+        else:
+            decision = recorded.get("eligibility_evaluated", {}).get("decision")
+        conversations.append({
+            "app": "hackathon",
+            "key": f"{journey['customer_id'] or 'NEW'}#{index}",
+            "turns": [{"offset": journey["offset"], "text": text, "customer_id": None, "context": None,
+                       "resumed": position > 0, "stage": None, "decision": None, "recorded_ms": None}
+                      for position, text in enumerate(_journey_messages(journey["started"], recorded))],
+            "decision": decision,
+        })
+    return conversations
+
+
+class ReplayService:
+    """
+    Replays recorded conversations against the engines in-process, without the
+    HTTP layer, and compares their outcomes with the recording.
+
+    Each conversation's turns run in order on one thread, with the session and
+    context handling of the chat endpoints; `concurrency` conversations run at a
+    time. With speed 0 turns run back to back; otherwise each turn waits for its
+    recorded time, scaled (speed 2 replays twice as fast as recorded).
+    """
+
+    def __init__(self, engines: Dict[str, Engine]):
+        self.engines = engines
+        self.sessions = SessionStore()
+
+    def _prepare(self, app: str, ctx: Dict[str, Any], customer_id: Optional[str]):
+        if app == "titan":
+            ctx["customer_id"] = customer_id
+            if not ctx.get("customer_name"):
+                customer = reference_data.customer(customer_id)
+                if customer and customer.get("name"):
+                    ctx["customer_name"] = customer["name"]
+        ctx.pop("sanction_letter_pdf", None)
+
+    def _replay_conversation(self, conversation: Dict[str, Any], origin: float, speed: float) -> Dict[str, Any]:
+        # `origin` is the clock time that offset 0 of the recording maps to
+        app = conversation["app"]
+        engine = self.engines[app]
+        latencies: List[float] = []
+        divergences: List[Dict[str, Any]] = []
+        session_id = None
+        ctx: Dict[str, Any] = {}
+        for position, turn in enumerate(conversation["turns"]):
+            if speed > 0:
+                delay = origin + turn["offset"] / speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            if turn["resumed"] and session_id is None:
+                # Recorded mid-session: the context it continued from isn't in the recording
+                return {"skipped": True, "latencies": latencies, "divergences": divergences}
+            opened = self.sessions.open_turn(session_id if turn["resumed"] else None, copy.deepcopy(turn["context"]),
+                                             INITIAL_CONTEXT[app](turn["customer_id"]))
+            if opened is None:
+                return {"error": "Session expired during the replay", "latencies": latencies, "divergences": divergences}
+            session_id, ctx, stored = opened
+            self._prepare(app, ctx, turn["customer_id"])
+            turn_started = time.perf_counter()
+            try:
+                _, ctx = engine.handle(turn["text"], ctx)
+            except Exception as e:
+                traceback.print_exc()
+                return {"error": f"Turn {position}: {e}", "latencies": latencies, "divergences": divergences}
+            latencies.append((time.perf_counter() - turn_started) * 1000.0)
+            self.sessions.close_turn(session_id, ctx, stored)
+
+            replayed = {"stage": ctx.get("stage"), "decision": decision_of(ctx)}
+            recorded = {"stage": turn["stage"], "decision": turn["decision"]}
+            if turn["stage"] is not None and replayed != recorded:
+                divergences.append({"turn": position, "text": turn["text"], "recorded": recorded, "replayed": replayed})
+        return {"latencies": latencies, "divergences": divergences, "decision": decision_of(ctx)}
+
+    def replay(self, conversations: List[Dict[str, Any]], speed: float = 0.0, concurrency: int = 8) -> Dict[str, Any]:
+        started = time.perf_counter()
+        # Paced from the earliest turn replayed, not the start of the recording
+        first_offset = min((c["turns"][0]["offset"] for c in conversations if c["turns"]), default=0.0)
+        origin = started - (first_offset / speed if speed > 0 else 0.0)
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+            outcomes = list(pool.map(lambda c: self._replay_conversation(c, origin, speed), conversations))
+        elapsed = time.perf_counter() - started
+
+        latencies: List[float] = []
+        recorded_latencies: List[float] = []
+        decision_divergences, turn_divergences, examples, errors = 0, 0, [], []
+        skipped = 0
+        for conversation, outcome in zip(conversations, outcomes):
+            latencies += outcome["latencies"]
+            if outcome.get("skipped"):
+                skipped += 1
+                continue
+            if outcome.get("error"):
+                errors.append({"app": conversation["app"], "key": conversation["key"], "error": outcome["error"]})
+                continue
+            recorded_latencies += [t["recorded_ms"] for t in conversation["turns"] if t["recorded_ms"] is not None]
+            turn_divergences += len(outcome["divergences"])
+            if outcome["decision"] != conversation["decision"]:
+                decision_divergences += 1
+            if (outcome["divergences"] or outcome["decision"] != conversation["decision"]) and len(examples) < MAX_EXAMPLES:
+                examples.append({"app": conversation["app"], "key": conversation["key"],
+                                 "recorded_decision": conversation["decision"], "replayed_decision": outcome["decision"],
+                                 "turns": outcome["divergences"][:5]})
+
+        return {
+            "conversations": len(conversations),
+            "turns": len(latencies),
+            "skipped": skipped,
+            "errors": errors[:MAX_EXAMPLES],
+            "error_count": len(errors),
+            "speed": speed,
+            "concurrency": concurrency,
+            "elapsed_seconds": round(elapsed, 3),
+            "throughput_turns_per_second": round(len(latencies) / elapsed, 2) if elapsed > 0 else None,
+            "latency_ms": _pct(latencies),
+            # Engine time of the same turns when recorded (request log only), to compare against
+            "recorded_latency_ms": _pct(recorded_latencies),
+            "divergence": {
+                "decisions": decision_divergences,
+                "turns": turn_divergences,
+                "examples": examples,
+            },
+        }
+
+
+def main():
+    """CLI entry point, run from backend/: python -m services.replay_service --from-log chat.jsonl"""
+    import argparse
+    import contextlib
+
+    parser = argparse.ArgumentParser(description="Replay recorded conversations against the engines")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--from-log", metavar="PATH", help="Request log written with CHAT_REQUEST_LOG (exact replay)")
+    source.add_argument("--from-events", metavar="PATH", nargs="?", const="",
+                        help="Event log (default: the events in STATE_BACKEND, or this JSON file); "
+                             "hackathon journeys, final decisions only")
+    parser.add_argument("--app", choices=sorted(INITIAL_CONTEXT), default=None, help="Only replay this flow")
+    parser.add_argument("--speed", type=float, default=0.0,
+                        help="0 = as fast as possible; otherwise recorded pace times this factor")
+    parser.add_argument("--concurrency", type=int, default=8, help="Conversations replayed at the same time")
+    parser.add_argument("--state", choices=["memory", "file", "sqlite"], default="memory",
+                        help="State backend for loans, events and KYC; memory (default) leaves data/ untouched")
+    parser.add_argument("--verbose", action="store_true", help="Keep the agents' console output")
+    parser.add_argument("--output", default=None, help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    from services.state_backend import create_state_backend, set_state_backend
+    # Recorded events come from the backend the apps wrote them to (STATE_BACKEND), not the replay's
+    conversations = (load_request_log(args.from_log) if args.from_log
+                     else load_events(args.from_events or None, backend=create_state_backend()))
+    # Before the container builds any service, so replayed loans and events land here
+    set_state_backend(create_state_backend(args.state))
+    from container import container
+
+    if args.app:
+        conversations = [c for c in conversations if c["app"] == args.app]
+    apps = {c["app"] for c in conversations}
+    engines = {}
+    if "titan" in apps:
+        engines["titan"] = container.master_engine
+    if "hackathon" in apps:
+        engines["hackathon"] = container.hackathon_engine
+
+    service = ReplayService(engines)
+    try:
+        with contextlib.ExitStack() as stack:
+            if not args.verbose:
+                stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, "w"))))
+            report = service.replay(conversations, speed=args.speed, concurrency=args.concurrency)
+            if "sanction_jobs" in container.built():
+                # Letters of approved replays are rendered in the background; let them finish first
+                container.sanction_jobs.join()
+    finally:
+        container.shutdown()
+    report["source"] = args.from_log or args.from_events
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+        print(f"[Replay] Report written to {args.output} ({report['turns']} turns in {report['elapsed_seconds']}s, "
+              f"{report['divergence']['decisions']} decision divergences)")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
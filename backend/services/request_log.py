@@ -0,0 +1,66 @@
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Mapping, Optional
+
+# JSON-lines file that every chat turn is appended to, for `python -m services.replay_service`; unset = off
+REQUEST_LOG_PATH = os.getenv("CHAT_REQUEST_LOG")
+
+
+def decision_of(ctx: Mapping[str, Any]) -> Optional[str]:
+    """The loan outcome a context has reached so far, in either flow (None while undecided)"""
+    if ctx.get("decision"):
+        return ctx["decision"]
+    if ctx.get("preapproved_confirmed"):
+        return "APPROVED"
+    if ctx.get("preapproved_declined"):
+        return "DECLINED"
+    evaluation = ctx.get("evaluation_result")
+    if isinstance(evaluation, dict):
+        return "APPROVED" if evaluation.get("approved") else "REJECTED"
+    return None
+
+
+class RequestLog:
+    """
+    Captures chat turns as they arrive: the request (text, customer, the context
+    the client sent, whether it continued a session) and what the turn ended in
+    (stage, decision, engine time). Replaying the file runs the same
+    conversations again and compares their outcomes.
+    """
+
+    def __init__(self, path: Optional[str] = REQUEST_LOG_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def record(self, app: str, session_id: str, resumed: bool, customer_id: Optional[str], text: str,
+               context: Optional[Dict[str, Any]], result: Mapping[str, Any], engine_ms: float):
+        if not self.path:
+            return
+        line = json.dumps({
+            "ts": time.time(),
+            "app": app,
+            "session_id": session_id,
+            "resumed": resumed,
+            "customer_id": customer_id,
+            "text": text,
+            "context": context,
+            "stage": result.get("stage"),
+            "decision": decision_of(result),
+            "engine_ms": round(engine_ms, 3),
+        }, default=str)
+        with self._lock:
+            if self._file is None:
+                # Line-buffered append: a turn is on disk once its response is sent
+                self._file = open(self.path, "a", buffering=1, encoding="utf-8")
+            self._file.write(line + "\n")
+
+
+# Shared by both apps, so a combined app (app_factory) writes one file
+request_log = RequestLog()
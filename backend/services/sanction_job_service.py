@@ -0,0 +1,185 @@
+import os
+import queue
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from services.metrics import registry as metrics_registry
+from services.state_backend import StateBackend, get_state_backend
+
+DEFAULT_WORKERS = int(os.getenv("SANCTION_JOB_WORKERS", "2"))
+MAX_TRACKED_JOBS = 10000
+# How long a job's status stays visible to the other workers
+JOB_TTL_SECONDS = float(os.getenv("SANCTION_JOB_TTL_SECONDS", str(7 * 24 * 3600)))
+# Job fields other workers see; meta and watchers stay with the process that renders
+PUBLIC_FIELDS = ("job_id", "kind", "status", "pdf_path", "error", "render_ms", "created_at", "finished_at")
+
+
+class SanctionJobQueue:
+    """
+    Background worker queue for sanction letter PDFs.
+
+    Agents submit a render callable and get a job id back immediately; the
+    chat turn returns while worker threads render the letter. Clients poll
+    GET /sanctions/{job_id} until the job is DONE, or watch() it to be told.
+
+    A job's status is also written to the state backend when it is queued and
+    when it finishes, so a poll that reaches another worker process finds it.
+    """
+
+    def __init__(self, workers: int = DEFAULT_WORKERS, max_jobs: int = MAX_TRACKED_JOBS,
+                 backend: Optional[StateBackend] = None, ttl_seconds: float = JOB_TTL_SECONDS):
+        self.max_jobs = max_jobs
+        self.backend = backend or get_state_backend()
+        self.ttl_seconds = ttl_seconds
+        self.jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._queue: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self._watchers: Dict[str, List[Callable[[Dict[str, Any]], None]]] = {}
+        self._threads = []
+        for i in range(max(1, workers)):
+            t = threading.Thread(target=self._worker, name=f"sanction-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def submit(self, kind: str, render: Callable[[], str],
+               on_done: Optional[Callable[[Dict[str, Any]], None]] = None,
+               meta: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Queue a render. render() must return the PDF path; on_done(job) runs on
+        the worker thread after a successful render (e.g. to record the path).
+        """
+        job_id = f"SJ_{uuid.uuid4().hex[:12].upper()}"
+        job = {
+            "job_id": job_id,
+            "kind": kind,
+            "status": "QUEUED",
+            "pdf_path": None,
+            "error": None,
+            "render_ms": None,
+            "meta": meta or {},
+            "created_at": datetime.now().isoformat(),
+            "finished_at": None,
+        }
+        with self._lock:
+            self.jobs[job_id] = job
+            # Forget the oldest finished jobs once we track too many
+            while len(self.jobs) > self.max_jobs:
+                oldest_id, oldest = next(iter(self.jobs.items()))
+                if oldest["status"] in ("QUEUED", "RUNNING"):
+                    break
+                self.jobs.pop(oldest_id)
+        self._publish(job)
+        self._queue.put((job, render, on_done, time.perf_counter()))
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Snapshot of a job's state, from the backend if another process queued it"""
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job:
+                return dict(job)
+        return self.backend.get_item("sanction_jobs", job_id)
+
+    def watch(self, job_id: str, callback: Callable[[Dict[str, Any]], None]) -> bool:
+        """
+        Call callback(job) once the job is DONE or FAILED: on the worker thread, or
+        right away if it already finished. Returns False for an unknown job id.
+        """
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return False
+            if job["status"] not in ("DONE", "FAILED"):
+                self._watchers.setdefault(job_id, []).append(callback)
+                return True
+            finished = dict(job)
+        callback(finished)
+        return True
+
+    def wait(self, job_id: str, timeout: float = 60.0, poll_interval: float = 0.05) -> Optional[Dict[str, Any]]:
+        """Block until a job finishes or timeout elapses (for scripts and tooling)"""
+        deadline = time.time() + timeout
+        while True:
+            job = self.get(job_id)
+            if not job or job["status"] in ("DONE", "FAILED") or time.time() >= deadline:
+                return job
+            time.sleep(poll_interval)
+
+    def join(self):
+        """Block until every job submitted so far has finished (for scripts and tooling)"""
+        self._queue.join()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts: Dict[str, int] = {}
+            for job in self.jobs.values():
+                counts[job["status"]] = counts.get(job["status"], 0) + 1
+        return {"workers": len(self._threads), "queued": self._queue.qsize(), "jobs": counts}
+
+    def _worker(self):
+        while True:
+            job, render, on_done, submitted = self._queue.get()
+            try:
+                self._run(job, render, on_done, submitted)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job: Dict[str, Any], render: Callable[[], str],
+             on_done: Optional[Callable[[Dict[str, Any]], None]], submitted: float):
+        # Job fields change under the lock, as get() and stats() read them under it
+        with self._lock:
+            job["status"] = "RUNNING"
+        started = time.perf_counter()
+        metrics_registry.observe("sanction_jobs.queue_wait_ms", (started - submitted) * 1000.0)
+        try:
+            pdf_path = render()
+        except Exception as e:
+            with self._lock:
+                job.update({"status": "FAILED", "error": str(e), "finished_at": datetime.now().isoformat()})
+            print(f"[SanctionJobQueue] Job {job['job_id']} failed: {e}")
+            traceback.print_exc()
+            self._publish(job)
+            self._notify(job)
+            return
+        with self._lock:
+            job.update({"status": "DONE", "pdf_path": pdf_path,
+                        "render_ms": round((time.perf_counter() - started) * 1000.0, 2),
+                        "finished_at": datetime.now().isoformat()})
+            finished = dict(job)
+        self._publish(finished)
+        # The letter exists and is served from here on; a failing callback (e.g. recording
+        # the path in loans.json) is logged on its own instead of failing the job
+        if on_done:
+            try:
+                on_done(finished)
+            except Exception as e:
+                metrics_registry.incr("sanction_jobs.callback_errors")
+                print(f"[SanctionJobQueue] Callback for job {job['job_id']} failed: {e}")
+                traceback.print_exc()
+        self._notify(job)
+
+    def _publish(self, job: Dict[str, Any]):
+        with self._lock:
+            public = {k: job[k] for k in PUBLIC_FIELDS}
+        try:
+            self.backend.put_item("sanction_jobs", public["job_id"], public, self.ttl_seconds)
+        except Exception as e:
+            # Only other workers miss out; the job itself carries on
+            metrics_registry.incr("sanction_jobs.publish_errors")
+            print(f"[SanctionJobQueue] Could not publish job {public['job_id']}: {e}")
+
+    def _notify(self, job: Dict[str, Any]):
+        # Popped after the status is final, so a concurrent watch() either sees it or is popped here
+        with self._lock:
+            watchers = self._watchers.pop(job["job_id"], [])
+            job = dict(job)
+        for callback in watchers:
+            try:
+                callback(dict(job))
+            except Exception as e:
+                print(f"[SanctionJobQueue] Watcher for job {job['job_id']} failed: {e}")
@@ -0,0 +1,180 @@
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from services import sanction_renderer
+from services.loans_service import LoansService
+from services.pdf_render_pool import PdfRenderPool
+from services.sanction_store import SanctionStore
+
+CHECKPOINT_FILE = os.path.join(os.path.dirname(__file__), "..", "data", "sanction_regeneration.checkpoint")
+
+ProgressCallback = Callable[[int, int], None]
+
+
+def _render_loan(store: SanctionStore, loan: Dict[str, Any]) -> str:
+    """
+    Redraw one loan's sanction letter from its loans.json record.
+    Runs in a render worker, so it only takes the (picklable) store and the loan.
+    """
+    ctx = {
+        "customer_id": loan.get("customer_id"),
+        "customer_name": loan.get("customer_name") or "Customer",
+        "session_id": loan.get("session_id"),
+    }
+    if loan.get("approval_type") == "evaluated":
+        return sanction_renderer.render_evaluated_letter(store, ctx, loan, {"emi": loan.get("emi") or 0})
+    return sanction_renderer.render_instant_letter(store, ctx, loan)
+
+
+class SanctionRegenerationService:
+    """
+    Batch job that redraws the sanction letter of every approved loan, e.g. after
+    the letter template or policy text changes.
+
+    Letters render on the PDF render pool with a bounded number in flight, finished
+    loans are appended to a checkpoint so an interrupted run can resume, and the new
+    paths land in loans.json in a single write at the end.
+    """
+
+    def __init__(self, loans: LoansService, render_pool: PdfRenderPool,
+                 store: Optional[SanctionStore] = None,
+                 checkpoint_file: str = CHECKPOINT_FILE):
+        self.loans = loans
+        self.render_pool = render_pool
+        self.store = store or SanctionStore()
+        self.checkpoint_file = checkpoint_file
+        self.status: Dict[str, Any] = {"state": "IDLE"}
+
+    def _load_checkpoint(self) -> Dict[str, str]:
+        done: Dict[str, str] = {}
+        if not os.path.exists(self.checkpoint_file):
+            return done
+        with open(self.checkpoint_file, "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A run killed mid-write can leave a torn last line
+                    continue
+                done[entry["loan_id"]] = entry["path"]
+        return done
+
+    def _pending(self, done: Dict[str, str]) -> Iterator[Dict[str, Any]]:
+        for loan in list(self.loans.loans):
+            if loan.get("status") == "APPROVED" and loan.get("loan_id") not in done:
+                yield dict(loan)
+
+    def regenerate(self, resume: bool = False, max_in_flight: Optional[int] = None,
+                   progress: Optional[ProgressCallback] = None) -> Dict[str, Any]:
+        """
+        Redraw every approved loan's letter and record the new paths.
+        With resume, loans finished by an interrupted run are skipped.
+        """
+        started = time.time()
+        if not resume and os.path.exists(self.checkpoint_file):
+            os.remove(self.checkpoint_file)
+        done = self._load_checkpoint()
+        resumed = len(done)
+        total = sum(1 for loan in self.loans.loans if loan.get("status") == "APPROVED")
+        window = max_in_flight or max(2, self.render_pool.workers * 2)
+
+        self.status = {"state": "RUNNING", "processed": resumed, "total": total, "resumed": resumed,
+                       "failed": 0, "started_at": datetime.now().isoformat()}
+        rendered = 0
+        failures: Dict[str, str] = {}
+        os.makedirs(os.path.dirname(os.path.abspath(self.checkpoint_file)), exist_ok=True)
+
+        try:
+            with open(self.checkpoint_file, "a") as checkpoint, ThreadPoolExecutor(max_workers=window) as threads:
+                pending = self._pending(done)
+                in_flight = {}
+
+                def fill():
+                    # Keep at most `window` letters in flight so memory stays flat
+                    while len(in_flight) < window:
+                        loan = next(pending, None)
+                        if loan is None:
+                            return
+                        future = threads.submit(self.render_pool.render, "regenerate", _render_loan, self.store, loan)
+                        in_flight[future] = loan["loan_id"]
+
+                fill()
+                while in_flight:
+                    finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        loan_id = in_flight.pop(future)
+                        try:
+                            path, _ = future.result()
+                        except Exception as e:
+                            failures[loan_id] = str(e)
+                            self.status["failed"] = len(failures)
+                            continue
+                        done[loan_id] = path
+                        rendered += 1
+                        checkpoint.write(json.dumps({"loan_id": loan_id, "path": path}) + "\n")
+                    checkpoint.flush()
+                    self.status["processed"] = resumed + rendered
+                    if progress:
+                        progress(resumed + rendered, total)
+                    fill()
+
+            updated = self.loans.update_sanction_letter_paths(done)
+        except BaseException as e:
+            # The checkpoint stays behind so the run can resume
+            self.status.update({"state": "FAILED" if isinstance(e, Exception) else "INTERRUPTED", "error": str(e)})
+            raise
+
+        if not failures:
+            os.remove(self.checkpoint_file)
+        elapsed = time.time() - started
+        self.status.update({
+            "state": "COMPLETED" if not failures else "COMPLETED_WITH_ERRORS",
+            "rendered": rendered,
+            "updated_loans": updated,
+            "errors": dict(list(failures.items())[:20]),
+            "elapsed_seconds": round(elapsed, 3),
+            "letters_per_second": round(rendered / elapsed, 1) if elapsed > 0 else None,
+            "finished_at": datetime.now().isoformat(),
+        })
+        return self.status
+
+
+def main():
+    """CLI entry point, run from backend/: python -m services.sanction_regeneration_service"""
+    import argparse
+
+    from services.loans_service import LOANS_FILE
+
+    parser = argparse.ArgumentParser(description="Regenerate sanction letters for every approved loan")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Render worker processes (0 renders inline)")
+    parser.add_argument("--in-flight", type=int, default=None, help="Letters rendering at once (default: 2x workers)")
+    parser.add_argument("--loans", default=LOANS_FILE, help="Loans JSON file")
+    parser.add_argument("--resume", action="store_true", help="Skip loans finished by an interrupted run")
+    args = parser.parse_args()
+
+    def print_progress(done: int, total: int):
+        pct = (done / total * 100) if total else 100.0
+        print(f"\r[SanctionRegeneration] {done:,}/{total:,} letters ({pct:.1f}%)", end="", flush=True)
+
+    render_pool = PdfRenderPool(workers=args.workers)
+    job = SanctionRegenerationService(LoansService(args.loans), render_pool)
+    try:
+        status = job.regenerate(resume=args.resume, max_in_flight=args.in_flight, progress=print_progress)
+    except KeyboardInterrupt:
+        print("\n[SanctionRegeneration] Interrupted; rerun with --resume to continue")
+        raise SystemExit(130)
+    finally:
+        render_pool.shutdown()
+    print()
+    print(f"[SanctionRegeneration] Rendered {status['rendered']:,} letters, updated {status['updated_loans']:,} loans "
+          f"in {status['elapsed_seconds']}s ({status['letters_per_second']} letters/s)")
+    if status["failed"]:
+        print(f"[SanctionRegeneration] {status['failed']} letters failed; rerun with --resume to retry them")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,488 @@
+import os
+import textwrap
+import time
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, Tuple, Union
+
+from fpdf import FPDF
+
+from services import sanction_terms
+from services.letter_sink import LetterSink, as_sink
+
+# Pure render functions: they take plain dicts and an output path (or sink) and
+# touch nothing else, so they can run in a worker process (see PdfRenderPool).
+
+Target = Union[str, LetterSink]
+
+# Glyph sample for the average-width estimate used by _num_lines
+MEASURE_SAMPLE = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+# Static Contingent Charges tables: groups of (columns, is_header) rows
+CONTINGENT_CHARGES = (
+    (
+        (("Penal Charges", ""), True),
+        (("Charge Type", "Value"), True),
+        (("Late payment", "3% per month on defaulted amount"), False),
+    ),
+    (
+        (("Other Penal Charges", ""), True),
+        (("Item", "Charge"), True),
+        (("Cheque Dishonour", "Rs 600 per instance"), False),
+        (("Mandate Rejection", "Rs 450"), False),
+    ),
+    (
+        (("Foreclosure Charges (Override everything to: 3% flat)", ""), True),
+        (("Condition", "Charge"), True),
+        (("Anytime during tenure", "3% of principal outstanding"), False),
+    ),
+    (
+        (("Other Charges", ""), True),
+        (("Type", "Amount"), True),
+        (("Payment Instrument Swapping", "Rs 550"), False),
+        (("Cancellation Charges", "2% of loan amount or Rs 5750 (whichever higher)"), False),
+        (("Duplicate Repayment Schedule", "Rs 550"), False),
+        (("Duplicate NOC", "Rs 550"), False),
+        (("Statement of Account (SOA)", "Customer Portal - Nil | Branch Walk-in - Rs 250"), False),
+        (("Foreclosure Report", "Nil (Portal) / Rs 199 (Branch)"), False),
+        (("Switch Fee", "Not applicable (Loan is fixed rate)"), False),
+    ),
+)
+
+
+@lru_cache(maxsize=None)
+def _avg_char_width(family: str, style: str, size: float) -> float:
+    """Average glyph width for a core font; metrics are fixed so this is computed once per font"""
+    pdf = FPDF()
+    pdf.set_font(family, style, size)
+    width = pdf.get_string_width(MEASURE_SAMPLE) / 52.0
+    return width if width > 0 else 1.0
+
+
+@lru_cache(maxsize=16384)
+def _string_width(family: str, style: str, size: float, text: str) -> float:
+    pdf = FPDF()
+    pdf.set_font(family, style, size)
+    return pdf.get_string_width(text)
+
+
+@lru_cache(maxsize=16384)
+def _wrapped_line_count(text: str, chars_per_line: int) -> int:
+    wrapped = []
+    for paragraph in text.split("\n"):
+        wrapped += textwrap.wrap(paragraph, width=chars_per_line) or [""]
+    return max(1, len(wrapped))
+
+
+def _num_lines(pdf_obj: FPDF, text: str, width: float, line_height: float) -> int:
+    """Estimate number of lines a multi_cell would take for given width and text."""
+    if text is None:
+        return 1
+    text = str(text)
+    if text.strip() == "":
+        return 1
+    avg_char_width = _avg_char_width(pdf_obj.font_family, pdf_obj.font_style, pdf_obj.font_size_pt)
+    chars_per_line = max(1, int(width / max(avg_char_width, 0.1)))
+    return _wrapped_line_count(text, chars_per_line)
+
+
+def _table_row(pdf_obj: FPDF, cols, widths, height=7, header=False, align_list=None):
+    """Draw one table row. Ensure full row fits on page; otherwise add a page first."""
+    if align_list is None:
+        align_list = ["L"] * len(cols)
+
+    font_style = "B" if header else ""
+    pdf_obj.set_font("Arial", font_style, 10)
+
+    # Pre-calc required height for the row
+    texts = [str(text) if text is not None else "" for text in cols]
+    max_lines = max((_num_lines(pdf_obj, text, widths[i], height) for i, text in enumerate(texts)), default=1)
+    required_height = max_lines * height
+
+    bottom_y = pdf_obj.h - pdf_obj.b_margin
+    cur_y = pdf_obj.get_y()
+
+    if cur_y + required_height > bottom_y:
+        pdf_obj.add_page()
+        cur_y = pdf_obj.get_y()
+
+    x0 = pdf_obj.get_x()
+    y0 = cur_y
+    font = (pdf_obj.font_family, pdf_obj.font_style, pdf_obj.font_size_pt)
+
+    # Write each cell starting at the same y0
+    x = x0
+    for i, text in enumerate(texts):
+        w = widths[i]
+        a = align_list[i] if i < len(align_list) else "L"
+        pdf_obj.set_xy(x, y0)
+        if "\n" not in text and _string_width(*font, text) < w - 2 * pdf_obj.c_margin:
+            # Fits on one line: skip multi_cell's line breaker, the drawn cell is the same
+            pdf_obj.cell(w, height, text, border=1, align=a)
+        else:
+            pdf_obj.multi_cell(w, height, text, border=1, align=a)
+        x += w
+
+    # Move cursor to the end of the tallest cell
+    pdf_obj.set_xy(x0, y0 + required_height)
+
+
+def _section_header(pdf_obj: FPDF, text):
+    pdf_obj.set_font("Arial", "B", 12)
+    pdf_obj.cell(0, 8, text, ln=1)
+
+
+def _fmt_amount(val):
+    if isinstance(val, (int, float)):
+        return f"Rs {val:,.0f}"
+    return val or ""
+
+
+def _emit(pdf: FPDF, target: Target) -> Tuple[str, bytearray]:
+    """Serialize the document once and hand the buffer to the sink; returns (location, bytes)"""
+    # No wall-clock creation date, so the same letter always has the same bytes (and store id)
+    pdf.creation_date = None
+    pdf_bytes = pdf.output()
+    return as_sink(target).write(pdf_bytes), pdf_bytes
+
+
+def warm_up():
+    """Load the core fonts once so the first real letter in a worker doesn't pay for it"""
+    pdf = FPDF()
+    pdf.add_page()
+    for style in ("", "B", "I"):
+        pdf.set_font("Arial", style, 10)
+        pdf.get_string_width("warm-up")
+    return os.getpid()
+
+
+def render_instant_letter(target: Target, ctx: Dict[str, Any], loan: Dict[str, Any]) -> str:
+    """Draw the sanction letter for an instant pre-approved loan"""
+    customer_name = ctx.get("customer_name", "Customer")
+
+    # Create PDF with proper margins
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_margins(15, 15, 15)  # Left, Top, Right margins
+    pdf.set_auto_page_break(auto=True, margin=15)
+
+    # Get page width minus margins
+    page_width = pdf.w - 30  # Total width minus left and right margins
+
+    pdf.set_font("Arial", "B", 16)
+
+    # Title
+    pdf.cell(0, 10, "INSTANT LOAN SANCTION LETTER", ln=1, align="C")
+    pdf.ln(10)
+
+    # Customer details
+    pdf.set_font("Arial", size=12)
+    pdf.cell(0, 8, f"Loan ID: {loan.get('loan_id', 'N/A')}", ln=1)
+    pdf.cell(0, 8, f"Customer Name: {customer_name}", ln=1)
+    if ctx.get("customer_id"):
+        pdf.cell(0, 8, f"Customer ID: {ctx.get('customer_id')}", ln=1)
+    pdf.ln(5)
+
+    # Loan details
+    pdf.set_font("Arial", "B", 12)
+    pdf.cell(0, 10, "Loan Details:", ln=1)
+    pdf.set_font("Arial", size=11)
+
+    approved_amount = loan.get("approved_amount", 0)
+    interest_rate = loan.get("interest_rate", 0)
+    tenure = loan.get("tenure_months", 36)
+
+    pdf.cell(0, 8, f"Sanctioned Amount: Rs. {approved_amount:,.0f}", ln=1)
+    pdf.cell(0, 8, f"Loan Tenure: {tenure} months", ln=1)
+    pdf.cell(0, 8, f"Interest Rate: {interest_rate}% per annum", ln=1)
+    pdf.ln(5)
+
+    # Approval type
+    pdf.set_font("Arial", "B", 12)
+    pdf.cell(0, 10, "Approval Type: Pre-Approved Instant Approval", ln=1)
+    pdf.set_font("Arial", size=10)
+    pdf.multi_cell(page_width, 6, "This loan was approved instantly based on your pre-approved status.", 0, "L")
+    pdf.ln(5)
+
+    # Terms and conditions
+    pdf.set_font("Arial", "B", 12)
+    pdf.cell(0, 10, "Terms & Conditions:", ln=1)
+    pdf.set_font("Arial", size=10)
+    pdf.multi_cell(page_width, 6, "1. This sanction is valid for 30 days from the date of issue.", 0, "L")
+    pdf.multi_cell(page_width, 6, "2. The loan is subject to completion of all documentation.", 0, "L")
+    pdf.multi_cell(page_width, 6, "3. Interest rates are subject to change as per market conditions.", 0, "L")
+    pdf.ln(5)
+
+    # Footer
+    pdf.set_font("Arial", "I", 10)
+    pdf.cell(0, 10, "This is a system-generated document for instant approval.", ln=1, align="C")
+    pdf.cell(0, 10, f"Generated on: {loan.get('approved_date', 'N/A')}", ln=1, align="C")
+
+    letter_path, _ = _emit(pdf, target)
+    return letter_path
+
+
+def render_kfs_letter(target: Target, ctx: Dict[str, Any], customer_name: str,
+                      emi: float, customer_mobile: str = "") -> str:
+    """Draw the Key Facts Statement sanction letter; returns where it was stored"""
+    customer_id = ctx.get("customer_id", "UNKNOWN")
+    offer = ctx.get("chosen_offer", {})
+    loan_amount = ctx.get("loan_amount_requested", 0)
+    tenure_months = ctx.get("loan_tenure_requested", 0)
+    interest_rate = offer.get("base_interest", 0)
+    processing_fee_pct = offer.get("processing_fee_pct", 0)
+
+    dates = sanction_terms.letter_dates()
+    current_date = dates["issued"]
+    validity_from = dates["valid_from"]
+    validity_to = dates["valid_to"]
+
+    # Build PDF
+    pdf = FPDF()
+    pdf.set_margins(15, 15, 15)
+    pdf.set_auto_page_break(auto=True, margin=15)
+
+    # ========== Page: Sanction Letter per Spec ==========
+    pdf.add_page()
+    page_width = pdf.w - (pdf.l_margin + pdf.r_margin)
+
+    # Title
+    pdf.set_font("Arial", "B", 14)
+    pdf.cell(0, 8, "Sanction Letter", ln=1, align="C")
+    pdf.ln(2)
+
+    # Header details
+    pdf.set_font("Arial", size=10)
+    pdf.cell(0, 6, f"Customer Name: {customer_name}", ln=1)
+    if customer_mobile:
+        pdf.cell(0, 6, f"Mobile Number: {customer_mobile}", ln=1)
+    else:
+        pdf.cell(0, 6, f"Mobile Number: ", ln=1)
+    pdf.cell(0, 6, f"Sanction Letter Validity: From {validity_from} to {validity_to}", ln=1)
+    pdf.ln(2)
+
+    # KFS Part 1 heading
+    pdf.set_font("Arial", "B", 12)
+    pdf.cell(0, 7, "Key Facts Statement - Part 1 (Interest rate & Fees/Charges)", ln=1)
+
+    # General Details
+    _section_header(pdf, "General Details")
+    col_w = [page_width * 0.12, page_width * 0.38, page_width * 0.5]
+    _table_row(pdf, ["Sl. No", "Field", "Value"], col_w, header=True, align_list=["C", "L", "L"])
+    _table_row(pdf, ["1", "Date of KFS", current_date], col_w)
+    _table_row(pdf, ["2", "Name of Lender", "Titan Bank"], col_w)
+    _table_row(pdf, ["3", "KFS Validity", f"From {validity_from} to {validity_to}"], col_w)
+    address = ctx.get("customer_address", "")
+    borrower_details = f"Name: {customer_name}\nConstitution: Individual\nAddress: {address}" if address else f"Name: {customer_name}\nConstitution: Individual"
+    _table_row(pdf, ["4", "Borrower Details", borrower_details], col_w)
+
+    pdf.ln(2)
+    # Loan Details Table
+    _section_header(pdf, "Loan Details Table")
+    _table_row(pdf, ["Sl. No", "Field", "Value"], col_w, header=True, align_list=["C", "L", "L"])
+    proposal_number = ctx.get("proposal_number", f"APP-{customer_id}-{datetime.now().strftime('%Y%m%d')}")
+    _table_row(pdf, ["1", "Loan Proposal / Account / Unique Proposal Number", proposal_number + "\nType of Loan: Personal Loan"], col_w)
+    _table_row(pdf, ["2", "Sanctioned Loan Amount (Rs)", f"Rs {loan_amount:,.0f}"], col_w)
+    _table_row(pdf, ["3", "Disbursal Schedule", "100% upfront"], col_w)
+    _table_row(pdf, ["4", "Loan Term (months/years)", f"{tenure_months} months"], col_w)
+    # Instalment details composite
+    _table_row(pdf, ["5", "Instalment Details", "Type of Instalments: EPI\nNumber of EPIs: {0}\nEPI Amount (Rs): {1}\nCommencement of Repayment: {2}".format(
+        tenure_months, f"Rs {emi:,.2f}", validity_to
+    )], col_w)
+    _table_row(pdf, ["6", "Interest Rate (per annum)", f"{interest_rate}%\nInterest Type: Fixed"], col_w)
+    _table_row(pdf, ["7", "Additional Floating-Rate Info", "Not Applicable (Loan is Fixed Rate)"], col_w)
+
+    pdf.ln(2)
+    # Fees & Charges A
+    _section_header(pdf, "Fees & Charges - Payable to Titan Bank (A)")
+    fee_w = [page_width * 0.5, page_width * 0.2, page_width * 0.3]
+    _table_row(pdf, ["Fee Type", "One-time/Recurring", "Amount"], fee_w, header=True, align_list=["L", "C", "R"])
+
+    # Processing Fee: prefer explicit value, else compute from pct (ctx or offer)
+    proc_fee_val = sanction_terms.processing_fee(ctx, loan_amount, processing_fee_pct)
+    _table_row(pdf, ["Processing Fees", "One-time", _fmt_amount(proc_fee_val)], fee_w)
+
+    # Insurance – Life: compute fee if opted-in (0.5% of loan amount); else show Not opted / guidance
+    life_ins = ctx.get("life_insurance")
+    life_opted = False
+    try:
+        # Accept various truthy indicators like 'Opted In', 'Yes', True
+        if isinstance(life_ins, str):
+            lower_val = life_ins.strip().lower()
+            life_opted = ("opted" in lower_val and "not" not in lower_val) or lower_val in ["yes", "y", "true"]
+        elif isinstance(life_ins, bool):
+            life_opted = life_ins
+    except Exception:
+        life_opted = False
+
+    life_ins_amount = None
+    if life_opted and isinstance(loan_amount, (int, float)):
+        try:
+            life_ins_amount = round(loan_amount * 0.005)  # 0.5% of loan amount
+        except Exception:
+            life_ins_amount = None
+
+    if life_ins_amount is not None:
+        _table_row(pdf, ["Insurance Charges - Life", "One-time", _fmt_amount(life_ins_amount)], fee_w)
+    else:
+        # Default textual status if no amount is computed
+        status = life_ins if life_ins not in (None, "") else "Customer elected / Not opted"
+        _table_row(pdf, ["Insurance Charges - Life", "One-time", _fmt_amount(status)], fee_w)
+
+    # Insurance – General
+    gen_ins = ctx.get("general_insurance")
+    _table_row(pdf, ["Insurance Charges - General", "One-time", _fmt_amount(gen_ins)], fee_w)
+
+    # Valuation Fees: N/A default for personal loans
+    val_fee = ctx.get("valuation_fees")
+    if val_fee in (None, ""):
+        val_fee = "N/A for personal loan"
+    _table_row(pdf, ["Valuation Fees", "One-time", _fmt_amount(val_fee)], fee_w)
+
+    # Stamp Duty: placeholder if unknown
+    stamp_duty = ctx.get("stamp_duty")
+    if stamp_duty in (None, ""):
+        stamp_duty = "To be charged as per Stamp Act (state)"
+    _table_row(pdf, ["Stamp Duty", "One-time", _fmt_amount(stamp_duty)], fee_w)
+
+    # Broken Period Interest (BPI): compute if bpi_days provided or sanction/disbursal dates known
+    bpi_val = ctx.get("BPI")
+    if not isinstance(bpi_val, (int, float)):
+        days = ctx.get("bpi_days")
+        try:
+            if days is None and ctx.get("disbursal_date") and ctx.get("sanction_date"):
+                from datetime import datetime as dt
+                sd = dt.strptime(ctx.get("sanction_date"), "%d/%m/%Y")
+                dd = dt.strptime(ctx.get("disbursal_date"), "%d/%m/%Y")
+                days = max(0, (dd - sd).days)
+            if isinstance(days, int) and days > 0 and isinstance(loan_amount, (int, float)) and isinstance(interest_rate, (int, float)):
+                bpi_val = round(loan_amount * (interest_rate/100.0) / 365.0 * days)
+        except Exception:
+            pass
+    _table_row(pdf, ["Broken Period Interest", "One-time", _fmt_amount(bpi_val)], fee_w)
+
+    # Add-on products
+    _table_row(pdf, ["One Assist Plan Amount", "One-time", _fmt_amount(ctx.get("one_assist"))], fee_w)
+    _table_row(pdf, ["Documentation Charges", "One-time", _fmt_amount(ctx.get("documentation_charges"))], fee_w)
+
+    pdf.ln(2)
+    # Fees & Charges B
+    _section_header(pdf, "Fees & Charges - Payable to Third Party through Titan Bank (B)")
+    _table_row(pdf, ["Fee Type", "One-time/Recurring", "Amount"], fee_w, header=True, align_list=["L", "C", "R"])
+    _table_row(pdf, ["CPP Plan Amount", "One-time", _fmt_amount(ctx.get("cpp"))], fee_w)
+    _table_row(pdf, ["Health Insurance", "One-time", _fmt_amount(ctx.get("health_insurance"))], fee_w)
+    _table_row(pdf, ["Tata AIG 360", "One-time", _fmt_amount(ctx.get("tata_aig"))], fee_w)
+
+    pdf.ln(2)
+    # Contingent Charges
+    _section_header(pdf, "Contingent Charges")
+    sub_w = [page_width * 0.6, page_width * 0.4]
+    for i, group in enumerate(CONTINGENT_CHARGES):
+        if i:
+            pdf.ln(1)
+        for cols, header in group:
+            _table_row(pdf, cols, sub_w, header=header)
+
+    # Repayment Schedule
+    pdf.add_page()
+    _section_header(pdf, "Repayment Schedule")
+    sched_w = [page_width * 0.12, page_width * 0.18, page_width * 0.18, page_width * 0.18, page_width * 0.18, page_width * 0.16]
+    _table_row(pdf, ["Instalment No.", "Due Date", "Principal Component", "Interest Component", "Outstanding Principal", "EMI Amount"], sched_w, header=True, align_list=["C"]*6)
+
+    # Amortization schedule, starting from validity end (as provided)
+    schedule = sanction_terms.amortization_schedule(loan_amount, interest_rate, tenure_months, emi, validity_to)
+    for i, due_date, principal_comp, interest_comp, outstanding, emi_show in schedule:
+        _table_row(
+            pdf,
+            [str(i), due_date, f"Rs {principal_comp:,.2f}", f"Rs {interest_comp:,.2f}", f"Rs {outstanding:,.2f}", f"Rs {emi_show:,.2f}"],
+            sched_w,
+            align_list=["C", "C", "R", "R", "R", "R"],
+        )
+
+    pdf.ln(2)
+    # Borrower Declaration
+    _section_header(pdf, "Borrower Declaration")
+    pdf.set_font("Arial", size=10)
+    pdf.multi_cell(page_width, 6, "I hereby confirm that I have thoroughly read and understood the above Key Facts Statement and accept the terms of the sanctioned loan.")
+    pdf.ln(2)
+    decl_w = [page_width * 0.7, page_width * 0.3]
+    _table_row(pdf, ["Borrower Signature: __________________________", f"Date: {current_date}"], decl_w)
+
+    letter_path, _ = _emit(pdf, target)
+    return letter_path
+
+
+def render_evaluated_letter(target: Target, ctx: Dict[str, Any], loan: Dict[str, Any],
+                            evaluation: Dict[str, Any]) -> str:
+    """Draw the sanction letter for a loan approved after evaluation"""
+    customer_name = ctx.get("customer_name", "Customer")
+
+    # Create PDF with proper margins
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_margins(15, 15, 15)  # Left, Top, Right margins
+    pdf.set_auto_page_break(auto=True, margin=15)
+
+    # Get page width minus margins
+    page_width = pdf.w - 30  # Total width minus left and right margins
+
+    pdf.set_font("Arial", "B", 16)
+
+    # Title
+    pdf.cell(0, 10, "LOAN SANCTION LETTER", ln=1, align="C")
+    pdf.ln(10)
+
+    # Customer details
+    pdf.set_font("Arial", size=12)
+    pdf.cell(0, 8, f"Loan ID: {loan.get('loan_id', 'N/A')}", ln=1)
+    pdf.cell(0, 8, f"Customer Name: {customer_name}", ln=1)
+    if ctx.get("customer_id"):
+        pdf.cell(0, 8, f"Customer ID: {ctx.get('customer_id')}", ln=1)
+    pdf.ln(5)
+
+    # Loan details
+    pdf.set_font("Arial", "B", 12)
+    pdf.cell(0, 10, "Loan Details:", ln=1)
+    pdf.set_font("Arial", size=11)
+
+    approved_amount = loan.get("approved_amount", 0)
+    interest_rate = loan.get("interest_rate", 0)
+    tenure = loan.get("tenure_months", 36)
+    emi = evaluation.get("emi", 0)
+
+    pdf.cell(0, 8, f"Sanctioned Amount: Rs. {approved_amount:,.0f}", ln=1)
+    pdf.cell(0, 8, f"Loan Tenure: {tenure} months", ln=1)
+    pdf.cell(0, 8, f"Interest Rate: {interest_rate}% per annum", ln=1)
+    pdf.cell(0, 8, f"EMI: Rs. {emi:,.2f}", ln=1)
+    pdf.ln(5)
+
+    # Approval type
+    pdf.set_font("Arial", "B", 12)
+    pdf.cell(0, 10, "Approval Type: After Evaluation", ln=1)
+    pdf.set_font("Arial", size=10)
+    pdf.multi_cell(page_width, 6, "This loan was approved after detailed evaluation of your profile, documents, and eligibility criteria.", 0, "L")
+    pdf.ln(5)
+
+    # Terms and conditions
+    pdf.set_font("Arial", "B", 12)
+    pdf.cell(0, 10, "Terms & Conditions:", ln=1)
+    pdf.set_font("Arial", size=10)
+    pdf.multi_cell(page_width, 6, "1. This sanction is valid for 30 days from the date of issue.", 0, "L")
+    pdf.multi_cell(page_width, 6, "2. The loan is subject to completion of all documentation.", 0, "L")
+    pdf.multi_cell(page_width, 6, "3. Interest rates are subject to change as per market conditions.", 0, "L")
+    pdf.ln(5)
+
+    # Footer
+    pdf.set_font("Arial", "I", 10)
+    pdf.cell(0, 10, "This is a system-generated document after evaluation.", ln=1, align="C")
+    pdf.cell(0, 10, f"Generated on: {loan.get('approved_date', 'N/A')}", ln=1, align="C")
+
+    letter_path, _ = _emit(pdf, target)
+    return letter_path
+
+
+def timed(render, *args) -> Tuple[Any, float]:
+    """Run a render function and return (result, milliseconds spent)"""
+    started = time.perf_counter()
+    result = render(*args)
+    return result, (time.perf_counter() - started) * 1000.0
@@ -0,0 +1,55 @@
+import gzip
+import hashlib
+import os
+import re
+from typing import Optional
+
+from services.letter_sink import Buffer, LetterSink, write_atomic
+
+SANCTIONS_DIR = os.path.join(os.path.dirname(__file__), "..", "sanctions")
+
+LETTER_ID_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+class SanctionStore(LetterSink):
+    """
+    Content-addressed store for sanction letter PDFs.
+
+    A letter's id is the sha256 of its bytes and it lives at
+    sanctions/<id[:2]>/<id>.pdf, with a gzip copy next to it for clients that
+    accept compressed downloads. Stored files never change, so the id doubles
+    as the download ETag and identical letters are kept once.
+    """
+
+    def __init__(self, root: str = SANCTIONS_DIR):
+        self.root = root
+
+    def write(self, data: Buffer) -> str:
+        """Store the letter (if not already present) and return its path"""
+        letter_id = hashlib.sha256(data).hexdigest()
+        path = self._path(letter_id)
+        if not os.path.exists(path):
+            write_atomic(f"{path}.gz", gzip.compress(data, compresslevel=6, mtime=0))
+            write_atomic(path, data)
+        return path
+
+    def _path(self, letter_id: str) -> str:
+        return os.path.join(self.root, letter_id[:2], f"{letter_id}.pdf")
+
+    def path_for(self, letter_id: str) -> Optional[str]:
+        """Path of a stored letter, or None if the id is malformed or unknown"""
+        if not LETTER_ID_RE.match(letter_id or ""):
+            return None
+        path = self._path(letter_id)
+        return path if os.path.exists(path) else None
+
+    def letter_id(self, path: str) -> str:
+        """Id of the letter at path; files outside the store are hashed"""
+        name = os.path.splitext(os.path.basename(path))[0]
+        if LETTER_ID_RE.match(name):
+            return name
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 16), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
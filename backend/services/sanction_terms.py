@@ -0,0 +1,156 @@
+import html
+from datetime import datetime, timedelta
+from math import pow
+from typing import Any, Dict, List, Optional, Tuple
+
+# Days a sanction stays valid; the first instalment is scheduled from the end of validity
+VALIDITY_DAYS = 7
+
+ScheduleRow = Tuple[int, str, float, float, float, float]
+
+
+def compute_emi(principal: float, annual_rate: float, months: int) -> float:
+    """Reducing-balance EMI, rounded to paise (principal / n when the rate is zero)"""
+    principal = float(principal or 0)
+    n = int(months or 0)
+    r = float(annual_rate or 0) / (12 * 100.0)
+    if principal > 0 and n > 0 and r > 0:
+        return round(principal * r * pow(1 + r, n) / (pow(1 + r, n) - 1), 2)
+    if principal > 0 and n > 0:
+        return round(principal / n, 2)
+    return 0
+
+
+def letter_dates(now: Optional[datetime] = None) -> Dict[str, str]:
+    """Issue date and validity window printed on the letter (dd/mm/YYYY)"""
+    now = now or datetime.now()
+    return {
+        "issued": now.strftime("%d/%m/%Y"),
+        "valid_from": now.strftime("%d/%m/%Y"),
+        "valid_to": (now + timedelta(days=VALIDITY_DAYS)).strftime("%d/%m/%Y"),
+    }
+
+
+def processing_fee(ctx: Dict[str, Any], loan_amount: Any, offer_fee_pct: Any) -> Any:
+    """Explicit ctx["processing_fee"], else the percentage (ctx or offer) applied to the loan amount"""
+    fee = ctx.get("processing_fee")
+    if not isinstance(fee, (int, float)):
+        pct = ctx.get("processing_fee_pct")
+        if not isinstance(pct, (int, float)):
+            pct = offer_fee_pct
+        if isinstance(pct, (int, float)) and isinstance(loan_amount, (int, float)):
+            fee = round(loan_amount * (pct / 100.0))
+    return fee
+
+
+def amortization_schedule(principal: float, annual_rate: float, months: int,
+                          emi: float, start: str) -> List[ScheduleRow]:
+    """
+    Instalment rows (number, due date, principal, interest, outstanding, EMI).
+    start is the dd/mm/YYYY date instalments count from; the last row absorbs rounding.
+    """
+    principal = float(principal or 0)
+    n = int(months or 0)
+    r = float(annual_rate or 0) / (12 * 100.0)
+    emi_amt = float(emi or 0)
+    # If emi not provided (edge case), compute
+    if emi_amt <= 0 and r > 0 and n > 0:
+        emi_amt = principal * r * pow(1 + r, n) / (pow(1 + r, n) - 1)
+    start_date = datetime.strptime(start, "%d/%m/%Y")
+    first_day = start_date.replace(day=min(start_date.day, 28))
+    outstanding = principal
+    rows = []
+    for i in range(1, n + 1):
+        interest_comp = round(outstanding * r, 2)
+        principal_comp = round(emi_amt - interest_comp, 2) if emi_amt > 0 else 0
+        # Avoid negative on last row due to rounding
+        if i == n:
+            principal_comp = round(outstanding, 2)
+            emi_show = round(principal_comp + interest_comp, 2)
+        else:
+            emi_show = round(emi_amt, 2)
+        outstanding = max(0.0, round(outstanding - principal_comp, 2))
+        due_date = (first_day + timedelta(days=30 * i)).strftime("%d/%m/%Y")
+        rows.append((i, due_date, principal_comp, interest_comp, outstanding, emi_show))
+    return rows
+
+
+def build_preview(ctx: Dict[str, Any], customer_name: str, emi: float,
+                  now: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Structured summary of the sanction terms, from the same inputs and helpers as
+    the Key Facts Statement PDF but without drawing anything.
+    """
+    offer = ctx.get("chosen_offer", {})
+    loan_amount = ctx.get("loan_amount_requested", 0)
+    tenure_months = ctx.get("loan_tenure_requested", 0)
+    interest_rate = offer.get("base_interest", 0)
+    dates = letter_dates(now)
+    schedule = amortization_schedule(loan_amount, interest_rate, tenure_months, emi, dates["valid_to"])
+    total_interest = round(sum(row[3] for row in schedule), 2)
+    return {
+        "customer_name": customer_name,
+        "customer_id": ctx.get("customer_id"),
+        "lender": "Titan Bank",
+        "loan_type": "Personal Loan",
+        "sanctioned_amount": loan_amount,
+        "tenure_months": tenure_months,
+        "interest_rate": interest_rate,
+        "interest_type": "Fixed",
+        "emi": emi,
+        "processing_fee": processing_fee(ctx, loan_amount, offer.get("processing_fee_pct", 0)),
+        "total_interest": total_interest,
+        "total_payable": round(sum(row[5] for row in schedule), 2),
+        "first_emi_date": schedule[0][1] if schedule else None,
+        "last_emi_date": schedule[-1][1] if schedule else None,
+        "issued_on": dates["issued"],
+        "valid_from": dates["valid_from"],
+        "valid_to": dates["valid_to"],
+        "foreclosure_charges": "3% of principal outstanding",
+        "schedule": [
+            {"instalment": i, "due_date": due, "principal": p, "interest": interest, "outstanding": o, "emi": e}
+            for i, due, p, interest, o, e in schedule
+        ],
+    }
+
+
+def format_amount(value: Any) -> str:
+    """Rupee amount, or the text as-is for non-numeric values (e.g. 'Not opted')"""
+    return f"Rs {value:,.2f}" if isinstance(value, (int, float)) else str(value or "-")
+
+
+def _money(value: Any) -> str:
+    return html.escape(format_amount(value))
+
+
+def render_preview_html(preview: Dict[str, Any]) -> str:
+    """Standalone HTML page for a preview (no scripts, every value escaped)"""
+    esc = lambda value: html.escape(str(value if value is not None else "-"))
+    terms = [
+        ("Customer", esc(preview["customer_name"])),
+        ("Sanctioned Amount", _money(preview["sanctioned_amount"])),
+        ("Tenure", f"{esc(preview['tenure_months'])} months"),
+        ("Interest Rate", f"{esc(preview['interest_rate'])}% p.a. ({esc(preview['interest_type'])})"),
+        ("EMI", _money(preview["emi"])),
+        ("Processing Fee", _money(preview["processing_fee"])),
+        ("Total Interest", _money(preview["total_interest"])),
+        ("Total Payable", _money(preview["total_payable"])),
+        ("First EMI", esc(preview["first_emi_date"])),
+        ("Valid", f"{esc(preview['valid_from'])} to {esc(preview['valid_to'])}"),
+    ]
+    term_rows = "".join(f"<tr><th>{label}</th><td>{value}</td></tr>" for label, value in terms)
+    schedule_rows = "".join(
+        f"<tr><td>{row['instalment']}</td><td>{esc(row['due_date'])}</td><td>{_money(row['principal'])}</td>"
+        f"<td>{_money(row['interest'])}</td><td>{_money(row['outstanding'])}</td><td>{_money(row['emi'])}</td></tr>"
+        for row in preview["schedule"]
+    )
+    return (
+        "<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>Sanction Preview</title>"
+        "<style>body{font-family:Arial,sans-serif;margin:24px}table{border-collapse:collapse;margin-bottom:16px}"
+        "th,td{border:1px solid #ccc;padding:4px 8px;text-align:left}</style></head><body>"
+        f"<h2>{esc(preview['lender'])} - Sanction Preview</h2>"
+        f"<table>{term_rows}</table>"
+        "<h3>Repayment Schedule</h3><table><tr><th>No.</th><th>Due Date</th><th>Principal</th>"
+        f"<th>Interest</th><th>Outstanding</th><th>EMI</th></tr>{schedule_rows}</table>"
+        "</body></html>"
+    )
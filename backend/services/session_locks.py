@@ -0,0 +1,57 @@
+import asyncio
+import os
+import time
+import zlib
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+from services.metrics import MetricsRegistry, registry as default_registry
+
+DEFAULT_STRIPES = int(os.getenv("SESSION_LOCK_STRIPES", "64"))
+
+
+class SessionLocks:
+    """
+    Striped locks that serialize chat turns for one key (session or customer).
+
+    A turn reads the stored context, runs the engine and writes the result back;
+    two overlapping turns for the same key (a double-click, a client retry) would
+    otherwise both start from the same snapshot and both create loans and letters.
+    Keys hash onto a fixed set of asyncio locks, so memory stays constant and
+    unrelated sessions only wait on each other when they share a stripe.
+    """
+
+    def __init__(self, stripes: int = DEFAULT_STRIPES, metrics: Optional[MetricsRegistry] = None):
+        self.stripes = max(1, stripes)
+        self._locks = [asyncio.Lock() for _ in range(self.stripes)]
+        self.metrics = metrics or default_registry
+        self.acquired = 0
+        self.contended = 0
+
+    def _stripe(self, key: str) -> asyncio.Lock:
+        # crc32 rather than hash(): stable across processes, so stripes can be compared between workers
+        return self._locks[zlib.crc32(key.encode("utf-8")) % self.stripes]
+
+    @asynccontextmanager
+    async def hold(self, key: Optional[str]) -> AsyncIterator[None]:
+        """Hold the key's stripe for the duration of a turn; a falsy key (a brand-new session) doesn't lock"""
+        if not key:
+            yield
+            return
+        lock = self._stripe(key)
+        if lock.locked():
+            self.contended += 1
+            self.metrics.incr("session_lock.contended")
+        started = time.perf_counter()
+        async with lock:
+            self.metrics.observe("session_lock.wait_ms", (time.perf_counter() - started) * 1000.0)
+            self.acquired += 1
+            yield
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "stripes": self.stripes,
+            "held": sum(1 for lock in self._locks if lock.locked()),
+            "acquired": self.acquired,
+            "contended": self.contended,
+        }
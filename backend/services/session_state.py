@@ -0,0 +1,257 @@
+import copy
+import json
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterator, List, Mapping, Optional, TypedDict
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None  # type: ignore
+
+from fastapi.responses import Response
+
+
+class Offer(TypedDict, total=False):
+    customer_id: str
+    max_amount: float
+    tenure_options: List[int]
+    base_interest: float
+    processing_fee_pct: float
+
+
+class UnderwritingResult(TypedDict, total=False):
+    emi: float
+    foir: float
+    credit_score: int
+    monthly_income: float
+    existing_emi: float
+    total_obligation: float
+    reason: str
+
+
+_UNSET = object()
+
+
+class SessionState(MutableMapping):
+    """
+    Conversation state of one chat session.
+
+    Known keys live in slots (no per-instance __dict__, so a live session costs a
+    fraction of an equivalent dict); anything else a client or agent adds goes to
+    a small overflow dict. It behaves exactly like the dict the agents always used:
+    an unset slot is an absent key, and None is a value.
+    """
+
+    # Journey
+    stage: str
+    session_id: str
+    session_started: bool
+    customer_id: str
+    is_new_customer: bool
+    matched_customer: Dict[str, Any]
+    # Customer details (several are entered on the client)
+    customer_name: str
+    customer_mobile: str
+    customer_email: str
+    email_verified: bool
+    customer_address: str
+    customer_gender: str
+    customer_nationality: str
+    customer_education: str
+    mobile: str
+    city: str
+    pan: str
+    aadhaar_masked: str
+    employment_type: str
+    monthly_income: float
+    existing_emi: float
+    # Sales
+    collecting_field: str
+    loan_amount_requested: float
+    loan_tenure_requested: int
+    requested_amount: float
+    preferred_tenure: int
+    purpose: str
+    purpose_skipped: bool
+    offer_pending: bool
+    chosen_offer: Offer
+    sales_done: bool
+    life_insurance: str
+    health_insurance: str
+    general_insurance: str
+    one_assist: str
+    cpp: str
+    tata_aig: str
+    processing_fee: float
+    processing_fee_pct: float
+    documentation_charges: float
+    stamp_duty: float
+    valuation_fees: float
+    bpi_days: int
+    # Pre-approved path
+    preapproved_offer: Dict[str, Any]
+    preapproved_offer_shown: bool
+    preapproved_limit: float
+    preapproved_interest: float
+    preapproved_confirmed: bool
+    preapproved_declined: bool
+    # Verification and documents
+    kyc_status: str
+    kyc_stage: str
+    bank_statement_uploaded: bool
+    id_address_proof_uploaded: bool
+    salary_slip_uploaded: bool
+    salary_slip_file_id: str
+    business_docs_uploaded: bool
+    pan_card_uploaded: bool
+    all_documents_uploaded: bool
+    awaiting_verification_confirm: bool
+    awaiting_bank_details: bool
+    awaiting_proceed: bool
+    awaiting_sanction_confirm: bool
+    bank_ifsc: str
+    bank_account: str
+    verification_done: bool
+    credit_bureau_consent: bool
+    credit_check_consent: bool
+    # Underwriting and evaluation
+    credit_score: int
+    decision: str
+    underwriting_result: UnderwritingResult
+    detailed_evaluation_started: bool
+    ready_for_evaluation: bool
+    evaluation_done: bool
+    evaluation_result: Dict[str, Any]
+    eligible_amount: float
+    suggested_amount: float
+    # Sanction
+    loan_id: str
+    proposal_number: str
+    sanction_date: str
+    disbursal_date: str
+    sanction_letter_id: str
+    sanction_letter_url: str
+
+    __slots__ = tuple(__annotations__) + ("_extra",)
+
+    def __init__(self, data: Optional[Mapping[str, Any]] = None):
+        self._extra: Dict[str, Any] = {}
+        if data:
+            for key, value in data.items():
+                self[key] = value
+
+    @classmethod
+    def from_mapping(cls, data: Optional[Mapping[str, Any]]) -> "SessionState":
+        return data if isinstance(data, cls) else cls(data)
+
+    def __getitem__(self, key: str) -> Any:
+        if key in _FIELDS:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        return self._extra[key]
+
+    def __setitem__(self, key: str, value: Any):
+        if key in _FIELDS:
+            setattr(self, key, value)
+        else:
+            self._extra[key] = value
+
+    def __delitem__(self, key: str):
+        if key in _FIELDS:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        else:
+            del self._extra[key]
+
+    def __iter__(self) -> Iterator[str]:
+        for key in _FIELD_ORDER:
+            if getattr(self, key, _UNSET) is not _UNSET:
+                yield key
+        yield from self._extra
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __contains__(self, key: object) -> bool:
+        if key in _FIELDS:
+            return hasattr(self, key)  # type: ignore[arg-type]
+        return key in self._extra
+
+    def get(self, key: str, default: Any = None) -> Any:
+        # Hot path: agents call get() dozens of times per turn
+        if key in _FIELDS:
+            return getattr(self, key, default)
+        return self._extra.get(key, default)
+
+    def copy(self) -> Dict[str, Any]:
+        """Shallow plain-dict copy (e.g. for event payloads)"""
+        out = {}
+        for key in _FIELD_ORDER:
+            value = getattr(self, key, _UNSET)
+            if value is not _UNSET:
+                out[key] = value
+        out.update(self._extra)
+        return out
+
+    def __deepcopy__(self, memo: Dict[int, Any]) -> "SessionState":
+        clone = SessionState()
+        for key, value in self.copy().items():
+            clone[key] = copy.deepcopy(value, memo)
+        return clone
+
+    def __reduce__(self):
+        return SessionState, (self.copy(),)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, Mapping):
+            return self.copy() == dict(other.items())
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return repr(self.copy())
+
+    def to_wire(self) -> Dict[str, Any]:
+        """Compact encoding for clients and storage: unset and None values are left out"""
+        out = {}
+        for key in _FIELD_ORDER:
+            value = getattr(self, key, None)
+            if value is not None:
+                out[key] = value
+        for key, value in self._extra.items():
+            if value is not None:
+                out[key] = value
+        return out
+
+    @classmethod
+    def from_wire(cls, data: Optional[Mapping[str, Any]]) -> "SessionState":
+        return cls(data)
+
+
+_FIELD_ORDER: List[str] = list(SessionState.__annotations__)
+_FIELDS = frozenset(_FIELD_ORDER)
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, Mapping):
+        return dict(value.items())
+    return str(value)
+
+
+def dumps(payload: Any) -> bytes:
+    """Compact JSON (orjson when installed)"""
+    if orjson is not None:
+        return orjson.dumps(payload, default=_default)
+    return json.dumps(payload, default=_default, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def wire_response(payload: Dict[str, Any], status_code: int = 200) -> Response:
+    """
+    JSON response for a chat turn that skips response_model re-validation;
+    SessionState values are sent in their compact wire form.
+    """
+    body = {k: (v.to_wire() if isinstance(v, SessionState) else v) for k, v in payload.items() if v is not None}
+    return Response(dumps(body), status_code=status_code, media_type="application/json")
@@ -0,0 +1,230 @@
+import copy
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from services.session_state import SessionState
+from services.state_backend import StateBackend, get_state_backend, valid_item_key
+
+DEFAULT_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "1800"))
+DEFAULT_MAX_SESSIONS = int(os.getenv("SESSION_MAX_ENTRIES", "10000"))
+DEFAULT_SPILL_DB = os.getenv("SESSION_SPILL_DB") or None
+
+_MISSING = object()
+
+
+def context_delta(before: Mapping[str, Any], after: Mapping[str, Any]) -> Tuple[Dict[str, Any], List[str]]:
+    """Top-level keys that changed or were added, and keys that were removed"""
+    changed = {k: v for k, v in after.items() if before.get(k, _MISSING) != v}
+    removed = [k for k in before if k not in after]
+    return changed, removed
+
+
+class SessionStore:
+    """
+    Server-side chat contexts keyed by session id.
+
+    With a shared state backend, each session is an item of the `name`
+    collection there, so every worker process runs a turn on the latest context;
+    its TTL restarts with each turn. Without one, sessions live in this
+    process's LRU with a sliding TTL, and when a spill database is configured,
+    sessions pushed out by the size limit are written to sqlite and brought
+    back on their next turn instead of being lost.
+    """
+
+    def __init__(self, max_sessions: int = DEFAULT_MAX_SESSIONS,
+                 ttl_seconds: float = DEFAULT_TTL_SECONDS,
+                 spill_db: Optional[str] = DEFAULT_SPILL_DB,
+                 backend: Optional[StateBackend] = None,
+                 name: str = "sessions"):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.backend = backend
+        self.name = name
+        self._sessions: "OrderedDict[str, Tuple[float, SessionState]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.spilled = 0
+        self._db: Optional[sqlite3.Connection] = None
+        if spill_db and backend is None:
+            os.makedirs(os.path.dirname(os.path.abspath(spill_db)), exist_ok=True)
+            self._db = sqlite3.connect(spill_db, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, expires_at REAL, context TEXT)"
+            )
+            self._db.commit()
+
+    @staticmethod
+    def new_id() -> str:
+        # Session ids are the only credential a session-mode client presents, so keep them unguessable
+        return f"SESS_{secrets.token_hex(16).upper()}"
+
+    def get(self, session_id: str) -> Optional[SessionState]:
+        """
+        Stored context for a session (refreshing its TTL), or None if unknown or expired.
+        The returned dict is the stored copy: copy it before mutating.
+        """
+        if self.backend is not None:
+            value = self.backend.get_item(self.name, session_id)
+            with self._lock:
+                if value is None:
+                    self.misses += 1
+                    return None
+                self.hits += 1
+            return SessionState(value)
+        now = time.time()
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                entry = self._unspill(session_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, ctx = entry
+            if expires_at <= now:
+                self._sessions.pop(session_id, None)
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._sessions[session_id] = (now + self.ttl_seconds, ctx)
+            self._sessions.move_to_end(session_id)
+            self._evict_overflow()
+            self.hits += 1
+            return ctx
+
+    def put(self, session_id: str, ctx: Mapping[str, Any]):
+        """Save a session's context, evicting (or spilling) the least recently used ones if full"""
+        ctx = SessionState.from_mapping(ctx)
+        if self.backend is not None:
+            self.backend.put_item(self.name, session_id, ctx.copy(), self.ttl_seconds)
+            return
+        with self._lock:
+            self._sessions[session_id] = (time.time() + self.ttl_seconds, ctx)
+            self._sessions.move_to_end(session_id)
+            self._evict_overflow()
+
+    def exists(self, session_id: str) -> bool:
+        return self.get(session_id) is not None
+
+    def delete(self, session_id: str):
+        if self.backend is not None:
+            self.backend.delete_item(self.name, session_id)
+            return
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            if self._db is not None:
+                self._db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+                self._db.commit()
+
+    def purge_expired(self) -> int:
+        """Drop expired sessions from memory and the spill database (or the shared backend)"""
+        if self.backend is not None:
+            return self.backend.purge_items(self.name)
+        now = time.time()
+        with self._lock:
+            stale = [sid for sid, (expires_at, _) in self._sessions.items() if expires_at <= now]
+            for sid in stale:
+                del self._sessions[sid]
+            if self._db is not None:
+                self._db.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,))
+                self._db.commit()
+            self.expired += len(stale)
+        return len(stale)
+
+    def _evict_overflow(self):
+        while len(self._sessions) > self.max_sessions:
+            evicted_id, evicted = self._sessions.popitem(last=False)
+            self._spill(evicted_id, evicted)
+
+    def _spill(self, session_id: str, entry: Tuple[float, SessionState]):
+        expires_at, ctx = entry
+        if self._db is None or expires_at <= time.time():
+            return
+        self._db.execute(
+            "INSERT OR REPLACE INTO sessions (session_id, expires_at, context) VALUES (?, ?, ?)",
+            (session_id, expires_at, json.dumps(ctx.copy(), default=str)),
+        )
+        self._db.commit()
+        self.spilled += 1
+
+    def _unspill(self, session_id: str) -> Optional[Tuple[float, SessionState]]:
+        if self._db is None:
+            return None
+        row = self._db.execute(
+            "SELECT expires_at, context FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        self._db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        self._db.commit()
+        return row[0], SessionState(json.loads(row[1]))
+
+    def open_turn(self, session_id: Optional[str], context: Optional[Dict[str, Any]],
+                  initial: Dict[str, Any]) -> Optional[Tuple[str, SessionState, Optional[SessionState]]]:
+        """
+        Resolve the context a chat turn runs on.
+
+        With a session id the stored context is used and `context` is only a patch of
+        client-entered fields. Without one (legacy clients) `context` is the whole
+        context, as before. Returns (session_id, working ctx, stored snapshot or None
+        in legacy mode), or None when the session is unknown or expired.
+        """
+        if session_id:
+            stored = self.get(session_id)
+            if stored is None:
+                return None
+            ctx = copy.deepcopy(stored)
+            ctx.update({k: v for k, v in (context or {}).items() if v is not None})
+            return session_id, ctx, stored
+        ctx = SessionState.from_wire(context or initial)
+        if not valid_item_key(ctx.get("session_id")):
+            ctx["session_id"] = self.new_id()
+        return ctx["session_id"], ctx, None
+
+    def close_turn(self, session_id: str, ctx: Mapping[str, Any],
+                   stored: Optional[SessionState]) -> Dict[str, Any]:
+        """
+        Persist the turn and build the context part of the response: the full context
+        for legacy clients, otherwise only what changed this turn.
+        """
+        ctx = SessionState.from_mapping(ctx)
+        if stored is None:
+            # The full context a client sent (e.g. its fallback after a 404) replaces whatever
+            # is stored under that id, so later session turns continue from this one
+            self.put(session_id, copy.deepcopy(ctx))
+            return {"session_id": session_id, "context": ctx}
+        self.put(session_id, ctx)
+        changed, removed = context_delta(stored, ctx)
+        return {"session_id": session_id, "context_delta": changed, "context_removed": removed}
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "spilled": self.spilled,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "spill_db": self._db is not None,
+            "backend": self.backend.kind if self.backend is not None else None,
+        }
+
+
+def create_session_store(name: str) -> SessionStore:
+    """
+    Sessions for one app, kept in the process-wide state backend so that every
+    worker sees them; with STATE_BACKEND=memory (one process) they stay in the
+    local LRU, where SESSION_MAX_ENTRIES and SESSION_SPILL_DB apply.
+    """
+    backend = get_state_backend()
+    return SessionStore(backend=None if backend.kind == "memory" else backend, name=name)
@@ -0,0 +1,433 @@
+import copy
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple, TypeVar
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows: locking is per process only
+    fcntl = None  # type: ignore
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+# Runtime state that isn't one of the data/ documents: item collections (sessions,
+# sanction jobs), lock files and the sqlite database; kept out of data/ and git
+STATE_DIR = os.getenv("STATE_DIR") or os.path.join(os.path.dirname(__file__), "..", "state")
+# file (default): data/<name>.json as before, safe across worker processes
+# sqlite: one database at STATE_DB; memory: per process, nothing persisted
+STATE_BACKEND = os.getenv("STATE_BACKEND", "file")
+STATE_DB = os.getenv("STATE_DB") or os.path.join(STATE_DIR, "state.db")
+# How often a process sweeps expired items out of a collection it writes to
+ITEM_PURGE_SECONDS = float(os.getenv("STATE_ITEM_PURGE_SECONDS", "300"))
+
+# Item keys end up in file names, so only plain ids (session, job and letter ids) are accepted
+ITEM_KEY_RE = re.compile(r"^[A-Za-z0-9_-]{1,128}$")
+
+T = TypeVar("T")
+
+
+def valid_item_key(key: Any) -> bool:
+    return isinstance(key, str) and ITEM_KEY_RE.match(key) is not None
+
+
+def _check_item_key(key: str):
+    if not valid_item_key(key):
+        raise ValueError(f"Invalid item key {key!r}")
+
+
+class StateBackend:
+    """
+    Named JSON documents (the loans list, the OTP dict, ...) shared by every
+    worker process on a host.
+
+    read() returns the current value; treat it as read-only. mutate() runs fn on
+    the current value under a lock that spans processes, stores the value fn
+    left behind and returns fn's result, so read-modify-write cycles (allocating
+    a loan id, using up an OTP) can't interleave between workers.
+
+    Items are small keyed records that expire (chat sessions, sanction job
+    status), grouped into named collections. Each is stored on its own, so
+    writing one doesn't rewrite the others; the last write of a key wins.
+    """
+
+    kind = "abstract"
+
+    def __init__(self):
+        self._purged_at: Dict[str, float] = {}
+
+    def read(self, name: str, default: Any = None) -> Any:
+        raise NotImplementedError
+
+    def mutate(self, name: str, fn: Callable[[Any], T], default: Any = None) -> T:
+        raise NotImplementedError
+
+    def get_item(self, name: str, key: str) -> Optional[Any]:
+        """An item's value, or None if it is unknown or expired"""
+        raise NotImplementedError
+
+    def put_item(self, name: str, key: str, value: Any, ttl_seconds: float):
+        """Store an item that expires ttl_seconds from now"""
+        raise NotImplementedError
+
+    def delete_item(self, name: str, key: str):
+        raise NotImplementedError
+
+    def purge_items(self, name: str) -> int:
+        """Drop a collection's expired items; returns how many"""
+        raise NotImplementedError
+
+    def _item_written(self, name: str):
+        # Expired items are swept by the writers, at most every ITEM_PURGE_SECONDS per collection
+        now = time.time()
+        if now - self._purged_at.get(name, 0.0) >= ITEM_PURGE_SECONDS:
+            self._purged_at[name] = now
+            self.purge_items(name)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.kind}
+
+
+class MemoryStateBackend(StateBackend):
+    """Values in this process only (tests, throwaway runs)"""
+
+    kind = "memory"
+
+    def __init__(self):
+        super().__init__()
+        self._values: Dict[str, Any] = {}
+        self._items: Dict[str, Dict[str, Tuple[float, Any]]] = {}
+        self._lock = threading.RLock()
+
+    def read(self, name: str, default: Any = None) -> Any:
+        with self._lock:
+            return self._values.get(name, default)
+
+    def mutate(self, name: str, fn: Callable[[Any], T], default: Any = None) -> T:
+        with self._lock:
+            if name not in self._values:
+                self._values[name] = copy.deepcopy(default)
+            return fn(self._values[name])
+
+    def get_item(self, name: str, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._items.get(name, {}).get(key)
+            if entry is None or entry[0] <= time.time():
+                return None
+            return copy.deepcopy(entry[1])
+
+    def put_item(self, name: str, key: str, value: Any, ttl_seconds: float):
+        _check_item_key(key)
+        with self._lock:
+            self._items.setdefault(name, {})[key] = (time.time() + ttl_seconds, copy.deepcopy(value))
+        self._item_written(name)
+
+    def delete_item(self, name: str, key: str):
+        with self._lock:
+            self._items.get(name, {}).pop(key, None)
+
+    def purge_items(self, name: str) -> int:
+        now = time.time()
+        with self._lock:
+            items = self._items.get(name, {})
+            stale = [key for key, (expires_at, _) in items.items() if expires_at <= now]
+            for key in stale:
+                del items[key]
+        return len(stale)
+
+
+class FileStateBackend(StateBackend):
+    """
+    One JSON file per name (data/loans.json, data/events.json, ...), in the format
+    the services always wrote. Writers hold an flock on a lock file in
+    state/locks/, start from the file's current contents and replace it
+    atomically; readers re-parse a file only when its stat signature changed,
+    i.e. another process wrote it.
+
+    Items are files too, state/<collection>/<key>.json, each replaced atomically.
+    A file's mtime is set to its expiry time, so sweeping needs only a stat().
+    """
+
+    kind = "file"
+
+    def __init__(self, directory: str = DATA_DIR, paths: Optional[Dict[str, str]] = None,
+                 state_dir: str = STATE_DIR):
+        super().__init__()
+        self.directory = directory
+        self.paths = dict(paths or {})
+        self.state_dir = state_dir
+        self._cache: Dict[str, Tuple[Optional[Tuple[int, int, int]], Any]] = {}
+        self._lock = threading.RLock()
+        self.reloads = 0
+        self.writes = 0
+
+    def path_for(self, name: str) -> str:
+        return self.paths.get(name) or os.path.join(self.directory, f"{name}.json")
+
+    @staticmethod
+    def _signature(path: str) -> Optional[Tuple[int, int, int]]:
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        # Files are replaced, never rewritten in place, so the inode changes on every write
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def _load(self, name: str, default: Any) -> Any:
+        path = self.path_for(name)
+        signature = self._signature(path)
+        cached = self._cache.get(name)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        value = copy.deepcopy(default)
+        if signature is not None:
+            try:
+                with open(path, "r") as f:
+                    value = json.load(f)
+            except (OSError, ValueError):
+                # An unreadable file starts over, as the services' own loaders did
+                pass
+            self.reloads += 1
+        self._cache[name] = (signature, value)
+        return value
+
+    @contextmanager
+    def _exclusive(self, name: str) -> Iterator[None]:
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            # Named after the document's path, so processes writing the same file share the lock
+            path = os.path.abspath(self.path_for(name))
+            digest = hashlib.sha1(path.encode("utf-8")).hexdigest()[:12]
+            lock_path = os.path.join(self.state_dir, "locks", f"{name}-{digest}.lock")
+            os.makedirs(os.path.dirname(os.path.abspath(lock_path)), exist_ok=True)
+            with open(lock_path, "a") as handle:
+                fcntl.flock(handle, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def read(self, name: str, default: Any = None) -> Any:
+        with self._lock:
+            return self._load(name, default)
+
+    def mutate(self, name: str, fn: Callable[[Any], T], default: Any = None) -> T:
+        with self._exclusive(name):
+            value = self._load(name, default)
+            try:
+                result = fn(value)
+            except Exception:
+                # fn may have half-changed the cached value; re-read the file next time
+                self._cache.pop(name, None)
+                raise
+            path = self.path_for(name)
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(value, f, indent=2)
+            os.replace(tmp_path, path)
+            self._cache[name] = (self._signature(path), value)
+            self.writes += 1
+            return result
+
+    def _item_path(self, name: str, key: str) -> str:
+        return os.path.join(self.state_dir, name, f"{key}.json")
+
+    def get_item(self, name: str, key: str) -> Optional[Any]:
+        if not valid_item_key(key):
+            return None
+        try:
+            with open(self._item_path(name, key), "r") as f:
+                if os.fstat(f.fileno()).st_mtime <= time.time():
+                    return None
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put_item(self, name: str, key: str, value: Any, ttl_seconds: float):
+        _check_item_key(key)
+        path = self._item_path(name, key)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(value, f, default=str)
+        expires_at = time.time() + ttl_seconds
+        os.utime(tmp_path, (expires_at, expires_at))
+        os.replace(tmp_path, path)
+        self.writes += 1
+        self._item_written(name)
+
+    def delete_item(self, name: str, key: str):
+        if not valid_item_key(key):
+            return
+        try:
+            os.remove(self._item_path(name, key))
+        except FileNotFoundError:
+            pass
+
+    def purge_items(self, name: str) -> int:
+        now = time.time()
+        removed = 0
+        try:
+            entries = os.scandir(os.path.join(self.state_dir, name))
+        except FileNotFoundError:
+            return 0
+        with entries:
+            for entry in entries:
+                if entry.name.endswith(".json") and entry.stat().st_mtime <= now:
+                    try:
+                        os.remove(entry.path)
+                        removed += 1
+                    except FileNotFoundError:
+                        pass  # swept by another worker
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.kind, "directory": os.path.abspath(self.directory),
+                "state_dir": os.path.abspath(self.state_dir),
+                "reloads": self.reloads, "writes": self.writes}
+
+
+class SqliteStateBackend(StateBackend):
+    """
+    All values in one sqlite database (WAL mode), each stored as a JSON document
+    with a version number. Readers re-parse a value only when its version moved.
+    A name that isn't in the database yet is seeded from data/<name>.json, so
+    switching backends keeps existing loans and KYC records. Items are rows of
+    their own table, keyed by (collection, key).
+    """
+
+    kind = "sqlite"
+
+    def __init__(self, path: str = STATE_DB, seed_directory: Optional[str] = DATA_DIR):
+        super().__init__()
+        self.path = path
+        self.seed_directory = seed_directory
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS state (name TEXT PRIMARY KEY, version INTEGER NOT NULL, value TEXT NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS items (name TEXT NOT NULL, key TEXT NOT NULL, expires_at REAL NOT NULL, "
+            "value TEXT NOT NULL, PRIMARY KEY (name, key))"
+        )
+        self._cache: Dict[str, Tuple[int, Any]] = {}
+        self._lock = threading.RLock()
+        self.reloads = 0
+        self.writes = 0
+
+    def _seed(self, name: str, default: Any) -> Any:
+        if self.seed_directory:
+            path = os.path.join(self.seed_directory, f"{name}.json")
+            try:
+                with open(path, "r") as f:
+                    return json.load(f)
+            except (OSError, ValueError):
+                pass
+        return copy.deepcopy(default)
+
+    def _load(self, name: str, default: Any) -> Tuple[int, Any]:
+        row = self._db.execute("SELECT version FROM state WHERE name = ?", (name,)).fetchone()
+        version = row[0] if row else 0
+        cached = self._cache.get(name)
+        if cached is not None and cached[0] == version:
+            return cached
+        if row:
+            value = json.loads(self._db.execute("SELECT value FROM state WHERE name = ?", (name,)).fetchone()[0])
+            self.reloads += 1
+        else:
+            value = self._seed(name, default)
+        self._cache[name] = (version, value)
+        return version, value
+
+    def read(self, name: str, default: Any = None) -> Any:
+        with self._lock:
+            return self._load(name, default)[1]
+
+    def mutate(self, name: str, fn: Callable[[Any], T], default: Any = None) -> T:
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so two workers can't both read version n
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                version, value = self._load(name, default)
+                result = fn(value)
+                self._db.execute(
+                    "INSERT INTO state (name, version, value) VALUES (?, ?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET version = excluded.version, value = excluded.value",
+                    (name, version + 1, json.dumps(value)),
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                self._cache.pop(name, None)
+                raise
+            self._cache[name] = (version + 1, value)
+            self.writes += 1
+            return result
+
+    def get_item(self, name: str, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._db.execute("SELECT value FROM items WHERE name = ? AND key = ? AND expires_at > ?",
+                                   (name, key, time.time())).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_item(self, name: str, key: str, value: Any, ttl_seconds: float):
+        _check_item_key(key)
+        data = json.dumps(value, default=str)
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO items (name, key, expires_at, value) VALUES (?, ?, ?, ?)",
+                             (name, key, time.time() + ttl_seconds, data))
+            self.writes += 1
+        self._item_written(name)
+
+    def delete_item(self, name: str, key: str):
+        with self._lock:
+            self._db.execute("DELETE FROM items WHERE name = ? AND key = ?", (name, key))
+
+    def purge_items(self, name: str) -> int:
+        with self._lock:
+            return self._db.execute("DELETE FROM items WHERE name = ? AND expires_at <= ?",
+                                    (name, time.time())).rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.kind, "path": os.path.abspath(self.path),
+                "reloads": self.reloads, "writes": self.writes}
+
+
+def create_state_backend(kind: Optional[str] = None) -> StateBackend:
+    kind = (kind or STATE_BACKEND).lower()
+    if kind == "memory":
+        return MemoryStateBackend()
+    if kind == "sqlite":
+        return SqliteStateBackend()
+    if kind != "file":
+        raise ValueError(f"Unknown STATE_BACKEND {kind!r} (expected file, sqlite or memory)")
+    return FileStateBackend()
+
+
+_default_backend: Optional[StateBackend] = None
+_default_lock = threading.Lock()
+
+
+def get_state_backend() -> StateBackend:
+    """The process-wide backend picked by STATE_BACKEND, created on first use"""
+    global _default_backend
+    with _default_lock:
+        if _default_backend is None:
+            _default_backend = create_state_backend()
+        return _default_backend
+
+
+def set_state_backend(backend: StateBackend):
+    """Replace the process-wide backend, e.g. a memory one for a replay; call before services are built"""
+    global _default_backend
+    with _default_lock:
+        _default_backend = backend
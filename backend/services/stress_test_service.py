@@ -0,0 +1,335 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+
+from services.eligibility_service import EligibilityService
+from services.state_backend import get_state_backend
+
+CUSTOMERS_FILE = os.path.join(os.path.dirname(__file__), "..", "data", "customers.json")
+OFFERS_FILE = os.path.join(os.path.dirname(__file__), "..", "data", "offers.json")
+
+# Below this many scenarios a process pool costs more than it saves
+PARALLEL_MIN_SCENARIOS = 64
+
+# Portfolio arrays shared with pool workers through the initializer
+_worker_portfolio: Optional[Dict[str, Any]] = None
+
+
+def _emi(principal: np.ndarray, annual_rate: np.ndarray, months: np.ndarray) -> np.ndarray:
+    """Vectorized version of the EMI formula used by underwriting and eligibility"""
+    r = annual_rate / (12 * 100)
+    safe_months = np.maximum(months, 1)
+    growth = np.power(1 + r, safe_months)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        amortizing = principal * r * growth / (growth - 1)
+    emi = np.where(r > 0, amortizing, principal / safe_months)
+    return np.where(months > 0, emi, 0.0)
+
+
+def _percentiles(values: np.ndarray) -> Dict[str, float]:
+    if values.size == 0:
+        return {}
+    p = np.percentile(values, [5, 50, 95])
+    return {
+        "mean": round(float(values.mean()), 4),
+        "std": round(float(values.std()), 4),
+        "p5": round(float(p[0]), 4),
+        "p50": round(float(p[1]), 4),
+        "p95": round(float(p[2]), 4),
+    }
+
+
+def _evaluate(portfolio: Dict[str, Any], rate_shock_bps: float, income_factor: np.ndarray) -> Dict[str, Any]:
+    """
+    Apply the eligibility rules to every application and booked loan under one scenario.
+    income_factor is either a scalar array or one multiplier per customer.
+    """
+    rules = portfolio["rules"]
+    app = portfolio["applications"]
+    loans = portfolio["loans"]
+
+    # Applications: each customer's pre-approved offer, repriced at the shocked rate
+    income = app["income"] * (income_factor if income_factor.ndim == 0 else income_factor[app["customer_index"]])
+    emi = _emi(app["amount"], app["rate"] + rate_shock_bps / 100.0, app["tenure"])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        foir = np.where(income > 0, (app["existing_emi"] + emi) / income, 1.0)
+    approved = (
+        (income >= rules["min_monthly_income"])
+        & (app["tenure"] <= rules["max_tenure_months"])
+        & (app["credit_score"] >= rules["min_credit_score"])
+        & (foir <= rules["max_foir_auto_approve"])
+    )
+    breached = foir > rules["max_foir_refer"]
+
+    # Booked loans are fixed rate, so only the income shock moves their FOIR
+    loan_income = loans["income"] * (income_factor if income_factor.ndim == 0 else income_factor[loans["customer_index"]])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        loan_foir = np.where(loan_income > 0, (loans["existing_emi"] + loans["emi"]) / loan_income, 1.0)
+    loan_breached = loan_foir > rules["max_foir_refer"]
+
+    n_app = app["amount"].size
+    n_loans = loans["emi"].size
+    return {
+        "applications": n_app,
+        "approved": int(approved.sum()),
+        "approval_rate": round(float(approved.mean()), 4) if n_app else 0.0,
+        "foir_breaches": int(breached.sum()),
+        "foir_breach_rate": round(float(breached.mean()), 4) if n_app else 0.0,
+        "foir_p50": round(float(np.percentile(foir, 50)), 4) if n_app else None,
+        "foir_p90": round(float(np.percentile(foir, 90)), 4) if n_app else None,
+        "loans": n_loans,
+        "loan_foir_breaches": int(loan_breached.sum()),
+        "loan_foir_breach_rate": round(float(loan_breached.mean()), 4) if n_loans else 0.0,
+    }
+
+
+def _run_grid_chunk(scenarios: List[Dict[str, float]]) -> List[Dict[str, Any]]:
+    portfolio = _worker_portfolio
+    results = []
+    for scenario in scenarios:
+        factor = np.asarray(1 + scenario["income_shock_pct"] / 100.0)
+        results.append({**scenario, **_evaluate(portfolio, scenario["rate_shock_bps"], factor)})
+    return results
+
+
+def _run_monte_carlo_chunk(params: Dict[str, Any], seed: int, trials: int) -> Dict[str, List[float]]:
+    """Each trial draws a systemic rate shock plus a per-customer income shock"""
+    portfolio = _worker_portfolio
+    rng = np.random.default_rng(seed)
+    n_customers = portfolio["n_customers"]
+    out = {"rate_shock_bps": [], "approval_rate": [], "foir_breach_rate": [], "loan_foir_breach_rate": []}
+    for _ in range(trials):
+        rate_shock = rng.normal(params["rate_shock_mean_bps"], params["rate_shock_sd_bps"])
+        systemic = rng.normal(params["income_shock_mean_pct"], params["income_shock_sd_pct"])
+        idiosyncratic = rng.normal(0.0, params["income_idiosyncratic_sd_pct"], n_customers)
+        factor = np.maximum(0.0, 1 + (systemic + idiosyncratic) / 100.0)
+        result = _evaluate(portfolio, rate_shock, factor)
+        out["rate_shock_bps"].append(float(rate_shock))
+        out["approval_rate"].append(result["approval_rate"])
+        out["foir_breach_rate"].append(result["foir_breach_rate"])
+        out["loan_foir_breach_rate"].append(result["loan_foir_breach_rate"])
+    return out
+
+
+def _init_worker(portfolio: Dict[str, Any]):
+    global _worker_portfolio
+    _worker_portfolio = portfolio
+
+
+class StressTestService:
+    """
+    Portfolio stress tests for rate and income shocks.
+
+    Customers, offers and booked loans are loaded once into column arrays and the
+    same rules as EligibilityService are applied to the whole portfolio per scenario,
+    instead of calling evaluate_eligibility customer by customer.
+    """
+
+    def __init__(self, eligibility: EligibilityService,
+                 customers_file: str = CUSTOMERS_FILE,
+                 offers_file: str = OFFERS_FILE,
+                 loans_file: Optional[str] = None):
+        self.eligibility = eligibility
+        self.customers_file = customers_file
+        self.offers_file = offers_file
+        # Booked loans come from the state backend (STATE_BACKEND) unless a file is named
+        self.loans_file = loans_file
+        self.portfolio: Optional[Dict[str, Any]] = None
+
+    def _load_json(self, path: str) -> list:
+        if not os.path.exists(path):
+            return []
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except Exception:
+            return []
+
+    def get_rules(self) -> Dict[str, Any]:
+        """Eligibility thresholds, read from the same policy table as EligibilityService"""
+        get = self.eligibility.get_policy_value
+        return {
+            "min_credit_score": get("Credit Score Threshold", "min_credit_score_auto_approve", 720),
+            "max_foir_auto_approve": get("FOIR Limits", "max_foir_auto_approve", 0.5),
+            "max_foir_refer": get("FOIR Limits", "max_foir_refer", 0.6),
+            "min_monthly_income": get("Minimum Income", "min_monthly_income", 30000),
+            "max_tenure_months": get("Maximum Tenure", "max_tenure_months", 60),
+            "application_tenure_months": get("Pre-Approved Pricing", "limit_tenure_months", 36),
+        }
+
+    def load_portfolio(self) -> Dict[str, Any]:
+        """Build column arrays for customers' applications and booked loans"""
+        rules = self.get_rules()
+        customers = self._load_json(self.customers_file)
+        offers = {o.get("customer_id"): o for o in self._load_json(self.offers_file)}
+        index = {c.get("customer_id"): i for i, c in enumerate(customers)}
+
+        income = np.array([float(c.get("monthly_income") or 0) for c in customers])
+        existing_emi = np.array([float(c.get("existing_emi") or 0) for c in customers])
+        score = np.array([int(c.get("credit_score") or 0) for c in customers])
+
+        app_rows = [(i, offers[c["customer_id"]]) for i, c in enumerate(customers) if c.get("customer_id") in offers]
+        app_index = np.array([i for i, _ in app_rows], dtype=np.int64)
+        applications = {
+            "customer_index": app_index,
+            "income": income[app_index],
+            "existing_emi": existing_emi[app_index],
+            "credit_score": score[app_index],
+            "amount": np.array([float(o.get("max_amount") or 0) for _, o in app_rows]),
+            "rate": np.array([float(o.get("base_interest") or 0) for _, o in app_rows]),
+            "tenure": np.full(len(app_rows), rules["application_tenure_months"], dtype=np.int64),
+        }
+
+        # Only loans we can tie back to a customer's income can be stressed
+        booked = self._load_json(self.loans_file) if self.loans_file else get_state_backend().read("loans", [])
+        loan_rows = [l for l in booked if l.get("customer_id") in index]
+        loan_index = np.array([index[l["customer_id"]] for l in loan_rows], dtype=np.int64)
+        loan_emi = _emi(
+            np.array([float(l.get("approved_amount") or 0) for l in loan_rows]),
+            np.array([float(l.get("interest_rate") or 0) for l in loan_rows]),
+            np.array([int(l.get("tenure_months") or 0) for l in loan_rows], dtype=np.int64),
+        )
+        recorded_emi = np.array([float(l.get("emi") or 0) for l in loan_rows])
+        loans = {
+            "customer_index": loan_index,
+            "income": income[loan_index],
+            "existing_emi": existing_emi[loan_index],
+            "emi": np.where(recorded_emi > 0, recorded_emi, loan_emi),
+        }
+
+        self.portfolio = {
+            "rules": rules,
+            "n_customers": len(customers),
+            "applications": applications,
+            "loans": loans,
+        }
+        return self.portfolio
+
+    def _get_portfolio(self) -> Dict[str, Any]:
+        return self.portfolio if self.portfolio is not None else self.load_portfolio()
+
+    def run_grid(self, rate_shocks_bps: List[float], income_shocks_pct: List[float],
+                 workers: Optional[int] = None) -> Dict[str, Any]:
+        """Evaluate every (rate shock, income shock) combination"""
+        started = time.time()
+        portfolio = self._get_portfolio()
+        scenarios = [{"rate_shock_bps": r, "income_shock_pct": i} for r, i in product(rate_shocks_bps, income_shocks_pct)]
+
+        if len(scenarios) < PARALLEL_MIN_SCENARIOS or workers == 1:
+            _init_worker(portfolio)
+            results = _run_grid_chunk(scenarios)
+        else:
+            n_workers = workers or os.cpu_count() or 1
+            size = max(1, -(-len(scenarios) // (n_workers * 4)))
+            chunks = [scenarios[i:i + size] for i in range(0, len(scenarios), size)]
+            with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker, initargs=(portfolio,)) as pool:
+                results = [r for chunk in pool.map(_run_grid_chunk, chunks) for r in chunk]
+
+        return {
+            "mode": "grid",
+            "rules": portfolio["rules"],
+            "scenarios": results,
+            "elapsed_seconds": round(time.time() - started, 3),
+        }
+
+    def run_monte_carlo(self, trials: int,
+                        rate_shock_mean_bps: float = 0.0, rate_shock_sd_bps: float = 100.0,
+                        income_shock_mean_pct: float = 0.0, income_shock_sd_pct: float = 5.0,
+                        income_idiosyncratic_sd_pct: float = 5.0,
+                        seed: int = 42, workers: Optional[int] = None) -> Dict[str, Any]:
+        """Sample random shock scenarios and report the distribution of outcomes"""
+        started = time.time()
+        portfolio = self._get_portfolio()
+        params = {
+            "rate_shock_mean_bps": rate_shock_mean_bps,
+            "rate_shock_sd_bps": rate_shock_sd_bps,
+            "income_shock_mean_pct": income_shock_mean_pct,
+            "income_shock_sd_pct": income_shock_sd_pct,
+            "income_idiosyncratic_sd_pct": income_idiosyncratic_sd_pct,
+        }
+
+        if trials < PARALLEL_MIN_SCENARIOS or workers == 1:
+            _init_worker(portfolio)
+            parts = [_run_monte_carlo_chunk(params, seed, trials)]
+        else:
+            n_workers = workers or os.cpu_count() or 1
+            n_chunks = min(trials, n_workers * 4)
+            counts = [trials // n_chunks + (1 if i < trials % n_chunks else 0) for i in range(n_chunks)]
+            # Independent, reproducible streams per chunk
+            seeds = [int(s.generate_state(1)[0]) for s in np.random.SeedSequence(seed).spawn(n_chunks)]
+            with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker, initargs=(portfolio,)) as pool:
+                parts = list(pool.map(_run_monte_carlo_chunk, [params] * n_chunks, seeds, counts))
+
+        merged = {k: np.concatenate([np.asarray(p[k]) for p in parts]) for k in parts[0]}
+        return {
+            "mode": "monte_carlo",
+            "rules": portfolio["rules"],
+            "trials": trials,
+            "params": params,
+            "seed": seed,
+            "distributions": {k: _percentiles(v) for k, v in merged.items()},
+            "approval_rate_histogram": np.histogram(merged["approval_rate"], bins=10, range=(0, 1))[0].tolist(),
+            "elapsed_seconds": round(time.time() - started, 3),
+        }
+
+
+def main():
+    """CLI entry point, run from backend/: python -m services.stress_test_service grid|montecarlo"""
+    import argparse
+
+    def float_list(value: str) -> List[float]:
+        return [float(v) for v in value.split(",") if v.strip()]
+
+    def add_common(target: argparse.ArgumentParser, default):
+        target.add_argument("--workers", type=int, default=default, help="Worker processes for large scenario counts")
+        target.add_argument("--output", default=default, help="Write the JSON report here instead of stdout")
+
+    parser = argparse.ArgumentParser(description="Portfolio stress test for rate and income shocks")
+    add_common(parser, None)
+    # Also accepted after the mode name (montecarlo --workers 8); SUPPRESS keeps a value given before it
+    common = argparse.ArgumentParser(add_help=False)
+    add_common(common, argparse.SUPPRESS)
+    sub = parser.add_subparsers(dest="mode", required=True)
+
+    grid = sub.add_parser("grid", parents=[common], help="Evaluate a grid of deterministic shocks")
+    grid.add_argument("--rate-shocks", type=float_list, default=[0, 100, 200], help="Comma-separated bps, e.g. 0,100,200")
+    grid.add_argument("--income-shocks", type=float_list, default=[0, -5, -10], help="Comma-separated %%, e.g. 0,-5,-10")
+
+    mc = sub.add_parser("montecarlo", parents=[common], help="Sample random shock scenarios")
+    mc.add_argument("--trials", type=int, default=1000)
+    mc.add_argument("--rate-mean", type=float, default=0.0, help="Mean rate shock (bps)")
+    mc.add_argument("--rate-sd", type=float, default=100.0, help="Rate shock std dev (bps)")
+    mc.add_argument("--income-mean", type=float, default=0.0, help="Mean systemic income shock (%%)")
+    mc.add_argument("--income-sd", type=float, default=5.0, help="Systemic income shock std dev (%%)")
+    mc.add_argument("--income-idio-sd", type=float, default=5.0, help="Per-customer income shock std dev (%%)")
+    mc.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    service = StressTestService(EligibilityService())
+    if args.mode == "grid":
+        report = service.run_grid(args.rate_shocks, args.income_shocks, workers=args.workers)
+    else:
+        report = service.run_monte_carlo(
+            args.trials,
+            rate_shock_mean_bps=args.rate_mean, rate_shock_sd_bps=args.rate_sd,
+            income_shock_mean_pct=args.income_mean, income_shock_sd_pct=args.income_sd,
+            income_idiosyncratic_sd_pct=args.income_idio_sd,
+            seed=args.seed, workers=args.workers,
+        )
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+        print(f"[StressTest] Report written to {args.output} ({report['elapsed_seconds']}s)")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,85 @@
 const API_BASE_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000';
 
-export async function sendMessage(customerId, text, context) {
+function applyContextDelta(context, response) {
+  const next = { ...(context || {}), ...(response.context_delta || {}) };
+  (response.context_removed || []).forEach((key) => delete next[key]);
+  return next;
+}
+
+function newIdempotencyKey() {
+  return window.crypto?.randomUUID?.() || `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+}
+
+// With a sessionId only the patch (client-entered fields) is sent and the server replies with
+// what changed; response.context is always the full, merged context either way.
+// Each request carries an Idempotency-Key, so the one retry after a network error or 503
+// gets the original reply back if the first attempt had in fact gone through.
+export async function sendMessage(customerId, text, context, { sessionId = null, patch = null } = {}) {
   const endpoint = `${API_BASE_URL}/chat`;
-  const body = {
-    customer_id: customerId,
-    text: text,
-    context: context || null,
+  const post = async (body) => {
+    const idempotencyKey = newIdempotencyKey();
+    const send = () => fetch(endpoint, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        'Idempotency-Key': idempotencyKey,
+      },
+      body: JSON.stringify(body),
+    });
+    try {
+      const response = await send();
+      if (response.status !== 503) {
+        return response;
+      }
+    } catch (error) {
+      // Network error: the turn may or may not have run, the key makes the retry safe
+    }
+    await new Promise((resolve) => setTimeout(resolve, 1000));
+    return send();
   };
-  
-  const response = await fetch(endpoint, {
-    method: 'POST',
-    headers: {
-      'Content-Type': 'application/json',
-    },
-    body: JSON.stringify(body),
-  });
-  
+
+  let response = sessionId
+    ? await post({ customer_id: customerId, text: text, session_id: sessionId, context: patch })
+    : null;
+  // Unknown or expired session: send the whole context instead, which reopens it
+  if (!response || response.status === 404) {
+    response = await post({ customer_id: customerId, text: text, context: context || null });
+  }
+
   if (!response.ok) {
     throw new Error(`HTTP error! status: ${response.status}`);
   }
-  
-  return await response.json();
+
+  const data = await response.json();
+  if (!data.context) {
+    data.context = applyContextDelta(context, data);
+  }
+  return data;
+}
+
+function blobToBase64(blob) {
+  return new Promise((resolve, reject) => {
+    const reader = new FileReader();
+    reader.onloadend = () => resolve(String(reader.result).split(',')[1]);
+    reader.onerror = reject;
+    reader.readAsDataURL(blob);
+  });
+}
+
+// Download a sanction letter by id, polling while it is still rendering; resolves to base64
+export async function fetchSanctionPdf(letterId, { intervalMs = 1000, maxAttempts = 60 } = {}) {
+  const endpoint = `${API_BASE_URL}/sanctions/${encodeURIComponent(letterId)}`;
+  for (let attempt = 0; attempt < maxAttempts; attempt++) {
+    const response = await fetch(endpoint);
+    if (response.status === 200) {
+      return await blobToBase64(await response.blob());
+    }
+    if (response.status !== 202) {
+      throw new Error(`Sanction letter failed! status: ${response.status}`);
+    }
+    await new Promise((resolve) => setTimeout(resolve, intervalMs));
+  }
+  throw new Error('Timed out waiting for sanction letter');
 }
 
 export async function uploadSalarySlip(customerId, file) {
@@ -16,7 +16,7 @@ import {
   HelpOutline,
 } from '@mui/icons-material';
 import { FaRobot } from 'react-icons/fa';
-import { sendMessage, getCustomers, uploadSalarySlip, sendEmailOtp, verifyEmailOtp } from '../api';
+import { sendMessage, getCustomers, uploadSalarySlip, sendEmailOtp, verifyEmailOtp, fetchSanctionPdf } from '../api';
 
 // Simple markdown parser for formatting messages
 const formatMessage = (text) => {
@@ -593,8 +593,7 @@ const TitanChatbot = ({
 
     try {
       // Include user-entered name and mobile in context so backend uses it for sanction letter
-      const contextWithName = {
-        ...context,
+      const clientFields = {
         customer_name: customerName || context?.customer_name,
         customer_mobile: customerMobile || context?.customer_mobile,
         customer_email: customerEmail || context?.customer_email,
@@ -605,7 +604,12 @@ const TitanChatbot = ({
         customer_education: customerEducation || context?.customer_education,
         life_insurance: lifeInsuranceChoice ? (lifeInsuranceChoice === 'yes' ? 'Opted In' : 'Not opted') : (context?.life_insurance),
       };
-      const response = await sendMessage(activeCustomerId, userMessage, contextWithName);
+      const contextWithName = { ...context, ...clientFields };
+      // Once the server holds the session, only the client-entered fields travel with each turn
+      const response = await sendMessage(activeCustomerId, userMessage, contextWithName, {
+        sessionId: context?.session_id,
+        patch: clientFields,
+      });
 
       // Update context
       const newContext = response.context;
@@ -616,21 +620,26 @@ const TitanChatbot = ({
         onContextUpdate(newContext);
       }
 
-      // Add bot response with PDF if available
+      // Add bot response
       const botMessage = {
         from: 'bot',
         text: response.reply,
         timestamp: new Date(),
       };
       
-      // If PDF is included, attach it to the message
-      if (response.pdf_base64) {
-        botMessage.pdf = response.pdf_base64;
-        botMessage.pdfFilename = `sanction_letter_${activeCustomerId || 'C001'}.pdf`;
-      }
-      
       setMessages([...newMessages, botMessage]);
 
+      // Sanction letter was issued: attach the PDF to this message once it is downloaded
+      if (response.sanction_letter_id) {
+        fetchSanctionPdf(response.sanction_letter_id)
+          .then((pdf) => {
+            setMessages((prev) => prev.map((m) => (m === botMessage
+              ? { ...m, pdf, pdfFilename: `sanction_letter_${activeCustomerId || 'C001'}.pdf` }
+              : m)));
+          })
+          .catch((err) => console.error('Sanction letter download failed:', err));
+      }
+
       // Emit process events based on context
       if (newContext?.stage) {
         onProcessEvent({